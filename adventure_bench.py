@@ -0,0 +1,380 @@
+"""
+AI 世界冒险 - 无界面跑团回合压测工具
+
+用固定夹具创建一个临时世界，让 N 个模拟玩家并发地通过 api_run_action 执行回合
+（移动 / 对话 / 战斗 / 调查），LLM 使用桩实现（可配置延迟），输出：
+  - 回合延迟 p50 / p95 / p99
+  - 每回合数据库往返次数（cursor.execute 次数）
+  - 各阶段耗时：detect_movement / get_world_context_for_ai / CheckpointDetector / 持久化
+
+用法（需要已执行迁移的本地 Postgres，DATABASE_URL 指向测试库）：
+    python adventure_bench.py --players 8 --turns 20
+    python adventure_bench.py --players 8 --turns 20 --llm-latency 0.3 --json
+
+引擎改动前后各跑一次，对比输出即可判断改动是正收益还是负收益。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# 压测默认不触发后台预生成（会与回合争用连接池），--with-expansion 打开
+if "--with-expansion" not in sys.argv:
+    os.environ["WORLD_SPECULATIVE_BUDGET"] = "0"
+os.environ.setdefault("ADVENTURE_AI_PROVIDER", "stub")
+
+from flask import Flask, g, request
+from psycopg2.extras import RealDictCursor
+
+from database import DatabaseManager
+from blueprints.games.world_adventure import plugin as adventure
+from blueprints.games.world_adventure.ai_service import AdventureAIService
+from blueprints.games.world_adventure.game_engine import (
+    GameEngine, GridMovementSystem, CheckpointDetector, ActionAnalyzer, WorldStateTracker, PlayerProgressStore
+)
+
+
+# ========================================
+# 夹具：3 个地点、带连接的网格、NPC、主线任务
+# ========================================
+FIXTURE = {
+    "world_name": "压测世界",
+    "world_lore": "一片用于压测的边境之地，商道交汇，森林中暗藏危险。",
+    "locations": [
+        {
+            "key": "town", "name": "十字路镇", "type": "town", "danger": 1, "start": True,
+            "grids": [
+                {"key": "gate", "name": "镇口", "type": "entrance", "x": 0, "y": 0,
+                 "links": [("north", "square"), ("east", "forest_edge")]},
+                {"key": "square", "name": "中央广场", "type": "plaza", "x": 0, "y": 1,
+                 "links": [("south", "gate"), ("east", "tavern")], "npcs": ["marcus"]},
+                {"key": "tavern", "name": "酒馆内部", "type": "tavern", "x": 1, "y": 1,
+                 "links": [("west", "square")], "npcs": ["irene", "glen"],
+                 "objects": [{"name": "告示板", "description": "贴满了委托"}]},
+            ]
+        },
+        {
+            "key": "forest", "name": "暗影之森", "type": "wilderness", "danger": 5,
+            "grids": [
+                {"key": "forest_edge", "name": "森林边缘", "type": "path", "x": 2, "y": 0,
+                 "links": [("west", "gate"), ("north", "clearing")]},
+                {"key": "clearing", "name": "林间空地", "type": "wilderness", "x": 2, "y": 1,
+                 "links": [("south", "forest_edge"), ("east", "ruins_gate")], "npcs": ["bandit"]},
+            ]
+        },
+        {
+            "key": "ruins", "name": "古代遗迹", "type": "dungeon", "danger": 7,
+            "grids": [
+                {"key": "ruins_gate", "name": "遗迹大门", "type": "entrance", "x": 3, "y": 1,
+                 "links": [("west", "clearing"), ("north", "hall")]},
+                {"key": "hall", "name": "遗迹大厅", "type": "hall", "x": 3, "y": 2,
+                 "links": [("south", "ruins_gate")],
+                 "objects": [{"name": "石碑", "description": "刻着古老的文字"}]},
+            ]
+        },
+    ],
+    "npcs": [
+        {"key": "marcus", "name": "马库斯", "role": "商队主人", "location": "town"},
+        {"key": "irene", "name": "艾琳", "role": "酒馆老板", "location": "town"},
+        {"key": "glen", "name": "格伦", "role": "资深冒险者", "location": "town"},
+        {"key": "bandit", "name": "强盗头目", "role": "反派", "location": "forest"},
+    ],
+    "quest": {
+        "name": "失踪的商队",
+        "checkpoints": [
+            {"id": 1, "description": "与马库斯对话了解情况", "grid": "square", "action_type": "dialogue", "target_npc": "马库斯"},
+            {"id": 2, "description": "在酒馆打听消息", "grid": "tavern", "action_type": "investigation"},
+            {"id": 3, "description": "前往林间空地", "grid": "clearing", "action_type": "exploration"},
+            {"id": 4, "description": "击败强盗头目", "grid": "clearing", "action_type": "combat"},
+        ]
+    },
+}
+
+ACTIONS = {
+    "movement": ["向北走", "向南走", "向东走", "向西走", "前往中央广场", "前往酒馆内部", "去林间空地", "走到遗迹大门"],
+    "dialogue": ["与马库斯对话", "问艾琳最近的消息", "和格伦说话", "与强盗头目交谈"],
+    "combat": ["攻击强盗头目", "拔剑战斗", "攻击眼前的敌人"],
+    "investigation": ["调查周围", "检查告示板", "调查石碑", "研究地上的痕迹"],
+}
+
+
+def create_world():
+    """按夹具写入临时世界，返回 world_id"""
+    world_id = str(uuid.uuid4())
+    loc_ids = {l["key"]: str(uuid.uuid4()) for l in FIXTURE["locations"]}
+    grid_ids = {gr["key"]: str(uuid.uuid4()) for l in FIXTURE["locations"] for gr in l["grids"]}
+    grid_names = {gr["key"]: gr["name"] for l in FIXTURE["locations"] for gr in l["grids"]}
+    npc_ids = {n["key"]: str(uuid.uuid4()) for n in FIXTURE["npcs"]}
+
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO adventure_worlds (id, world_name, world_description, world_lore)
+                VALUES (%s, %s, %s, %s)
+            """, (world_id, FIXTURE["world_name"], "adventure_bench.py 临时数据", FIXTURE["world_lore"]))
+
+            for loc in FIXTURE["locations"]:
+                cur.execute("""
+                    INSERT INTO world_locations
+                    (id, world_id, location_name, location_type, description, danger_level, is_discovered)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (loc_ids[loc["key"]], world_id, loc["name"], loc["type"], loc["name"],
+                      loc["danger"], bool(loc.get("start"))))
+
+            for npc in FIXTURE["npcs"]:
+                cur.execute("""
+                    INSERT INTO world_npcs (id, world_id, npc_name, role, current_location_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (npc_ids[npc["key"]], world_id, npc["name"], npc["role"], loc_ids[npc["location"]]))
+
+            for loc in FIXTURE["locations"]:
+                for gr in loc["grids"]:
+                    cur.execute("""
+                        INSERT INTO location_grids
+                        (id, location_id, grid_name, grid_type, description, grid_position,
+                         connected_grids, npcs_present, interactive_objects)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (
+                        grid_ids[gr["key"]], loc_ids[loc["key"]], gr["name"], gr["type"], gr["name"],
+                        json.dumps({"x": gr["x"], "y": gr["y"]}),
+                        json.dumps([
+                            {"direction": d, "grid_id": grid_ids[t], "target_name": grid_names[t]}
+                            for d, t in gr["links"]
+                        ], ensure_ascii=False),
+                        json.dumps([{"npc_id": npc_ids[k], "activity": "", "position": ""}
+                                    for k in gr.get("npcs", [])]),
+                        json.dumps(gr.get("objects", []), ensure_ascii=False)
+                    ))
+
+            quest = FIXTURE["quest"]
+            cur.execute("""
+                INSERT INTO world_quests
+                (id, world_id, quest_name, quest_type, description, checkpoints, is_active)
+                VALUES (%s, %s, %s, 'main', %s, %s, TRUE)
+            """, (
+                str(uuid.uuid4()), world_id, quest["name"], quest["name"],
+                json.dumps([
+                    {"id": cp["id"], "description": cp["description"], "grid_id": grid_ids[cp["grid"]],
+                     "action_type": cp["action_type"], "target_npc": cp.get("target_npc", "")}
+                    for cp in quest["checkpoints"]
+                ], ensure_ascii=False)
+            ))
+            conn.commit()
+    return world_id
+
+
+def drop_world(world_id, character_ids):
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM adventure_worlds WHERE id = %s", (world_id,))
+            if character_ids:
+                cur.execute("DELETE FROM adventure_characters WHERE id = ANY(%s)", (list(character_ids),))
+            conn.commit()
+
+
+# ========================================
+# 计量：按线程统计数据库往返与阶段耗时
+# ========================================
+_tls = threading.local()
+
+
+def _counters():
+    if not hasattr(_tls, "stats"):
+        _tls.stats = {"queries": 0, "stages": defaultdict(float)}
+    return _tls.stats
+
+
+def _reset_counters():
+    _tls.stats = {"queries": 0, "stages": defaultdict(float)}
+
+
+def _install_instrumentation(llm_latency):
+    """包装 cursor.execute 与各阶段函数（仅作用于本进程）"""
+    original_execute = RealDictCursor.execute
+
+    def counting_execute(self, query, vars=None):
+        _counters()["queries"] += 1
+        return original_execute(self, query, vars)
+
+    RealDictCursor.execute = counting_execute
+
+    def timed(owner, name, stage):
+        original = getattr(owner, name)
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                _counters()["stages"][stage] += time.perf_counter() - started
+
+        # GameEngine.get_world_context_for_ai 是实例方法，其余为 staticmethod
+        setattr(owner, name, wrapper if owner is GameEngine else staticmethod(wrapper))
+
+    timed(GridMovementSystem, "detect_movement", "detect_movement")
+    timed(GameEngine, "get_world_context_for_ai", "get_world_context_for_ai")
+    timed(CheckpointDetector, "check_checkpoint_completion", "checkpoint_detector")
+    timed(GridMovementSystem, "execute_movement", "persistence")
+    timed(PlayerProgressStore, "complete_checkpoint", "persistence")
+    timed(ActionAnalyzer, "auto_update_world_state", "persistence")
+    timed(WorldStateTracker, "log_player_action", "persistence")
+
+    # LLM 桩：固定延迟 + 固定回复
+    def stub_dm_response(world_context, character, player_action, conversation_history=None, action_result=None):
+        if llm_latency > 0:
+            time.sleep(llm_latency)
+        return f"（桩 DM）你{player_action}，四周一片寂静。"
+
+    AdventureAIService.generate_dm_response_v2 = staticmethod(stub_dm_response)
+    timed(AdventureAIService, "generate_dm_response_v2", "llm")
+
+
+def _build_app():
+    """只挂载冒险蓝图的最小 Flask 应用，用请求头模拟不同玩家"""
+    app = Flask(__name__)
+    app.secret_key = "adventure-bench"
+
+    @app.before_request
+    def _bench_user():
+        g.user = {"id": request.headers.get("X-Bench-User")}
+
+    app.register_blueprint(adventure.get_blueprint(), url_prefix=f"/g/{adventure.SLUG}")
+    return app
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def run_player(app, world_id, index, turns, seed, character_ids, results):
+    rng = random.Random(seed + index)
+    user_id = f"bench-{uuid.uuid4().hex[:8]}"
+    headers = {"X-Bench-User": user_id}
+    client = app.test_client()
+    prefix = f"/g/{adventure.SLUG}"
+
+    resp = client.post(f"{prefix}/api/characters/create", headers=headers,
+                       json={"char_name": f"压测角色{index}", "ability_combat": 6})
+    character_id = resp.get_json()["character_id"]
+    character_ids.add(character_id)
+
+    resp = client.post(f"{prefix}/api/runs/start", headers=headers,
+                       json={"world_id": world_id, "character_id": character_id})
+    run_id = resp.get_json()["run_id"]
+
+    kinds = list(ACTIONS)
+    for turn in range(turns):
+        kind = kinds[turn % len(kinds)] if rng.random() < 0.5 else rng.choice(kinds)
+        action = rng.choice(ACTIONS[kind])
+
+        _reset_counters()
+        started = time.perf_counter()
+        resp = client.post(f"{prefix}/api/runs/{run_id}/action", headers=headers, json={"action": action})
+        elapsed = time.perf_counter() - started
+        stats = _counters()
+
+        body = resp.get_json() or {}
+        results.append({
+            "kind": kind,
+            "ok": bool(body.get("ok")),
+            "latency": elapsed,
+            "queries": stats["queries"],
+            "stages": dict(stats["stages"]),
+        })
+        if body.get("run_ended"):
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 世界冒险回合压测")
+    parser.add_argument("--players", type=int, default=8, help="并发模拟玩家数")
+    parser.add_argument("--turns", type=int, default=20, help="每个玩家的回合数（上限 50）")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="LLM 桩的模拟延迟（秒）")
+    parser.add_argument("--seed", type=int, default=42, help="随机行动种子")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--with-expansion", action="store_true", help="同时运行后台地点预生成")
+    args = parser.parse_args()
+
+    _install_instrumentation(args.llm_latency)
+    app = _build_app()
+    world_id = create_world()
+    character_ids = set()
+    results = []
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.players) as ex:
+            futures = [
+                ex.submit(run_player, app, world_id, i, min(args.turns, 50), args.seed, character_ids, results)
+                for i in range(args.players)
+            ]
+            for fut in futures:
+                fut.result()
+        wall = time.perf_counter() - started
+    finally:
+        drop_world(world_id, character_ids)
+
+    latencies = [r["latency"] for r in results]
+    queries = [r["queries"] for r in results]
+    stage_names = ["detect_movement", "get_world_context_for_ai", "checkpoint_detector", "persistence", "llm"]
+    stage_summary = {}
+    for name in stage_names:
+        values = [r["stages"].get(name, 0.0) for r in results]
+        stage_summary[name] = {
+            "mean_ms": round(statistics.mean(values) * 1000, 2) if values else 0.0,
+            "p95_ms": round(_percentile(values, 95) * 1000, 2),
+        }
+
+    report = {
+        "players": args.players,
+        "turns": len(results),
+        "failed_turns": sum(1 for r in results if not r["ok"]),
+        "wall_seconds": round(wall, 2),
+        "turns_per_second": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p95": round(_percentile(latencies, 95) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+        },
+        "db_round_trips_per_turn": {
+            "mean": round(statistics.mean(queries), 2) if queries else 0.0,
+            "max": max(queries) if queries else 0,
+        },
+        "stages": stage_summary,
+        "by_action": {
+            kind: round(statistics.mean([r["latency"] for r in results if r["kind"] == kind]) * 1000, 2)
+            for kind in ACTIONS if any(r["kind"] == kind for r in results)
+        },
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"玩家 {report['players']}，回合 {report['turns']}（失败 {report['failed_turns']}），"
+          f"耗时 {report['wall_seconds']}s，{report['turns_per_second']} 回合/秒")
+    lat = report["latency_ms"]
+    print(f"回合延迟  p50 {lat['p50']}ms  p95 {lat['p95']}ms  p99 {lat['p99']}ms")
+    rt = report["db_round_trips_per_turn"]
+    print(f"数据库往返/回合  平均 {rt['mean']}  最大 {rt['max']}")
+    print("阶段耗时（平均 / p95）：")
+    for name, v in stage_summary.items():
+        print(f"  {name:<26} {v['mean_ms']:>8}ms  {v['p95_ms']:>8}ms")
+    print("按行动类型平均延迟：")
+    for kind, ms in report["by_action"].items():
+        print(f"  {kind:<14} {ms}ms")
+
+
+if __name__ == "__main__":
+    main()
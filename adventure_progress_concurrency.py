@@ -0,0 +1,136 @@
+"""
+AI 世界冒险 - 玩家进度并发写入校验脚本
+
+在共享世界上模拟大量同时进行的回合，验证 PlayerProgressStore 的 jsonb 原子更新没有丢失写入：
+  - 多个玩家 × 多个线程同时完成不同检查点 → 每个检查点都必须出现在 quest_progress 中
+  - 多个线程同时与同一 NPC 互动 → interactions / reputation 必须等于调用次数累加
+
+用法（需要已执行迁移的 Postgres，DATABASE_URL 指向测试库）：
+    python adventure_progress_concurrency.py --players 4 --threads 16 --checkpoints 40
+
+脚本会创建临时世界 / NPC / 玩家进度，结束时删除。
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DatabaseManager
+from blueprints.games.world_adventure.game_engine import PlayerProgressStore, WorldStateTracker
+
+
+def _setup(players):
+    world_id = str(uuid.uuid4())
+    npc_id = str(uuid.uuid4())
+    quest_id = str(uuid.uuid4())
+    user_ids = [f"concurrency-{uuid.uuid4().hex[:8]}" for _ in range(players)]
+
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO adventure_worlds (id, world_name, world_description)
+                VALUES (%s, %s, %s)
+            """, (world_id, "并发测试世界", "adventure_progress_concurrency.py 临时数据"))
+            cur.execute("""
+                INSERT INTO world_npcs (id, world_id, npc_name, role)
+                VALUES (%s, %s, %s, %s)
+            """, (npc_id, world_id, "测试NPC", "tester"))
+            conn.commit()
+
+    for user_id in user_ids:
+        WorldStateTracker.get_or_create_player_progress(user_id, world_id)
+
+    return world_id, npc_id, quest_id, user_ids
+
+
+def _teardown(world_id):
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            # 进度 / NPC 随世界级联删除
+            cur.execute("DELETE FROM adventure_worlds WHERE id = %s", (world_id,))
+            conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="玩家进度 jsonb 并发写入校验")
+    parser.add_argument("--players", type=int, default=4, help="共享同一世界的玩家数")
+    parser.add_argument("--threads", type=int, default=16, help="并发线程数（不超过连接池大小时最有意义）")
+    parser.add_argument("--checkpoints", type=int, default=40, help="每个玩家完成的检查点数")
+    parser.add_argument("--interactions", type=int, default=40, help="每个玩家与 NPC 的互动次数")
+    args = parser.parse_args()
+
+    world_id, npc_id, quest_id, user_ids = _setup(args.players)
+    print(f"world={world_id} players={len(user_ids)} threads={args.threads}")
+
+    tasks = []
+    for user_id in user_ids:
+        for cp in range(1, args.checkpoints + 1):
+            tasks.append(("checkpoint", user_id, cp))
+            # 重复提交同一检查点，验证幂等
+            if cp % 5 == 0:
+                tasks.append(("checkpoint", user_id, cp))
+        for i in range(args.interactions):
+            tasks.append(("npc", user_id, 10 if i % 2 == 0 else -10))
+
+    def run(task):
+        kind, user_id, value = task
+        if kind == "checkpoint":
+            PlayerProgressStore.complete_checkpoint(user_id, world_id, quest_id, value)
+        else:
+            PlayerProgressStore.record_npc_interaction(user_id, world_id, npc_id, value)
+
+    failures = []
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as ex:
+            list(ex.map(run, tasks))
+        elapsed = time.perf_counter() - started
+        print(f"{len(tasks)} 次更新，耗时 {elapsed:.2f}s（{len(tasks) / elapsed:.0f} 次/秒）")
+
+        expected_rep = 50 + sum(10 if i % 2 == 0 else -10 for i in range(args.interactions))
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT user_id, quest_progress, npc_relationships, visited_npcs
+                    FROM player_world_progress WHERE world_id = %s
+                """, (world_id,))
+                rows = cur.fetchall()
+                cur.execute("SELECT interaction_count FROM world_npcs WHERE id = %s", (npc_id,))
+                npc_row = cur.fetchone()
+
+        for row in rows:
+            qp = row['quest_progress'] or {}
+            done = (qp.get(quest_id) or {}).get('checkpoints_completed', [])
+            if sorted(done) != list(range(1, args.checkpoints + 1)):
+                failures.append(f"{row['user_id']}: 检查点 {len(done)}/{args.checkpoints}（重复或丢失）")
+
+            rel = (row['npc_relationships'] or {}).get(npc_id, {})
+            if rel.get('interactions') != args.interactions:
+                failures.append(f"{row['user_id']}: interactions={rel.get('interactions')} 期望 {args.interactions}")
+            if rel.get('reputation') != expected_rep:
+                failures.append(f"{row['user_id']}: reputation={rel.get('reputation')} 期望 {expected_rep}")
+
+            visited = row['visited_npcs'] or []
+            if isinstance(visited, str):
+                visited = json.loads(visited)
+            if visited.count(npc_id) != 1:
+                failures.append(f"{row['user_id']}: visited_npcs 中 NPC 出现 {visited.count(npc_id)} 次")
+
+        expected_npc = args.interactions * len(user_ids)
+        if not npc_row or npc_row['interaction_count'] != expected_npc:
+            failures.append(f"world_npcs.interaction_count={npc_row and npc_row['interaction_count']} 期望 {expected_npc}")
+    finally:
+        _teardown(world_id)
+
+    if failures:
+        print("❌ 发现丢失/错误的更新：")
+        for f in failures:
+            print("  -", f)
+        sys.exit(1)
+    print("✅ 所有并发更新均已正确写入")
+
+
+if __name__ == "__main__":
+    main()
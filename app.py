@@ -12,17 +12,18 @@ import io
 import base64
 from typing import Optional, Union
 from urllib.parse import urlencode
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from psycopg2.extras import Json
 import re
 import time
 import logging
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
 from flask import Flask, render_template, request, redirect, url_for, session, g, flash, jsonify, make_response, send_file, abort
 import hashlib
 from config import Config
-from authlib.integrations.flask_client import OAuth
 from database import DatabaseManager, ChatDAO, SpreadDAO  # 这里如果用到 UserDAO 也只在函数内部 import 了，OK
 from services import (
     DateTimeService,
@@ -37,26 +38,43 @@ from services import (
     ShareService # ★ 必须补上
 )
 from plugins import register_plugins, plugin_metas
+import static_assets
+import session_store
+import image_assets
 
 
 # 初始化 Flask 应用
 app = Flask(__name__)
 app.config.from_object(Config)
+session_store.init_app(app)  # 服务端会话：Cookie 只带会话 ID
 register_plugins(app, base_pkg="blueprints.games")
+static_assets.init_app(app)  # 静态资源指纹地址 / 预压缩 / sw.js 预缓存列表
+image_assets.init_app(app)  # 模板函数 card_picture（牌面 WebP / AVIF srcset）
 
-# 初始化 OAuth
-oauth = OAuth(app)
+# 初始化 OAuth：首次走 Google 登录时才导入 authlib 并注册客户端，冷启动不付这部分导入开销
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
-google = oauth.register(
-    name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={
-        'scope': 'openid email profile'
-    }
-)
+_google_client = None
+_google_lock = threading.Lock()
+
+
+def get_google():
+    global _google_client
+    if _google_client is None:
+        with _google_lock:
+            if _google_client is None:
+                from authlib.integrations.flask_client import OAuth
+                oauth = OAuth(app)
+                _google_client = oauth.register(
+                    name='google',
+                    client_id=GOOGLE_CLIENT_ID,
+                    client_secret=GOOGLE_CLIENT_SECRET,
+                    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                    client_kwargs={
+                        'scope': 'openid email profile'
+                    }
+                )
+    return _google_client
 
 # 验证配置
 try:
@@ -69,31 +87,15 @@ except ValueError as e:
 # 统一日志格式（生产上可以写到 JSON）
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-# Playwright
-try:
-    from playwright.sync_api import sync_playwright
-except Exception:
-    sync_playwright = None
-
-
-# --- Playwright 启动器（全局单例） ---
-_browser = None
-_context = None
-
-def get_browser():
-    global _browser, _context
-    if _browser is not None and _context is not None:
-        return _browser, _context
-    if sync_playwright is None:
-        raise RuntimeError("Playwright 未安装，请 pip install playwright 并 playwright install chromium")
-    pw = sync_playwright().start()
-    _browser = pw.chromium.launch(headless=True, args=["--no-sandbox", "--disable-gpu"])
-    _context = _browser.new_context(
-        device_scale_factor=2,  # 高清出图
-        viewport={"width": 420, "height": 760},  # 初始视口，稍后以元素裁剪为准
-        java_script_enabled=True,
-    )
-    return _browser, _context
+# 分享图渲染：Playwright 渲染服务（专用线程 + 有界队列），不可用时用 Pillow 原生渲染
+# （Playwright 在渲染线程内导入，Pillow 渲染器在首次导出时导入）
+import share_renderer
+from share_renderer import get_renderer, RendererBusy, RendererUnavailable
+import share_export_cache
+import fortune_text_cache
+import draw_pipeline
+import reading_view
+import message_cursor
 
 _PROJECTS_CACHE = None
 def load_projects():
@@ -128,34 +130,12 @@ def play_template(slug):
         return render_template(p["template"])
     abort(404)
     
-def screenshot_share_card(url: str, selector: str = "#shareCardRoot") -> bytes:
-    """
-    打开 share_card 页面，等待稳定后，截图卡片根节点（selector），返回 PNG bytes
-    """
-    browser, context = get_browser()
-    page = context.new_page()
-    # 禁止动画可提高稳定性（如需）
-    page.add_style_tag(content="""
-      * { animation: none !important; transition: none !important; }
-    """)
-    # 打开页面
-    page.goto(url, wait_until="networkidle", timeout=20000)
-    # 等待字体与布局稳定
-    try:
-        page.wait_for_function("document.fonts && document.fonts.ready", timeout=8000)
-    except Exception:
-        pass
-    page.wait_for_timeout(300)  # 轻等
-
-    # 选择元素并截图（clip 元素）
-    el = page.query_selector(selector)
-    if not el:
-        # 兜底整页截图
-        png = page.screenshot(type="png", full_page=True)
-    else:
-        png = el.screenshot(type="png")
-    page.close()
-    return png
+def screenshot_share_card(url: str, selector: str = "#shareCard") -> bytes:
+    """
+    打开 share_card 页面，等待页面发出就绪信号后，截图卡片根节点（selector），返回 PNG bytes
+    渲染在 share_renderer 的专用线程中完成；队列满时抛出 RendererBusy
+    """
+    return get_renderer().render(url, selector=selector)
 
 
 def _rid():
@@ -171,13 +151,35 @@ def time_block(label, rid=None):
         t1 = time.perf_counter()
         app.logger.info(f"[{rid}] {label} took {(t1 - t0)*1000:.1f} ms")
 
+def ensure_session_id():
+    """
+    当前会话的访客 ID，没有时才生成（短ID，更可读）
+    只在真正需要访客身份的路由里调用：分享页、健康检查、爬虫等请求不会因此创建会话、
+    写 web_sessions 或下发 Cookie
+    """
+    sid = session.get('session_id')
+    if not sid:
+        sid = session['session_id'] = uuid.uuid4().hex[:8]
+        session.permanent = False  # 非持久化 session
+        user = g.get("user")
+        if isinstance(user, dict):
+            user["session_id"] = sid
+    return sid
+
+
 @app.before_request
 def before_request():
     """请求前处理"""
-    # 确保会话 ID
-    if 'session_id' not in session:
-        session['session_id'] = uuid.uuid4().hex[:8]  # 生成短ID，更可读
-        session.permanent = False  # 非持久化 session
+    # 不使用 g.user 的接口（静态资源、轮询等）不查用户，只带上 session 里的身份
+    if _skips_user_load(request.endpoint):
+        user_id = session.get('user_id')
+        g.user = {
+            "id": user_id,
+            "username": None,
+            "is_guest": not user_id,
+            "session_id": session.get('session_id')
+        }
+        return
 
     # 加载用户
     user = get_current_user()
@@ -187,7 +189,7 @@ def before_request():
             "id": None, 
             "username": None, 
             "is_guest": True,
-            "session_id": session['session_id']
+            "session_id": session.get('session_id')
         }
     g.user = user
 
@@ -224,14 +226,42 @@ def flatten_fortune_for_share(f):
     return f
 
 
+def _attach_fortune_text(fortune_data, user_ref=None):
+    """生成运势文案（文案缓存 / Dify），常用字段扁平到根上，再按 flatten_fortune_for_share 拍平"""
+    fortune_data = FortuneService.generate_fortune_text(fortune_data, user_ref)
+    fortune_text = fortune_data.get("fortune_text")
+    if isinstance(fortune_text, dict):
+        for k in ("summary", "dimension_advice", "do", "dont",
+                  "lucky_color", "lucky_number", "lucky_hour", "lucky_direction"):
+            if k in fortune_text and fortune_text[k]:
+                fortune_data[k] = fortune_text[k]
+    return flatten_fortune_for_share(fortune_data)
+
+
 def get_current_user():
-    """获取当前用户"""
+    """获取当前用户（UserService 进程内短 TTL 缓存）"""
     user_id = session.get('user_id')
     if not user_id:
         return None
-    
-    from database import UserDAO
-    return UserDAO.get_by_id(user_id)
+    return UserService.get_user(user_id)
+
+
+# 不需要加载 g.user 的 endpoint（其余接口用 @skip_user_load 标记）
+_SKIP_USER_ENDPOINTS = {"static", "service_worker"}
+
+
+def skip_user_load(f):
+    """标记不使用 g.user 的接口：before_request 不查询用户"""
+    f._skip_user_load = True
+    return f
+
+
+def _skips_user_load(endpoint):
+    if not endpoint:
+        return False
+    if endpoint in _SKIP_USER_ENDPOINTS or endpoint.endswith(".static"):
+        return True
+    return getattr(app.view_functions.get(endpoint), "_skip_user_load", False)
 
 
 def login_required(f):
@@ -257,12 +287,8 @@ def get_user_ref():
         # 已登录用户
         return str(user["id"])
 
-    # 访客
-    if "session_id" not in session:
-        session["session_id"] = uuid.uuid4().hex[:8]
-
-    # 生成合法 UUID
-    return str(uuid.uuid5(uuid.NAMESPACE_URL, session['session_id']))
+    # 访客：生成合法 UUID
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, ensure_session_id()))
 
 # app.py（顶部或实用函数区）
 def _resolve_ai_personality(data: dict) -> str:
@@ -1128,6 +1154,64 @@ def tasks_dispatch_daily_summaries():
     })
 
 
+@app.route("/tasks/precompute_fortunes", methods=["GET", "POST"])
+def tasks_precompute_fortunes():
+    """
+    夜间 / 清晨预计算：为指定日期（默认今天）已抽牌、还没有运势数据的登录用户批量计算运势，
+    让 /api/fortune/<date> 只需读库。
+    - 分数 / 星级 / 幸运元素走 FortuneService.calculate_fortunes_batch（NumPy 向量化，与单次计算逐位一致）
+    - text_budget 秒内顺带生成 Dify 文案；超出预算的只存数值，文案在首次访问 /api/fortune 时补齐
+    - 参数：date=YYYY-MM-DD、limit（默认 5000）、text_budget（秒，默认 0）、dry_run
+    """
+    if not _cron_authorized():
+        return jsonify({"error": "unauthorized"}), 401
+
+    date_arg = request.args.get("date")
+    try:
+        target_date = datetime.strptime(date_arg, "%Y-%m-%d").date() if date_arg else DateTimeService.get_beijing_date()
+        limit = max(1, min(int(request.args.get("limit", 5000)), 20000))
+        text_budget = max(0.0, float(request.args.get("text_budget", 0)))
+    except ValueError:
+        return jsonify({"error": "invalid date / limit / text_budget"}), 400
+    dry_run = request.args.get("dry_run", "0") in ("1", "true", "True")
+
+    from database import ReadingDAO
+    started = time.perf_counter()
+    rows = ReadingDAO.list_missing_fortune(target_date, limit)
+    if dry_run or not rows:
+        return jsonify({
+            "date": str(target_date), "total": len(rows), "saved": 0, "with_text": 0,
+            "dry_run": dry_run,
+        })
+
+    fortunes = FortuneService.calculate_fortunes_batch([
+        {"card_id": r["card_id"], "card_name": r["card_name"], "direction": r["direction"],
+         "date": target_date, "user_id": r["user_id"]}
+        for r in rows
+    ])
+    computed_ms = (time.perf_counter() - started) * 1000
+
+    results, with_text = [], 0
+    text_deadline = time.perf_counter() + text_budget
+    for r, fortune_data in zip(rows, fortunes):
+        if fortune_data is None:
+            continue
+        if time.perf_counter() < text_deadline:
+            fortune_data = _attach_fortune_text(fortune_data, r["user_id"])
+            with_text += 1
+        results.append((r["user_id"], fortune_data))
+
+    saved = ReadingDAO.update_fortunes_many(target_date, results)
+    return jsonify({
+        "date": str(target_date),
+        "total": len(rows),
+        "saved": saved,
+        "with_text": with_text,
+        "compute_ms": round(computed_ms, 1),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
 
 # ====== 日切工具 & DB 读写（仅本文件使用） ======
 from datetime import timedelta
@@ -1147,8 +1231,41 @@ def _day_key_date(cutoff_hour: int = 1):
         return (now - timedelta(days=1)).date()
     return now.date()
 
+# --- 当日 conversation_id 进程内缓存：(user_ref, scope, ai_personality, day_key) 一整天不变 ---
+# 命中时不再查 dify_conversations；id 未变化时不再写库；切日后旧日期的条目整体丢弃
+_DC_CACHE = OrderedDict()  # (user_ref, scope, ai_personality, day_key) -> conversation_id
+_DC_LOCK = threading.Lock()
+_DC_DAY = [None]  # 缓存当前对应的会话日
+
+
+def _dc_cache_get(key):
+    with _DC_LOCK:
+        cid = _DC_CACHE.get(key)
+        if cid is not None:
+            _DC_CACHE.move_to_end(key)
+        return cid
+
+
+def _dc_cache_put(key, conversation_id):
+    day_key = key[3]
+    with _DC_LOCK:
+        if _DC_DAY[0] != day_key:
+            # 跨过日界线：前一天的会话不会再被使用
+            for k in [k for k in _DC_CACHE if k[3] != day_key]:
+                _DC_CACHE.pop(k, None)
+            _DC_DAY[0] = day_key
+        _DC_CACHE[key] = conversation_id
+        _DC_CACHE.move_to_end(key)
+        while len(_DC_CACHE) > Config.DAILY_CID_CACHE_SIZE:
+            _DC_CACHE.popitem(last=False)
+
+
 def _dc_select(user_ref: str, scope: str, ai_personality: str, day_key_date):
-    """查当日 conversation_id（表：dify_conversations）"""
+    """查当日 conversation_id（先查进程内缓存，未命中再查表 dify_conversations）"""
+    key = (user_ref, scope, ai_personality, day_key_date)
+    cid = _dc_cache_get(key)
+    if cid:
+        return cid
     try:
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
@@ -1162,13 +1279,19 @@ def _dc_select(user_ref: str, scope: str, ai_personality: str, day_key_date):
                 if not row:
                     return None
                 # 兼容 RealDictCursor / tuple
-                return row.get("conversation_id") if isinstance(row, dict) else row[0]
+                cid = row.get("conversation_id") if isinstance(row, dict) else row[0]
     except Exception as e:
         print("[daily-cid] select error:", e)
         return None
+    if cid:
+        _dc_cache_put(key, cid)
+    return cid
 
 def _dc_upsert(user_ref: str, scope: str, ai_personality: str, day_key_date, conversation_id: str):
-    """写/改当日 conversation_id（有则覆盖，无则插入）"""
+    """写/改当日 conversation_id（有则覆盖，无则插入）；与缓存一致时跳过写库"""
+    key = (user_ref, scope, ai_personality, day_key_date)
+    if _dc_cache_get(key) == conversation_id:
+        return
     try:
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
@@ -1181,6 +1304,8 @@ def _dc_upsert(user_ref: str, scope: str, ai_personality: str, day_key_date, con
                 conn.commit()
     except Exception as e:
         print("[daily-cid] upsert error:", e)
+        return
+    _dc_cache_put(key, conversation_id)
 
 # ========== 引导聊天（guided）：每日固定会话 ==========
 @app.route("/api/guided/chat/send_daily", methods=["POST"])
@@ -1198,7 +1323,7 @@ def api_guided_chat_send_daily():
 
     # 频控（沿用原逻辑）
     can_chat, remaining = SpreadService.can_chat_today(
-        user.get('id'), session.get('session_id'), user.get('is_guest', True)
+        user.get('id'), ensure_session_id(), user.get('is_guest', True)
     )
     if not can_chat:
         limit_msg = random.choice(ChatService.LIMIT_MESSAGES)
@@ -1255,12 +1380,12 @@ def api_spread_chat_send_daily():
     reading = SpreadDAO.get_by_id(reading_id)
     if not reading:
         return jsonify({'error': '占卜记录不存在'}), 404
-    if reading['user_id'] != user.get('id') and reading['session_id'] != session.get('session_id'):
+    if reading['user_id'] != user.get('id') and reading['session_id'] != ensure_session_id():
         return jsonify({'error': '无权访问'}), 403
 
     # 频控
     can_chat, remaining = SpreadService.can_chat_today(
-        user.get('id'), session.get('session_id'), user.get('is_guest', True)
+        user.get('id'), ensure_session_id(), user.get('is_guest', True)
     )
     if not can_chat:
         limit_msg = random.choice(ChatService.LIMIT_MESSAGES)
@@ -1431,17 +1556,42 @@ def share_card():
     )
 
 
-# --- 修改 view_share，使其在 card/embed/export 场景渲染 share_card.html ---
-@app.route("/s/<share_id>")
-def view_share(share_id):
-    share_data = ShareService.get_share_data(share_id)
-    if not share_data:
-        flash("分享链接已失效", "info")
-        return redirect(url_for("tarot_index"))
+# --- 分享页渲染缓存：同一分享 + 同一 URL（模式参数）渲染结果不变，直接复用 HTML ---
+_SHARE_PAGE_CACHE = OrderedDict()  # (share_id, url) -> {html, etag, last_modified, expires_at, cached_at}
+_SHARE_PAGE_LOCK = threading.Lock()
+_PROCESS_STARTED_AT = datetime.utcnow().replace(microsecond=0)  # 部署后模板可能变化，Last-Modified 不早于进程启动
 
-    # 计数
-    ShareService.increment_view_count(share_id)
 
+def _share_page_cache_get(key):
+    now = time.monotonic()
+    with _SHARE_PAGE_LOCK:
+        entry = _SHARE_PAGE_CACHE.get(key)
+        if not entry:
+            return None
+        exp = entry["expires_at"]
+        if now - entry["cached_at"] > Config.SHARE_PAGE_CACHE_TTL or (
+                isinstance(exp, datetime) and exp < datetime.utcnow()):
+            _SHARE_PAGE_CACHE.pop(key, None)
+            return None
+        _SHARE_PAGE_CACHE.move_to_end(key)
+        return entry
+
+
+def _share_page_cache_put(key, entry):
+    with _SHARE_PAGE_LOCK:
+        _SHARE_PAGE_CACHE[key] = entry
+        _SHARE_PAGE_CACHE.move_to_end(key)
+        while len(_SHARE_PAGE_CACHE) > Config.SHARE_PAGE_CACHE_SIZE:
+            _SHARE_PAGE_CACHE.popitem(last=False)
+
+
+def _share_page_cache_invalidate(share_id):
+    with _SHARE_PAGE_LOCK:
+        for key in [k for k in _SHARE_PAGE_CACHE if k[0] == share_id]:
+            _SHARE_PAGE_CACHE.pop(key, None)
+
+
+def _render_share_page(share_data):
     use_card = request.args.get("card") == "1" or request.args.get("embed") == "1" or request.args.get("export") == "1"
     if use_card:
         # 统一走 share_card.html，传入 share_data，并注入 embed/export 标志
@@ -1452,9 +1602,90 @@ def view_share(share_id):
             embed=(request.args.get("embed") == "1"),
             export_mode=(request.args.get("export") == "1"),
         )
+    # 保留原有的查看页
+    return render_template("share_view.html", share_data=share_data, is_viewer=True)
+
+
+# --- 修改 view_share，使其在 card/embed/export 场景渲染 share_card.html ---
+@app.route("/s/<share_id>")
+def view_share(share_id):
+    # 模板里用到了 request.url，因此以完整 URL 区分模式
+    key = (share_id, request.url)
+    entry = _share_page_cache_get(key)
+    if entry is None:
+        share_data = ShareService.get_share_data(share_id)
+        if not share_data:
+            flash("分享链接已失效", "info")
+            return redirect(url_for("tarot_index"))
+
+        html = _render_share_page(share_data).encode("utf-8")
+        created = share_data.get("created_at")
+        if isinstance(created, datetime) and created.tzinfo is not None:
+            created = created.astimezone(timezone.utc).replace(tzinfo=None)
+        entry = {
+            "html": html,
+            "etag": hashlib.sha1(html).hexdigest(),
+            "last_modified": max(created, _PROCESS_STARTED_AT) if isinstance(created, datetime) else _PROCESS_STARTED_AT,
+            "expires_at": share_data.get("expires_at"),
+            "cached_at": time.monotonic(),
+        }
+        _share_page_cache_put(key, entry)
+
+    # 计数（进程内累加，批量写回）
+    ShareService.increment_view_count(share_id)
+
+    resp = make_response(entry["html"])
+    resp.mimetype = "text/html"
+    resp.set_etag(entry["etag"])
+    resp.last_modified = entry["last_modified"]
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 60
+    return resp.make_conditional(request)
+
+def _share_export_renderer() -> str:
+    """当前使用的分享图渲染器：playwright / pillow"""
+    mode = Config.SHARE_EXPORT_RENDERER
+    if mode in ("playwright", "pillow"):
+        return mode
+    return "playwright" if share_renderer.playwright_available() else "pillow"
+
+
+def _render_share_png_native(payload: dict, share_url: str = "") -> bytes:
+    """Pillow 原生渲染：与 share_card.html 使用同一份数据"""
+    from share_card_image import render_share_card
+    data = dict(payload)
+    data.setdefault("created_at", DateTimeService.get_beijing_date())
+    return render_share_card(data, flatten_fortune_for_share(payload.get("fortune")), share_url)
+
+
+def _export_share_png(url: str, payload: dict, share_url: str = "", renderer: Optional[str] = None):
+    """按 分享数据 + 渲染地址 + 渲染器 + 模板版本 取缓存，未命中时才渲染；返回 (png, etag)"""
+    renderer = renderer or _share_export_renderer()
+    key = share_export_cache.cache_key(payload, variant=f"{renderer}|{url}")
+    if renderer == "pillow":
+        render = lambda: _render_share_png_native(payload, share_url)
     else:
-        # 保留原有的查看页
-        return render_template("share_view.html", share_data=share_data, is_viewer=True)
+        render = lambda: screenshot_share_card(url)
+    try:
+        png, _ = share_export_cache.get_or_render(key, render)
+    except RendererUnavailable:
+        # auto 模式下浏览器启动失败，降级为原生渲染
+        if renderer == "pillow" or Config.SHARE_EXPORT_RENDERER != "auto":
+            raise
+        return _export_share_png(url, payload, share_url, renderer="pillow")
+    return png, key
+
+
+def _share_png_response(png: bytes, etag: str, download_name: Optional[str] = None):
+    """PNG 响应：强 ETag + 条件请求（GET/HEAD 命中 If-None-Match 时返回 304）"""
+    resp = send_file(io.BytesIO(png), mimetype="image/png",
+                     as_attachment=bool(download_name), download_name=download_name,
+                     etag=False, conditional=False)
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 86400
+    return resp.make_conditional(request)
+
 
 # --- 新增：后端导出接口 ---
 @app.route("/api/share/export", methods=["POST"])
@@ -1463,7 +1694,7 @@ def api_share_export():
     入参：
       - JSON: { "share_id": "xxxx" }
         或 { "payload": { user_name, reading, fortune, created_at } }
-    返回：image/png（二进制）
+    返回：image/png（二进制），同一数据重复导出直接读缓存
     """
     try:
         base = request.host_url.rstrip("/")
@@ -1472,23 +1703,98 @@ def api_share_export():
         # 优先 share_id
         share_id = data.get("share_id")
         if share_id:
+            share_data = ShareService.get_share_data(share_id)
+            if not share_data:
+                return jsonify({"success": False, "error": "分享链接已失效"}), 404
             # 用短链渲染 share_card.html（card=1 + export=1）
             url = f"{base}/s/{share_id}?card=1&export=1"
+            payload = share_data
+            share_url = f"{base}/s/{share_id}"
         else:
             # 无 share_id，用 payload 临时渲染（需要你在 share_card.html 能读到 window.name 或 query 注入）
             # 简单做法：把 payload 用 query 传；若过长可改 POST 到一个临时路由
             payload = data.get("payload") or {}
+            reading = payload.get("reading")
+            if isinstance(reading, dict):
+                # 牌面只允许站内 static/images/tarot（Chromium 与 Pillow 渲染时都会加载这张图）
+                from share_card_image import card_image_url
+                reading = dict(reading, **{k: card_image_url(reading[k]) for k in ("image", "card_image") if k in reading})
+                payload = dict(payload, reading=reading)
             q = urlencode({"payload": json.dumps(payload, ensure_ascii=False)}, safe=":/?&=")
             url = f"{base}/share/card?embed=1&export=1&{q}"
+            share_url = ""
 
-        png = screenshot_share_card(url)
-        return send_file(io.BytesIO(png), mimetype="image/png",
-                         as_attachment=True, download_name=f"ruoshui_tarot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png")
+        png, etag = _export_share_png(url, payload, share_url)
+        return _share_png_response(
+            png, etag, download_name=f"ruoshui_tarot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        )
+    except (RendererBusy, RendererUnavailable) as e:
+        resp = jsonify({"success": False, "error": str(e)})
+        resp.headers["Retry-After"] = "3"
+        return resp, 503
     except Exception as e:
         # 可补充 logging
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/s/<share_id>/card.png", methods=["GET"])
+@skip_user_load
+def share_card_png(share_id):
+    """分享图直链（供社交平台抓取 / 重复下载），内容不变时以 304 响应"""
+    share_data = ShareService.get_share_data(share_id)
+    if not share_data:
+        abort(404)
+    share_url = f"{request.host_url.rstrip('/')}/s/{share_id}"
+    try:
+        png, etag = _export_share_png(f"{share_url}?card=1&export=1", share_data, share_url)
+    except (RendererBusy, RendererUnavailable):
+        resp = make_response("", 503)
+        resp.headers["Retry-After"] = "3"
+        return resp
+    return _share_png_response(png, etag)
+
+
+@app.route("/internal/share/render-metrics", methods=["GET"])
+@skip_user_load
+def internal_share_render_metrics():
+    """分享图渲染指标：排队/渲染耗时分布、拒绝与超时次数"""
+    if not _internal_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return jsonify({
+        "ok": True,
+        "renderer": _share_export_renderer(),
+        "metrics": get_renderer().stats(),
+        "cache": share_export_cache.stats(),
+    })
+
+
+@app.route("/internal/fortune/text-cache-metrics", methods=["GET"])
+@skip_user_load
+def internal_fortune_text_cache_metrics():
+    """运势文案缓存指标：进程内 / 库表命中、未命中、命中率"""
+    if not _internal_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return jsonify({"ok": True, "metrics": fortune_text_cache.stats()})
+
+
+@app.route("/internal/draw-pipeline/metrics", methods=["GET"])
+@skip_user_load
+def internal_draw_pipeline_metrics():
+    """抽牌后台流水线指标：已提交 / 去重 / 就绪 / 等待 / 超时 / 失败"""
+    if not _internal_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return jsonify({"ok": True, "metrics": draw_pipeline.stats()})
+
+
+@app.route("/internal/reading-view/metrics", methods=["GET"])
+@skip_user_load
+def internal_reading_view_metrics():
+    """牌阵占卜记录视图缓存指标：命中 / 未命中 / 修补 / 失效 / 条数"""
+    if not _internal_authorized():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return jsonify({"ok": True, "metrics": reading_view.stats()})
+
+
 # =========================
 # API：创建分享
 # =========================
@@ -1539,6 +1845,7 @@ def api_create_share():
         "expires_at": datetime.utcnow() + timedelta(days=30),
     }
     ShareService.save_share_data(share_id, payload)
+    _share_page_cache_invalidate(share_id)
 
     return jsonify({
         "success": True,
@@ -1547,6 +1854,22 @@ def api_create_share():
         "qr_code": qr_code_dataurl  # 前端可 <img src="{{ qr_code }}">
     })
                          
+def _guided_reading_payload(view, reading_id, mask_until, trusted):
+    """get_reading 的主体（/api/guided/get_reading 与 /api/guided/batch 共用）"""
+    reading = view.reading
+    # 非内部调用可按 mask_until 遮住尚未揭示的卡
+    masked = not trusted and isinstance(mask_until, int)
+    cards = view.cards(mask_until if masked else None)
+    return {
+        "reading_id": reading_id,
+        "question": reading.get("question", ""),
+        "ai_personality": reading.get("ai_personality", ""),
+        "spread": view.spread_dict(),
+        "cards": cards,
+        "cards_layout": view.layout(cards, masked)
+    }
+
+
 @app.route("/api/guided/get_reading", methods=["POST"])
 def api_guided_get_reading():
     """
@@ -1625,7 +1948,6 @@ def api_guided_get_reading():
 
         # --- 鉴权：同用户 / 同会话 / 内部令牌 ---
         from services import SpreadService
-        from database import SpreadDAO
         from flask import session as flask_session
 
         def _is_internal_call(req):
@@ -1637,90 +1959,20 @@ def api_guided_get_reading():
         user = getattr(g, "user", None) or {}
         sess_id = flask_session.get("session_id")
 
-        reading = SpreadService.get_reading(reading_id)
-        if not reading:
+        # 记录、牌阵、归一化后的 cards 与 cards_layout 都来自 reading_view 缓存，
+        # Dify 轮询同一 reading 时不再重复查库 / 解析 JSON
+        view = reading_view.get(reading_id)
+        if not view:
             return jsonify({"success": False, "error": "not_found"}), 404
+        reading = view.reading
 
         same_user = (reading.get("user_id") and user.get("id") == reading.get("user_id"))
         same_session = (reading.get("session_id") and sess_id == reading.get("session_id"))
         if not (same_user or same_session or trusted):
             return jsonify({"success": False, "error": "forbidden"}), 403
 
-        # --- 取 spread/positions ---
-        spread = SpreadDAO.get_spread_by_id(reading["spread_id"]) or {}
-        positions = spread.get("positions") or []
-        # 兼容字符串/对象
-        if isinstance(positions, str):
-            try:
-                import json as _json
-                positions = _json.loads(positions) or []
-            except Exception:
-                positions = []
-        elif isinstance(positions, dict):
-            try:
-                positions = [positions[str(i)] for i in sorted(map(int, positions.keys()))]
-            except Exception:
-                positions = []
-
-        # --- 归一化 cards 并拼位置信息 ---
-        cards_raw = reading.get("cards") or []
-        if isinstance(cards_raw, str):
-            try:
-                import json as _json
-                cards_raw = _json.loads(cards_raw) or []
-            except Exception:
-                cards_raw = []
-
-        cards = []
-        for i, c in enumerate(cards_raw):
-            pos = positions[i] if i < len(positions) else {}
-            item = {
-                "index": i,
-                "position_name": pos.get("name", f"位置{i+1}"),
-                "position_meaning": pos.get("meaning", ""),
-                "card_id": c.get("card_id"),
-                "card_name": c.get("card_name", ""),
-                "direction": c.get("direction", ""),
-                "image": c.get("image", "")
-            }
-            cards.append(item)
-
-        # --- 非内部调用可按 mask_until 遮住尚未揭示的卡 ---
-        if not trusted and isinstance(mask_until, int):
-            for it in cards:
-                if it["index"] >= mask_until:
-                    it.update({
-                        "card_name": "",
-                        "direction": "",
-                        "image": "",
-                        "masked": True
-                    })
-
-        # --- cards_layout 文本 ---
-        lines = []
-        for i, c in enumerate(cards, 1):
-            pos = c["position_name"]
-            mean = c["position_meaning"]
-            cn = c["card_name"] or "（未揭示）"
-            dr = c["direction"] or ""
-            lines.append(f"{i}. {pos}（{mean}）\n   {cn}{f'（{dr}）' if dr else ''}")
-        cards_layout = "\n".join(lines)
-
-        resp = {
-            "success": True,
-            "reading_id": reading_id,
-            "question": reading.get("question", ""),
-            "ai_personality": reading.get("ai_personality", ""),
-            "spread": {
-                "id": spread.get("id") or reading.get("spread_id"),
-                "name": spread.get("name", ""),
-                "description": spread.get("description", ""),
-                "card_count": int(spread.get("card_count") or len(cards)),
-                "positions": positions
-            },
-            "cards": cards,
-            "cards_layout": cards_layout
-        }
+        resp = {"success": True}
+        resp.update(_guided_reading_payload(view, reading_id, mask_until, trusted))
 
         if include_messages:
             msgs = SpreadService.get_chat_messages(reading_id)
@@ -1803,7 +2055,7 @@ def spread_chat2():
     user = g.user or {}
     can_chat, remaining = SpreadService.can_chat_today(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     # 可把 URL 参数透传给模板，便于调试（模板里也用到了）
@@ -1839,7 +2091,7 @@ def api_guided_chat_send():
         return jsonify({'error': '消息长度不合法'}), 400
 
     can_chat, remaining = SpreadService.can_chat_today(
-        user.get('id'), session.get('session_id'), user.get('is_guest', True)
+        user.get('id'), ensure_session_id(), user.get('is_guest', True)
     )
     if not can_chat:
         limit_msg = random.choice(ChatService.LIMIT_MESSAGES)
@@ -1897,7 +2149,7 @@ def api_guided_create_reading():
 
     # 1) 每日次数校验（与 /api/spread/draw 一致）
     can_divine, _ = SpreadService.can_divine_today(
-        user.get('id'), session.get('session_id'), user.get('is_guest', True)
+        user.get('id'), ensure_session_id(), user.get('is_guest', True)
     )
     if not can_divine:
         return jsonify({'error': '今日占卜次数已用完'}), 429
@@ -1926,7 +2178,7 @@ def api_guided_create_reading():
         # 4) 入库创建（仅抽牌+保存，不触发 LLM）
         reading = SpreadService.create_guided_reading(
             user_ref=user_ref,
-            session_id=session.get('session_id'),
+            session_id=ensure_session_id(),
             spread_id=spread_id,
             question=question,
             ai_personality=ai_personality
@@ -1972,6 +2224,37 @@ def _json_ok(**data):
     payload.update(data)
     return jsonify(payload), 200
 
+def _guided_index0(reading, idx_in):
+    """
+    把揭示序号归一化为 0 基（同时支持 0/1 基输入）
+    返回 (idx0, card_count)；无法判定或越界时 idx0 为 None
+    """
+    def _int_or_0(v):
+        try:
+            return int(v or 0)
+        except Exception:
+            return 0
+
+    # 多源推断 card_count（按你项目的真实结构调整优先级）
+    # 1) reading.card_count
+    card_count = _int_or_0(reading.get("card_count"))
+    # 2) reading.spread.card_count
+    if not card_count and isinstance(reading.get("spread"), dict):
+        card_count = _int_or_0(reading["spread"].get("card_count"))
+    # 3) reading.positions（如果存了位置数组）
+    if not card_count and isinstance(reading.get("positions"), list):
+        card_count = len(reading["positions"])
+    # 4) reading.cards（仅当它代表牌阵位数）
+    if not card_count and isinstance(reading.get("cards"), list):
+        card_count = len(reading["cards"])
+
+    # 根据 card_count 认定 0/1 基
+    if card_count > 0 and 0 <= idx_in < card_count:
+        return idx_in, card_count            # 0-based
+    if card_count > 0 and 1 <= idx_in <= card_count:
+        return idx_in - 1, card_count        # 1-based -> 0-based
+    return None, card_count
+
 # ===== 路由：逐张揭示卡牌 =====
 @app.route("/api/guided/reveal_card", methods=["POST"])
 def api_guided_reveal_card():
@@ -2037,32 +2320,8 @@ def api_guided_reveal_card():
         return _json_error(403, "forbidden", "无权访问此占卜记录")
 
     # ====== 归一化 index：同时支持 0/1 基输入 ======
-    # 多源推断 card_count（按你项目的真实结构调整优先级）
-    def _int_or_0(v):
-        try:
-            return int(v or 0)
-        except Exception:
-            return 0
-
-    card_count = 0
-    # 1) reading.card_count
-    card_count = _int_or_0(reading.get("card_count"))
-    # 2) reading.spread.card_count
-    if not card_count and isinstance(reading.get("spread"), dict):
-        card_count = _int_or_0(reading["spread"].get("card_count"))
-    # 3) reading.positions（如果存了位置数组）
-    if not card_count and isinstance(reading.get("positions"), list):
-        card_count = len(reading["positions"])
-    # 4) reading.cards（仅当它代表牌阵位数）
-    if not card_count and isinstance(reading.get("cards"), list):
-        card_count = len(reading["cards"])
-
-    # 根据 card_count 认定 0/1 基
-    if card_count > 0 and 0 <= idx_in < card_count:
-        idx0 = idx_in                      # 0-based
-    elif card_count > 0 and 1 <= idx_in <= card_count:
-        idx0 = idx_in - 1                  # 1-based -> 0-based
-    else:
+    idx0, card_count = _guided_index0(reading, idx_in)
+    if idx0 is None:
         # 无法判定或越界
         rng0 = f"[0,{max(0, card_count-1)}]" if card_count else "[0..N-1]"
         rng1 = f"[1,{max(1, card_count)}]" if card_count else "[1..N]"
@@ -2090,6 +2349,128 @@ def api_guided_reveal_card():
         return _json_error(500, "server_error", "揭示失败，请稍后重试")
 
 
+# ===== 路由：引导流程批量操作 =====
+# 一个步骤里的 reveal / get_reading / messages / status 合并成一次请求：
+# 只做一次会话加载、一次鉴权、一次 reading 读取（reading_view 缓存），按顺序执行
+GUIDED_BATCH_MAX_OPS = int(os.getenv("GUIDED_BATCH_MAX_OPS", "16"))
+
+
+@app.route("/api/guided/batch", methods=["POST"])
+def api_guided_batch():
+    """
+    参数(JSON)：
+      - reading_id: str
+      - ops: [
+          {"op": "reveal", "index": int},                    # 同 /api/guided/reveal_card
+          {"op": "get_reading", "mask_until": int?},         # 同 /api/guided/get_reading（不含 messages）
+          {"op": "messages", "cursor": str?, "limit": int?}, # 增量消息（keyset 游标），返回 next_cursor
+          {"op": "status"}                                   # 同 /api/spread/status
+        ]
+    权限：同一用户 或 同一 session 或 携带有效 X-Internal-Token（整批只校验一次）
+    返回(JSON)：
+      - success, reading_id
+      - results: 与 ops 一一对应，每项 {op, success, ...} 或 {op, success: false, error, message}
+        单个操作失败不影响后续操作
+    """
+    data = request.get_json(silent=True) or {}
+    reading_id = (data.get("reading_id") or "").strip()
+    ops = data.get("ops")
+
+    if not reading_id or not isinstance(ops, list) or not ops:
+        return _json_error(400, "missing_params", "reading_id 和 ops 为必填")
+    if len(ops) > GUIDED_BATCH_MAX_OPS:
+        return _json_error(400, "too_many_ops", f"ops 最多 {GUIDED_BATCH_MAX_OPS} 个", got=len(ops))
+
+    trusted = _is_internal_call(request)
+    user = getattr(g, "user", None) or {}
+    sess_id = session.get("session_id")
+
+    try:
+        view = reading_view.get(reading_id)
+    except Exception as e:
+        app.logger.exception("guided batch load failed: %s", e)
+        return _json_error(500, "server_error", "读取占卜记录失败")
+    if not view:
+        return _json_error(404, "not_found", "占卜记录不存在", reading_id=reading_id)
+
+    reading = view.reading
+    same_user = (reading.get("user_id") and user.get("id") == reading.get("user_id"))
+    same_session = (reading.get("session_id") and sess_id == reading.get("session_id"))
+    if not (same_user or same_session or trusted):
+        return _json_error(403, "forbidden", "无权访问此占卜记录")
+
+    def _fail(name, error, message, **details):
+        item = {"op": name, "success": False, "error": error, "message": message}
+        if details:
+            item["details"] = details
+        return item
+
+    results = []
+    for op in ops:
+        op = op if isinstance(op, dict) else {}
+        name = op.get("op")
+        try:
+            if name == "reveal":
+                try:
+                    idx_in = int(op.get("index"))
+                except (TypeError, ValueError):
+                    results.append(_fail(name, "bad_index", "index 必须是整数", got=op.get("index")))
+                    continue
+                idx0, card_count = _guided_index0(reading, idx_in)
+                if idx0 is None:
+                    results.append(_fail(name, "out_of_range", f"index={idx_in} 越界",
+                                         index_in=idx_in, card_count=card_count))
+                    continue
+                card = SpreadService.reveal_card(reading_id, idx0)
+                results.append({"op": name, "success": True, "index": idx0, "index1": idx0 + 1, "card": card})
+
+            elif name == "get_reading":
+                mask_until = op.get("mask_until")
+                try:
+                    mask_until = int(mask_until) if mask_until is not None else None
+                except (TypeError, ValueError):
+                    mask_until = None
+                item = {"op": name, "success": True}
+                item.update(_guided_reading_payload(view, reading_id, mask_until, trusted))
+                results.append(item)
+
+            elif name == "messages":
+                try:
+                    limit = min(500, max(1, int(op.get("limit") or 200)))
+                except (TypeError, ValueError):
+                    limit = 200
+                try:
+                    page = SpreadService.get_chat_messages_since(reading_id, op.get("cursor"), limit)
+                except ValueError:
+                    results.append(_fail(name, "bad_cursor", "cursor 无效"))
+                    continue
+                item = {"op": name, "success": True}
+                item.update(page)
+                results.append(item)
+
+            elif name == "status":
+                row = SpreadDAO.get_status(reading_id) or {}
+                results.append({
+                    "op": name,
+                    "success": True,
+                    "status": row.get("status", "init"),
+                    "has_initial": bool(row.get("has_initial")),
+                    "message_count": SpreadDAO.count_messages(reading_id),
+                    "initial_text": row.get("initial_interpretation")
+                })
+
+            else:
+                results.append(_fail(name, "unknown_op", "不支持的操作"))
+
+        except IndexError:
+            results.append(_fail(name, "out_of_range", "索引越界或当前索引不可揭示"))
+        except Exception as e:
+            app.logger.exception("guided batch op=%s error: %s", name, e)
+            results.append(_fail(name, "server_error", "操作失败，请稍后重试"))
+
+    return _json_ok(reading_id=reading_id, results=results)
+
+
 # app.py — 新增：引导模式完成后触发首解读
 @app.route("/api/guided/finalize", methods=["POST"])
 def api_guided_finalize():
@@ -2263,7 +2644,7 @@ def spread_page():
     # 检查占卜次数限制
     can_divine, remaining = SpreadService.can_divine_today(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     
@@ -2288,14 +2669,14 @@ def spread_chat(reading_id):
         return redirect(url_for('spread'))
     
     # 验证权限
-    if reading['user_id'] != user.get('id') and reading['session_id'] != session.get('session_id'):
+    if reading['user_id'] != user.get('id') and reading['session_id'] != ensure_session_id():
         flash("无权访问此占卜记录", "error")
         return redirect(url_for('spread'))
     
     # 检查对话限制
     can_chat, remaining_chats = SpreadService.can_chat_today(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     
@@ -2345,7 +2726,7 @@ def api_draw_spread():
     with time_block("check_quota", rid):
         can_divine, remaining = SpreadService.can_divine_today(
             user.get('id'),
-            session.get('session_id'),
+            ensure_session_id(),
             user.get('is_guest', True)
         )
 
@@ -2358,7 +2739,7 @@ def api_draw_spread():
         # ★ 仅建单，立刻返回
         reading = SpreadService.create_reading_fast(
             user_ref=user_ref,
-            session_id=session.get('session_id'),
+            session_id=ensure_session_id(),
             spread_id=spread_id,
             question=question,
             ai_personality=ai_personality
@@ -2393,13 +2774,13 @@ def api_spread_chat_send():
     if not reading:
         return jsonify({'error': '占卜记录不存在'}), 404
     
-    if reading['user_id'] != user.get('id') and reading['session_id'] != session.get('session_id'):
+    if reading['user_id'] != user.get('id') and reading['session_id'] != ensure_session_id():
         return jsonify({'error': '无权访问'}), 403
     
     # 检查对话限制
     can_chat, remaining = SpreadService.can_chat_today(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     
@@ -2483,7 +2864,7 @@ def guide_spread():
     # 检查占卜次数限制
     can_divine, remaining = SpreadService.can_divine_today(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     
@@ -2498,6 +2879,7 @@ def guide_spread():
     )
 
 @app.route("/api/spread/status/<reading_id>")
+@skip_user_load
 def api_spread_status(reading_id):
     row = SpreadDAO.get_status(reading_id)
     if not row:
@@ -2514,6 +2896,40 @@ def api_spread_status(reading_id):
 
 
 
+@app.route("/api/spread/messages/<reading_id>")
+def api_spread_messages(reading_id):
+    """
+    牌阵对话历史（keyset 游标分页）
+      ?after=<cursor>   只取该游标之后的新消息（空游标从头开始）
+      ?before=<cursor>  向前翻页；before 为空字符串时取最新一页
+      ?limit=<n>        每页条数（默认 50，最多 200）
+    返回 messages / next_cursor / prev_cursor / has_more
+    """
+    view = reading_view.get(reading_id)
+    if not view:
+        return jsonify({'error': 'not found'}), 404
+    reading = view.reading
+    user = g.user or {}
+    if not (_is_internal_call(request)
+            or (reading.get('user_id') and reading.get('user_id') == user.get('id'))
+            or (reading.get('session_id') and reading.get('session_id') == ensure_session_id())):
+        return jsonify({'error': 'forbidden'}), 403
+
+    limit = request.args.get('limit', 50, type=int) or 50
+    limit = min(200, max(1, limit))
+    try:
+        if 'before' in request.args:
+            cursor = request.args.get('before')
+            rows, has_more = SpreadDAO.get_messages_before(reading_id, cursor, limit)
+        else:
+            cursor = request.args.get('after')
+            rows, has_more = SpreadDAO.get_messages_since(reading_id, cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'bad cursor'}), 400
+
+    return jsonify(message_cursor.payload(rows, has_more, cursor))
+
+
 # 5. 可选：获取今日占卜记录
 @app.route("/api/spread/today")
 def api_spread_today():
@@ -2524,7 +2940,7 @@ def api_spread_today():
     if not user["is_guest"]:
         readings = SpreadDAO.get_user_readings_by_date(user["id"], today)
     else:
-        readings = SpreadDAO.get_session_readings_by_date(session.get('session_id'), today)
+        readings = SpreadDAO.get_session_readings_by_date(ensure_session_id(), today)
     
     return jsonify({
         'readings': readings,
@@ -2558,7 +2974,7 @@ def tarot_index():
                     fortune_data = FortuneService.calculate_fortune(
                         reading['card_id'], reading['name'], reading['direction'], today, user['id']
                     )
-                    fortune_data = FortuneService.generate_fortune_text(fortune_data)
+                    fortune_data = FortuneService.generate_fortune_text(fortune_data, user['id'])
                     FortuneService.save_fortune(user['id'], today, fortune_data)
     else:
         guest_reading = SessionService.get_guest_reading(session, today)
@@ -2575,7 +2991,7 @@ def tarot_index():
                 fortune_data = FortuneService.calculate_fortune(
                     guest_reading['card_id'], guest_reading['name'], guest_reading['direction'], today
                 )
-                fortune_data = FortuneService.generate_fortune_text(fortune_data)
+                fortune_data = FortuneService.generate_fortune_text(fortune_data, ensure_session_id())
                 session['fortune_data'] = {'date': str(today), 'data': fortune_data}
                 session.modified = True
     
@@ -2607,7 +3023,7 @@ def chat_page():
     # 检查对话限制
     can_chat, remaining_chats = ChatService.can_start_chat(
         user.get('id'), 
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
     
@@ -2619,7 +3035,7 @@ def chat_page():
     try:
         chat_session = ChatService.create_or_get_session(
             user.get('id'),
-            session.get('session_id'),
+            ensure_session_id(),
             reading,
             today
         )
@@ -2676,7 +3092,7 @@ def init_chat():
     try:
         chat_session = ChatService.create_or_get_session(
             user.get('id'),
-            session.get('session_id'),
+            ensure_session_id(),
             reading,
             today,
             ai_personality=ai_personality  # 新增参数
@@ -2699,6 +3115,39 @@ def init_chat():
         print(f"Init chat error: {e}")
         return jsonify({'error': '初始化失败'}), 500
 
+@app.route("/api/chat/messages")
+def api_chat_messages():
+    """
+    每日一牌对话历史（keyset 游标分页）
+      ?session_id=<chat_sessions.id>  必填
+      ?after=<cursor> / ?before=<cursor> / ?limit=<n>，语义同 /api/spread/messages
+    """
+    user = g.user
+    chat_session_id = request.args.get('session_id')
+    if not chat_session_id:
+        return jsonify({'error': 'missing session_id'}), 400
+
+    chat_session = ChatDAO.get_session_by_id(chat_session_id)
+    if not chat_session:
+        return jsonify({'error': 'not found'}), 404
+    if not ((chat_session.get('user_id') and chat_session.get('user_id') == user.get('id'))
+            or (chat_session.get('session_id') and chat_session.get('session_id') == ensure_session_id())):
+        return jsonify({'error': 'forbidden'}), 403
+
+    limit = request.args.get('limit', 50, type=int) or 50
+    limit = min(200, max(1, limit))
+    try:
+        if 'before' in request.args:
+            cursor = request.args.get('before')
+            rows, has_more = ChatDAO.get_messages_before(chat_session['id'], cursor, limit)
+        else:
+            cursor = request.args.get('after')
+            rows, has_more = ChatDAO.get_messages_since(chat_session['id'], cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'bad cursor'}), 400
+
+    return jsonify(message_cursor.payload(rows, has_more, cursor))
+
 @app.route("/api/chat/send", methods=["POST"])
 def send_chat_message():
     user = g.user
@@ -2712,7 +3161,7 @@ def send_chat_message():
 
     can_chat, remaining = ChatService.can_start_chat(
         user.get('id'),
-        session.get('session_id'),
+        ensure_session_id(),
         user.get('is_guest', True)
     )
 
@@ -2809,6 +3258,8 @@ def register():
 def logout():
     """退出登录"""
     username = g.user.get('username', '访客')
+    if session.get('user_id'):
+        UserService.invalidate_user(session['user_id'])
     session.clear()
     flash(f"再见，{username}！期待您下次光临", "info")
     return redirect(url_for('index'))
@@ -2819,7 +3270,7 @@ def logout():
 def google_login():
     """重定向到 Google 登录"""
     redirect_uri = url_for('google_callback', _external=True)
-    return google.authorize_redirect(redirect_uri)
+    return get_google().authorize_redirect(redirect_uri)
 
 @app.route("/auth/google/callback")
 def google_callback():
@@ -2829,7 +3280,7 @@ def google_callback():
         from werkzeug.security import generate_password_hash
 
         # 获取访问令牌
-        token = google.authorize_access_token()
+        token = get_google().authorize_access_token()
         # 获取用户信息
         user_info = token.get('userinfo')
 
@@ -2863,6 +3314,7 @@ def google_callback():
                         (user['id'],)
                     )
                     conn.commit()
+                    UserService.invalidate_user(user['id'])
                     flash(f"欢迎回来，{user.get('username', name)}！", "success")
                     return redirect(url_for('index'))
 
@@ -2945,6 +3397,7 @@ def link_account():
                         (pending_oauth['existing_user_id'],)
                     )
                     conn.commit()
+                    UserService.invalidate_user(pending_oauth['existing_user_id'])
 
                     flash(f"已成功关联 Google 账号到 {pending_oauth['existing_username']}", "success")
                     return redirect(url_for('index'))
@@ -3008,11 +3461,58 @@ def draw_card():
         TarotService.save_reading(user["id"], today, card["id"], direction)
     else:
         SessionService.save_guest_reading(session, card, direction, today)
+
+    # 后台并发生成今日解读与运势，/result 与 /api/fortune 直接取结果或有界等待
+    _start_draw_pipeline(user, today, card, direction)
     
     flash(f"您抽到了{card['name']}（{direction}）", "success")
     return redirect(url_for("result"))
 
 
+def _draw_user_key(user):
+    return str(user["id"]) if not user["is_guest"] else ensure_session_id()
+
+
+def _still_today_card(user, today, card_id):
+    """后台任务落库前确认今日记录仍是这张牌（期间可能 /clear 后重抽）"""
+    reading = TarotService.get_today_reading(user["id"], today)
+    return bool(reading) and reading["card_id"] == card_id
+
+
+def _start_draw_pipeline(user, today, card, direction):
+    """抽牌后立即提交「今日解读」与「运势」两个后台任务；登录用户的结果在任务内落库"""
+    user = dict(user, session_id=ensure_session_id())
+    user_ref = get_user_ref()
+    card_meaning = card.get(f"meaning_{'up' if direction == '正位' else 'rev'}", "")
+
+    def insight():
+        with app.app_context():
+            result = DifyService.generate_reading(card["name"], direction, card_meaning, user_ref=user_ref)
+            data = {
+                "today_insight": result.get("today_insight", f"今日你抽到了{card['name']}（{direction}）"),
+                "guidance": result.get("guidance", "请静心感受这张牌的能量"),
+            }
+            if not user["is_guest"] and _still_today_card(user, today, card["id"]):
+                from database import ReadingDAO
+                ReadingDAO.update_insight(user["id"], today, data["today_insight"], data["guidance"])
+            return data
+
+    def fortune():
+        with app.app_context():
+            fortune_data = FortuneService.calculate_fortune(
+                card["id"], card["name"], direction, today, user.get("id")
+            )
+            fortune_data = _attach_fortune_text(fortune_data, user.get("id") or user.get("session_id"))
+            if not user["is_guest"] and _still_today_card(user, today, card["id"]):
+                FortuneService.save_fortune(user["id"], today, fortune_data)
+            return fortune_data
+
+    jobs = {draw_pipeline.INSIGHT: insight}
+    if Config.FEATURES.get("fortune_index"):
+        jobs[draw_pipeline.FORTUNE] = fortune
+    draw_pipeline.start(_draw_user_key(user), today, jobs)
+
+
 @app.route("/result")
 def result():
     """查看结果"""
@@ -3058,6 +3558,21 @@ def result():
     need_generate = (today_insight is None or today_insight == "" or 
                     guidance is None or guidance == "")
     
+    if need_generate:
+        # 抽牌时已在后台生成：取结果或有界等待进行中的任务
+        user_key = _draw_user_key(user)
+        ready = draw_pipeline.wait(user_key, today, draw_pipeline.INSIGHT)
+        if ready:
+            today_insight, guidance = ready["today_insight"], ready["guidance"]
+            if user["is_guest"]:
+                SessionService.update_guest_insight(session, today_insight, guidance)
+            need_generate = False
+        elif draw_pipeline.pending(user_key, today, draw_pipeline.INSIGHT):
+            # 等待超时：先用默认文案，任务完成后（登录用户已落库 / 访客下次访问取走）即可看到
+            today_insight = f"今日你抽到了{card_data['name']}（{direction}）"
+            guidance = "请静心感受这张牌的能量"
+            need_generate = False
+
     if need_generate:
         # 获取牌面含义
         card_meaning = card_data.get(f"meaning_{'up' if direction == '正位' else 'rev'}", "")
@@ -3171,6 +3686,7 @@ def clear_cache():
     
     from database import ReadingDAO
     ReadingDAO.delete_today(user_id, today)
+    draw_pipeline.discard(user_id, today)
     
     flash("已清除今日抽牌记录", "success")
     return redirect(url_for("tarot_index"))
@@ -3278,7 +3794,21 @@ def get_fortune(date):
             # 登录用户检查数据库缓存
             existing_fortune = FortuneService.get_fortune(user["id"], target_date)
             if existing_fortune:
+                if not existing_fortune.get("fortune_text"):
+                    # 夜间预计算只存了数值：补齐文案后回写
+                    existing_fortune = _attach_fortune_text(existing_fortune, user["id"])
+                    FortuneService.save_fortune(user["id"], target_date, existing_fortune)
                 return jsonify(existing_fortune)
+
+        # 抽牌时已在后台生成：取结果或有界等待进行中的任务
+        user_key = _draw_user_key(user)
+        ready = draw_pipeline.wait(user_key, today, draw_pipeline.FORTUNE)
+        if ready and ready.get("card_id") == card_id and ready.get("direction") == direction:
+            if user["is_guest"]:
+                session['fortune_data'] = {'date': date, 'data': ready}
+                session.modified = True
+            return jsonify(ready)
+        timed_out = draw_pipeline.pending(user_key, today, draw_pipeline.FORTUNE)
         
         # 计算运势
         fortune_data = FortuneService.calculate_fortune(
@@ -3289,18 +3819,13 @@ def get_fortune(date):
             user.get("id")
         )
         
-        # 生成运势文案之后：
-        fortune_text = FortuneService.generate_fortune_text(fortune_data)
-        if isinstance(fortune_text, dict):
-            # 挂在 fortune_text，同时把常用字段扁平到根上方便前端读取
-            fortune_data["fortune_text"] = fortune_text
-            for k in ("summary", "dimension_advice", "do", "dont",
-                      "lucky_color", "lucky_number", "lucky_hour", "lucky_direction"):
-                if k in fortune_text and fortune_text[k]:
-                    fortune_data[k] = fortune_text[k]
-
-        # ★ 在保存与返回前拍平结构
-        fortune_data = flatten_fortune_for_share(fortune_data)
+        if timed_out:
+            # 后台任务仍在生成文案：本次先用默认文案且不落库，任务完成后会写入
+            fortune_data["fortune_text"] = FortuneService._generate_default_text(fortune_data)
+            return jsonify(flatten_fortune_for_share(fortune_data))
+
+        # 生成运势文案，并在保存与返回前拍平结构
+        fortune_data = _attach_fortune_text(fortune_data, user.get("id") or ensure_session_id())
 
         # 再保存 / 缓存
         if not user["is_guest"]:
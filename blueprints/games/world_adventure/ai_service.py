@@ -16,11 +16,14 @@ class AdventureAIService:
         return os.getenv("ADVENTURE_AI_PROVIDER", "openrouter")  # 默认 OpenRouter
 
     @staticmethod
-    def generate_world(template, world_name, user_prompt=None, stability=50, danger=50, mystery=50):
-        """生成世界内容"""
+    def generate_world_skeleton(template, world_name, user_prompt=None, stability=50, danger=50, mystery=50):
+        """
+        生成世界骨架（异步生成第一步）
+        只要求简短的地点/NPC 列表，细节（网格、任务）由后续并行步骤补全
+        """
         base_prompt = template.get('prompt_template', '')
 
-        prompt = f"""你是一个专业的跑团 DM，正在为玩家生成一个冒险世界。
+        prompt = f"""你是一个专业的跑团 DM，正在为玩家规划一个冒险世界的骨架。
 
 世界模板：{template['name']} ({template['description']})
 世界名称：{world_name}
@@ -30,23 +33,112 @@ class AdventureAIService:
 
 玩家补充：{user_prompt if user_prompt else '无'}
 
-请以 JSON 格式返回世界内容，包含：
+请以 JSON 格式返回世界骨架，包含：
 {{
   "world_description": "世界的详细描述（100-200字）",
   "world_lore": "世界的背景故事和历史（150-300字）",
   "locations": [
-    {{"name": "地点名", "type": "类型", "description": "描述"}}
+    {{"name": "地点名", "type": "town/dungeon/wilderness/landmark", "description": "一句话描述", "danger_level": 1}}
   ],
   "factions": [
     {{"name": "势力名", "power": "影响力等级", "stance": "立场/目标"}}
   ],
   "npcs": [
-    {{"name": "NPC名", "role": "身份", "personality": "性格", "secrets": "秘密/钩子"}}
+    {{"name": "NPC名", "role": "身份", "personality": "性格", "location": "所在地点名"}}
+  ]
+}}
+
+要求：地点 3-5 个，第一个地点是安全的起始城镇（danger_level 最低）；NPC 4-8 个。
+请直接返回 JSON，不要用 markdown 代码块。"""
+
+        return AdventureAIService._call_json(prompt)
+
+    @staticmethod
+    def generate_location_grids(world_name, world_lore, location, npc_names=None):
+        """为单个地点生成网格布局（异步生成的并行步骤）"""
+        prompt = f"""你是一个专业的跑团 DM，正在为世界「{world_name}」中的一个地点设计可探索的网格地图。
+
+【世界背景】
+{(world_lore or '')[:300]}
+
+【地点】
+名称：{location.get('name')}
+类型：{location.get('type', '')}
+描述：{location.get('description', '')}
+驻留人物：{'、'.join(npc_names) if npc_names else '无'}
+
+请以 JSON 格式返回该地点的 3-5 个网格：
+{{
+  "grids": [
+    {{
+      "name": "网格名（如：酒馆内部）",
+      "type": "类型",
+      "description": "描述（50字内）",
+      "first_visit_description": "首次到达时的描述",
+      "atmosphere": "氛围",
+      "position": {{"x": 0, "y": 0}},
+      "connections": [{{"direction": "north/south/east/west", "target": "相邻网格名"}}],
+      "objects": [{{"name": "物体名", "description": "描述"}}],
+      "npcs": [{{"name": "驻留人物名", "activity": "正在做什么", "position": "位置"}}]
+    }}
+  ]
+}}
+
+要求：第一个网格是该地点的入口；connections 只能引用本地点内的网格名；npcs 只能使用驻留人物。
+请直接返回 JSON，不要用 markdown 代码块。"""
+
+        return AdventureAIService._call_json(prompt)
+
+    @staticmethod
+    def generate_main_quest(world_name, world_lore, location_names, npc_names):
+        """生成主线任务（异步生成的并行步骤）"""
+        prompt = f"""你是一个专业的跑团 DM，正在为世界「{world_name}」设计一条主线任务。
+
+【世界背景】
+{(world_lore or '')[:300]}
+
+可用地点：{'、'.join(location_names) if location_names else '无'}
+可用人物：{'、'.join(npc_names) if npc_names else '无'}
+
+请以 JSON 格式返回：
+{{
+  "quest_name": "任务名",
+  "description": "任务描述（80字内）",
+  "difficulty": 1,
+  "checkpoints": [
+    {{"id": 1, "description": "检查点描述", "location": "地点名", "action_type": "dialogue/investigation/exploration/combat", "target_npc": "人物名或空"}}
   ]
 }}
 
+要求：3-4 个检查点，地点和人物只能从上面的列表中选择。
+请直接返回 JSON，不要用 markdown 代码块。"""
+
+        return AdventureAIService._call_json(prompt)
+
+    @staticmethod
+    def generate_adjacent_location(world_name, world_lore, from_location, direction):
+        """生成与当前地点相邻的新地点（世界扩展）"""
+        prompt = f"""你是一个专业的跑团 DM，正在为世界「{world_name}」扩展一个新地点。
+
+【世界背景】
+{(world_lore or '')[:300]}
+
+【出发地点】
+名称：{from_location.get('location_name', '')}
+描述：{from_location.get('description', '')}
+新地点方位：出发地点的 {direction} 方
+
+请以 JSON 格式返回：
+{{"name": "地点名", "type": "town/dungeon/wilderness/landmark", "description": "描述（80字内）", "danger_level": 1}}
+
+要求：新地点与出发地点风格连贯，危险度 1-10。
 请直接返回 JSON，不要用 markdown 代码块。"""
 
+        return AdventureAIService._call_json(prompt)
+
+    @staticmethod
+    def _call_json(prompt):
+        """按配置的提供商生成 JSON（失败返回 None）"""
         provider = AdventureAIService.get_provider()
 
         if provider == "openrouter":
@@ -54,18 +146,11 @@ class AdventureAIService:
         elif provider == "openai":
             return AdventureAIService._call_openai(prompt)
         elif provider == "claude":
-            return AdventureAIService._call_claude(prompt)
+            result = AdventureAIService._call_claude(prompt)
+            return result if isinstance(result, dict) else None
         elif provider == "dify":
             return AdventureAIService._call_dify(prompt)
-        else:
-            # 默认降级方案
-            return {
-                "world_description": f"{world_name}是一个神秘的世界，等待勇敢的冒险者探索。",
-                "world_lore": "关于这个世界的历史，还有许多未解之谜...",
-                "locations": [],
-                "factions": [],
-                "npcs": []
-            }
+        return None
 
     @staticmethod
     def generate_dm_response_v2(world_context, character, player_action, conversation_history=None,
@@ -2,7 +2,7 @@
 AI 世界冒险游戏 - 数据访问层 (DAO)
 遵循项目现有的 DAO 设计模式
 """
-from database import DatabaseManager
+from database import DatabaseManager, _keyset_messages
 import uuid
 from datetime import datetime
 
@@ -111,7 +111,9 @@ class AdventureWorldDAO:
                 params['world_id'] = world_id
                 sql = f"""
                     UPDATE adventure_worlds
-                    SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP
+                    SET {', '.join(updates)},
+                        world_version = world_version + 1,  -- 使世界快照缓存失效
+                        updated_at = CURRENT_TIMESTAMP
                     WHERE id = %(world_id)s
                 """
                 cur.execute(sql, params)
@@ -325,6 +327,18 @@ class AdventureRunMessageDAO:
                 """, (run_id, limit))
                 return cur.fetchall()
 
+    @staticmethod
+    def get_messages_since(run_id, cursor=None, limit=200):
+        """增量拉取：游标之后的消息，返回 (rows, has_more)"""
+        return _keyset_messages("adventure_run_messages", "run_id", run_id,
+                                "id, role, content, turn_number, created_at", cursor, limit)
+
+    @staticmethod
+    def get_messages_before(run_id, cursor=None, limit=50):
+        """向前翻页：游标之前的一页（无游标取最新一页），返回 (rows, has_more)"""
+        return _keyset_messages("adventure_run_messages", "run_id", run_id,
+                                "id, role, content, turn_number, created_at", cursor, limit, before=True)
+
     @staticmethod
     def get_messages_by_turn(run_id, turn_number):
         """获取特定回合的消息"""
@@ -336,3 +350,67 @@ class AdventureRunMessageDAO:
                     ORDER BY created_at ASC
                 """, (run_id, turn_number))
                 return cur.fetchall()
+
+
+class WorldGenerationJobDAO:
+    """世界异步生成任务数据访问"""
+
+    @staticmethod
+    def create(world_id, user_id=None):
+        """创建生成任务（user_id：创建者，登录用户为用户 ID，游客为会话 ID）"""
+        job_id = str(uuid.uuid4())
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO world_generation_jobs (id, world_id, user_id, status, stage)
+                    VALUES (%s, %s, %s, 'pending', 'queued')
+                    RETURNING *
+                """, (job_id, world_id, user_id))
+                job = cur.fetchone()
+                conn.commit()
+                return job
+
+    @staticmethod
+    def get_by_id(job_id):
+        """获取任务（附带世界生成状态）"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT j.*, w.generation_status, w.owner_user_id
+                    FROM world_generation_jobs j
+                    LEFT JOIN adventure_worlds w ON w.id = j.world_id
+                    WHERE j.id = %s
+                """, (job_id,))
+                return cur.fetchone()
+
+    @staticmethod
+    def update(job_id, status=None, stage=None, total_steps=None):
+        """更新任务状态/阶段/总步数"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE world_generation_jobs
+                    SET status = COALESCE(%s, status),
+                        stage = COALESCE(%s, stage),
+                        total_steps = COALESCE(%s, total_steps),
+                        finished_at = CASE WHEN %s IN ('done', 'failed')
+                                           THEN CURRENT_TIMESTAMP ELSE finished_at END,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (status, stage, total_steps, status, job_id))
+                conn.commit()
+
+    @staticmethod
+    def step_done(job_id, error=None):
+        """完成一个子步骤（单条 UPDATE 原子自增，并行 worker 安全）"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE world_generation_jobs
+                    SET done_steps = done_steps + 1,
+                        errors = CASE WHEN %s::text IS NULL THEN errors
+                                      ELSE COALESCE(errors, '[]'::jsonb) || jsonb_build_array(%s::text) END,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (error, error, job_id))
+                conn.commit()
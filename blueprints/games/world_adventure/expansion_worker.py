@@ -0,0 +1,250 @@
+"""
+世界预生成扩展 worker
+玩家到达边缘网格后，在后台提前生成相邻地点，AI 延迟不落在玩家回合内
+- 每个世界最多保留 WORLD_SPECULATIVE_BUDGET 个未被进入的预生成地点
+- 超出预算时按 speculated_at 淘汰最久未被需要的预生成地点（LRU）
+- 玩家进入预生成地点后转为正式地点（见 GridMovementSystem.execute_movement）
+"""
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import DatabaseManager
+from .game_engine import WorldExpansionEngine
+from .world_jobs import build_location_grids
+from .world_cache import bump_world_version
+
+# 每个世界未访问预生成地点的上限（0 关闭预生成）
+WORLD_SPECULATIVE_BUDGET = int(os.getenv("WORLD_SPECULATIVE_BUDGET", "4"))
+WORLD_SPECULATIVE_WORKERS = int(os.getenv("WORLD_SPECULATIVE_WORKERS", "2"))
+
+_DIRECTIONS = ['north', 'east', 'south', 'west']
+_OPPOSITE = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+
+# 通向外部的网格类型（边缘网格）
+_FRONTIER_GRID_TYPES = {'entrance', 'exit', 'gate', 'road', 'path', 'wilderness'}
+
+_EXECUTOR = None
+_LOCK = threading.Lock()
+_INFLIGHT = set()  # {(world_id, grid_id)} 避免同一网格重复提交
+
+
+def _get_executor():
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(1, WORLD_SPECULATIVE_WORKERS),
+                    thread_name_prefix="world-expand"
+                )
+    return _EXECUTOR
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except Exception:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def schedule_expansion(world_id, grid_id, context=''):
+    """
+    回合结束后调用：非阻塞地提交预生成
+    返回是否已提交（预算关闭 / 同一网格正在处理时返回 False）
+    """
+    if not world_id or not grid_id or WORLD_SPECULATIVE_BUDGET <= 0:
+        return False
+
+    key = (world_id, grid_id)
+    with _LOCK:
+        if key in _INFLIGHT:
+            return False
+        _INFLIGHT.add(key)
+
+    try:
+        _get_executor().submit(_run, world_id, grid_id, context)
+    except RuntimeError:
+        # 解释器退出时线程池已关闭
+        with _LOCK:
+            _INFLIGHT.discard(key)
+        return False
+    return True
+
+
+def _run(world_id, grid_id, context):
+    try:
+        expand_from_grid(world_id, grid_id, context)
+    except Exception as e:
+        print(f"世界预生成失败 world={world_id} grid={grid_id}: {e}")
+    finally:
+        with _LOCK:
+            _INFLIGHT.discard((world_id, grid_id))
+
+
+def expand_from_grid(world_id, grid_id, context=''):
+    """
+    预生成当前网格周边内容：
+    1. 相邻但还没有网格的地点 → 补全网格
+    2. 边缘网格（有空闲方向、尚未连到其他地点）→ 生成新的相邻地点并双向连接
+    """
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT g.id, g.grid_name, g.grid_type, g.location_id, g.connected_grids,
+                       l.location_name, l.description, l.connected_locations,
+                       w.world_name, w.world_lore,
+                       (SELECT gg.id FROM location_grids gg
+                        WHERE gg.location_id = g.location_id
+                        ORDER BY (gg.grid_position->>'x')::int, (gg.grid_position->>'y')::int
+                        LIMIT 1) AS entrance_grid_id
+                FROM location_grids g
+                JOIN world_locations l ON l.id = g.location_id
+                JOIN adventure_worlds w ON w.id = l.world_id
+                WHERE g.id = %s AND l.world_id = %s
+            """, (grid_id, world_id))
+            grid = cur.fetchone()
+            if not grid:
+                return
+
+            pending = []
+            neighbor_ids = _as_list(grid.get('connected_locations'))
+            if neighbor_ids:
+                cur.execute("""
+                    SELECT l.id, l.location_name AS name, l.location_type AS type, l.description
+                    FROM world_locations l
+                    WHERE l.id = ANY(%s) AND l.world_id = %s
+                      AND NOT EXISTS (SELECT 1 FROM location_grids g WHERE g.location_id = l.id)
+                """, (neighbor_ids, world_id))
+                pending = cur.fetchall()
+
+            # 该网格已挂接预生成地点：刷新 LRU 时间即可
+            cur.execute("""
+                UPDATE world_locations
+                SET speculated_at = CURRENT_TIMESTAMP
+                WHERE source_grid_id = %s AND is_speculative
+                RETURNING id
+            """, (grid_id,))
+            already_speculated = cur.fetchall()
+            conn.commit()
+
+    for loc in pending:
+        build_location_grids(grid['world_name'], grid['world_lore'], dict(loc), [])
+
+    if already_speculated:
+        return
+
+    connections = _as_list(grid.get('connected_grids'))
+    if any(c.get('location_id') and c.get('location_id') != grid['location_id'] for c in connections):
+        return  # 已连到其他地点
+
+    used = {c.get('direction') for c in connections}
+    free_directions = [d for d in _DIRECTIONS if d not in used]
+    if not free_directions:
+        return
+
+    is_frontier = (
+        grid['id'] == grid.get('entrance_grid_id')
+        or (grid.get('grid_type') or '') in _FRONTIER_GRID_TYPES
+        or WorldExpansionEngine.should_expand_world(world_id, context or '')
+    )
+    if not is_frontier:
+        return
+
+    direction = free_directions[0]
+    location = WorldExpansionEngine.generate_new_location(
+        world_id,
+        f"从「{grid['location_name']}·{grid['grid_name']}」向 {direction} 预生成",
+        world={'world_name': grid['world_name'], 'world_lore': grid['world_lore']},
+        from_location={'location_name': grid['location_name'], 'description': grid['description']},
+        direction=direction
+    )
+    if location.get('is_placeholder'):
+        # AI 失败只拿到「未知区域」占位：不落库、不连接，下次经过该网格时再试
+        print(f"世界预生成跳过 world={world_id} grid={grid_id}: AI 未返回地点")
+        return
+
+    _enforce_budget(world_id, reserve=1)
+    location['is_speculative'] = True
+    location['source_grid_id'] = grid_id
+    WorldExpansionEngine.save_new_location(location)
+
+    entrance_id, _ = build_location_grids(
+        grid['world_name'], grid['world_lore'],
+        {
+            'id': location['id'],
+            'name': location['location_name'],
+            'type': location.get('location_type', 'wilderness'),
+            'description': location.get('description', '')
+        },
+        []
+    )
+
+    _link_grids(grid, entrance_id, location, direction)
+
+
+def _link_grids(grid, entrance_id, location, direction):
+    """来源网格 ↔ 新地点入口网格 双向连接"""
+    forward = {
+        'direction': direction,
+        'grid_id': entrance_id,
+        'target_name': location['location_name'],
+        'location_id': location['id']
+    }
+    backward = {
+        'direction': _OPPOSITE[direction],
+        'grid_id': grid['id'],
+        'target_name': grid['grid_name'],
+        'location_id': grid['location_id']
+    }
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE location_grids
+                SET connected_grids = COALESCE(connected_grids, '[]'::jsonb) || %s::jsonb,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (json.dumps([forward], ensure_ascii=False), grid['id']))
+            cur.execute("""
+                UPDATE location_grids
+                SET connected_grids = COALESCE(connected_grids, '[]'::jsonb) || %s::jsonb,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (json.dumps([backward], ensure_ascii=False), entrance_id))
+            bump_world_version(cur, location_id=grid['location_id'])
+            conn.commit()
+
+
+def _enforce_budget(world_id, reserve=0):
+    """淘汰最久未被需要的预生成地点，使数量 ≤ 预算 - reserve"""
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, source_grid_id FROM world_locations
+                WHERE world_id = %s AND is_speculative
+                ORDER BY speculated_at ASC NULLS FIRST
+            """, (world_id,))
+            rows = cur.fetchall()
+
+            excess = len(rows) - max(0, WORLD_SPECULATIVE_BUDGET - reserve)
+            for row in rows[:max(0, excess)]:
+                # 先摘掉来源网格上指向该地点的连接，再删地点（网格级联删除）
+                if row.get('source_grid_id'):
+                    cur.execute("""
+                        UPDATE location_grids
+                        SET connected_grids = COALESCE((
+                                SELECT jsonb_agg(e) FROM jsonb_array_elements(connected_grids) e
+                                WHERE e->>'location_id' IS DISTINCT FROM %s
+                            ), '[]'::jsonb),
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s
+                    """, (row['id'], row['source_grid_id']))
+                cur.execute("""
+                    DELETE FROM world_locations
+                    WHERE id = %s AND is_speculative
+                """, (row['id'],))
+            if excess > 0:
+                bump_world_version(cur, world_id=world_id)
+            conn.commit()
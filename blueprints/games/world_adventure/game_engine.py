@@ -6,6 +6,7 @@ import random
 import json
 from datetime import datetime
 from database import DatabaseManager
+from .world_cache import get_snapshot, bump_world_version
 
 
 class DiceSystem:
@@ -61,6 +62,108 @@ class DiceSystem:
         }
 
 
+class PlayerProgressStore:
+    """
+    玩家进度存储 - 基于服务端 jsonb 表达式的原子更新
+    每次变更只需一次往返，不再读出整个 JSON 在 Python 中修改后整体写回。
+    SET 表达式只引用目标行自身的列：并发更新同一行时，后到的 UPDATE 会在
+    行锁释放后基于最新版本重新计算（READ COMMITTED），不会丢失更新
+    """
+
+    @staticmethod
+    def complete_checkpoint(user_id, world_id, quest_id, checkpoint_id):
+        """
+        将检查点加入 quest_progress[quest_id].checkpoints_completed（已存在则不变）
+        返回更新后的该任务进度
+        """
+        quest_key = str(quest_id)
+        checkpoint_json = json.dumps(checkpoint_id)
+
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE player_world_progress
+                    SET quest_progress = jsonb_set(
+                            COALESCE(quest_progress, '{}'::jsonb),
+                            ARRAY[%(quest_key)s],
+                            CASE
+                                WHEN COALESCE(quest_progress -> %(quest_key)s -> 'checkpoints_completed', '[]'::jsonb)
+                                     @> jsonb_build_array(%(checkpoint)s::jsonb)
+                                    THEN COALESCE(quest_progress -> %(quest_key)s, '{}'::jsonb)
+                                ELSE COALESCE(quest_progress -> %(quest_key)s, '{}'::jsonb)
+                                     || jsonb_build_object(
+                                            'checkpoints_completed',
+                                            COALESCE(quest_progress -> %(quest_key)s -> 'checkpoints_completed', '[]'::jsonb)
+                                            || jsonb_build_array(%(checkpoint)s::jsonb),
+                                            'current_checkpoint', %(checkpoint)s::jsonb
+                                        )
+                            END
+                        ),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %(user_id)s AND world_id = %(world_id)s
+                    RETURNING quest_progress -> %(quest_key)s AS entry
+                """, {
+                    'quest_key': quest_key,
+                    'checkpoint': checkpoint_json,
+                    'user_id': user_id,
+                    'world_id': world_id
+                })
+                row = cur.fetchone()
+                conn.commit()
+
+        if row and row.get('entry'):
+            return row['entry']
+        return {'checkpoints_completed': [checkpoint_id], 'current_checkpoint': checkpoint_id}
+
+    @staticmethod
+    def record_npc_interaction(user_id, world_id, npc_id, reputation_change=0):
+        """
+        一次往返完成：加入已见NPC列表、互动次数 +1、关系值增减（默认基准 50）、
+        world_npcs 互动统计 +1
+        """
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH npc AS (
+                        UPDATE world_npcs
+                        SET interaction_count = interaction_count + 1,
+                            last_interaction_at = CURRENT_TIMESTAMP
+                        WHERE id = %(npc_id)s
+                    )
+                    UPDATE player_world_progress
+                    SET visited_npcs =
+                            CASE
+                                WHEN COALESCE(visited_npcs, '[]'::jsonb) ? %(npc_id)s
+                                    THEN visited_npcs
+                                ELSE COALESCE(visited_npcs, '[]'::jsonb) || jsonb_build_array(%(npc_id)s::text)
+                            END,
+                        npc_relationships = jsonb_set(
+                            COALESCE(npc_relationships, '{}'::jsonb),
+                            ARRAY[%(npc_id)s],
+                            COALESCE(npc_relationships -> %(npc_id)s, '{}'::jsonb)
+                            || jsonb_build_object(
+                                'interactions',
+                                COALESCE((npc_relationships -> %(npc_id)s ->> 'interactions')::int, 0) + 1
+                            )
+                            || CASE
+                                WHEN %(delta)s = 0 THEN '{}'::jsonb
+                                ELSE jsonb_build_object(
+                                    'reputation',
+                                    COALESCE((npc_relationships -> %(npc_id)s ->> 'reputation')::int, 50) + %(delta)s
+                                )
+                            END
+                        ),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %(user_id)s AND world_id = %(world_id)s
+                """, {
+                    'npc_id': npc_id,
+                    'delta': int(reputation_change or 0),
+                    'user_id': user_id,
+                    'world_id': world_id
+                })
+                conn.commit()
+
+
 class QuestSystem:
     """任务系统"""
 
@@ -94,56 +197,8 @@ class QuestSystem:
 
     @staticmethod
     def update_quest_progress(user_id, world_id, quest_id, checkpoint_id):
-        """更新任务进度"""
-        import logging
-        logger = logging.getLogger(__name__)
-
-        with DatabaseManager.get_db() as conn:
-            with conn.cursor() as cur:
-                # 获取当前进度
-                cur.execute("""
-                    SELECT quest_progress FROM player_world_progress
-                    WHERE user_id = %s AND world_id = %s
-                """, (user_id, world_id))
-                result = cur.fetchone()
-
-                logger.info(f"[任务进度保存] user_id={user_id}, world_id={world_id}")
-                logger.info(f"[任务进度保存] quest_id={quest_id} (类型: {type(quest_id).__name__})")
-                logger.info(f"[任务进度保存] checkpoint_id={checkpoint_id} (类型: {type(checkpoint_id).__name__})")
-
-                if result:
-                    quest_progress = result.get('quest_progress', {})
-                    logger.info(f"[任务进度保存] 现有进度: {quest_progress}")
-                else:
-                    quest_progress = {}
-                    logger.info(f"[任务进度保存] 没有现有进度，创建新的")
-
-                # 更新检查点
-                if quest_id not in quest_progress:
-                    quest_progress[quest_id] = {
-                        'checkpoints_completed': [],
-                        'current_checkpoint': 0
-                    }
-                    logger.info(f"[任务进度保存] 创建新的任务进度条目: {quest_id}")
-
-                if checkpoint_id not in quest_progress[quest_id]['checkpoints_completed']:
-                    quest_progress[quest_id]['checkpoints_completed'].append(checkpoint_id)
-                    quest_progress[quest_id]['current_checkpoint'] = checkpoint_id
-                    logger.info(f"[任务进度保存] 添加检查点 {checkpoint_id} 到已完成列表")
-
-                logger.info(f"[任务进度保存] 更新后的进度: {quest_progress}")
-
-                # 保存到数据库
-                cur.execute("""
-                    UPDATE player_world_progress
-                    SET quest_progress = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = %s AND world_id = %s
-                """, (json.dumps(quest_progress), user_id, world_id))
-                conn.commit()
-
-                logger.info(f"[任务进度保存] ✅ 已提交到数据库")
-
-                return quest_progress[quest_id]
+        """更新任务进度（服务端 jsonb 原子更新，见 PlayerProgressStore）"""
+        return PlayerProgressStore.complete_checkpoint(user_id, world_id, quest_id, checkpoint_id)
 
     @staticmethod
     def check_quest_completion(quest, progress):
@@ -211,7 +266,7 @@ class WorldStateTracker:
                 cur.execute("""
                     SELECT id FROM location_grids
                     WHERE location_id = %s
-                    ORDER BY grid_position->>'x', grid_position->>'y'
+                    ORDER BY (grid_position->>'x')::int, (grid_position->>'y')::int
                     LIMIT 1
                 """, (location_id,))
                 start_grid = cur.fetchone()
@@ -258,53 +313,32 @@ class WorldStateTracker:
 
     @staticmethod
     def record_npc_interaction(user_id, world_id, npc_id, interaction_quality='neutral'):
-        """记录NPC互动"""
-        with DatabaseManager.get_db() as conn:
-            with conn.cursor() as cur:
-                # 添加到已见NPC列表
-                cur.execute("""
-                    UPDATE player_world_progress
-                    SET visited_npcs =
-                        CASE
-                            WHEN visited_npcs ? %s THEN visited_npcs
-                            ELSE visited_npcs || %s::jsonb
-                        END
-                    WHERE user_id = %s AND world_id = %s
-                """, (npc_id, json.dumps([npc_id]), user_id, world_id))
-
-                # 更新关系值
-                reputation_change = {
-                    'positive': 10,
-                    'neutral': 0,
-                    'negative': -10
-                }.get(interaction_quality, 0)
+        """记录NPC互动（单条语句原子更新，见 PlayerProgressStore）"""
+        reputation_change = {
+            'positive': 10,
+            'neutral': 0,
+            'negative': -10
+        }.get(interaction_quality, 0)
 
-                if reputation_change != 0:
-                    cur.execute("""
-                        UPDATE player_world_progress
-                        SET npc_relationships =
-                            jsonb_set(
-                                COALESCE(npc_relationships, '{}'::jsonb),
-                                ARRAY[%s, 'reputation'],
-                                to_jsonb(
-                                    COALESCE(
-                                        (npc_relationships -> %s ->> 'reputation')::int,
-                                        50
-                                    ) + %s
-                                )
-                            )
-                        WHERE user_id = %s AND world_id = %s
-                    """, (npc_id, npc_id, reputation_change, user_id, world_id))
+        PlayerProgressStore.record_npc_interaction(user_id, world_id, npc_id, reputation_change)
 
-                # 更新NPC互动统计
+    @staticmethod
+    def mark_npc_dead(world_id, npc_id):
+        """NPC 死亡（世界内容变化，递增世界版本号）"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
                 cur.execute("""
                     UPDATE world_npcs
-                    SET interaction_count = interaction_count + 1,
-                        last_interaction_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (npc_id,))
-
+                    SET is_alive = FALSE,
+                        health_status = 'dead',
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND world_id = %s AND is_alive
+                """, (npc_id, world_id))
+                changed = cur.rowcount > 0
+                if changed:
+                    bump_world_version(cur, world_id=world_id)
                 conn.commit()
+                return changed
 
     @staticmethod
     def log_player_action(run_id, user_id, world_id, action_type, action_content,
@@ -329,8 +363,12 @@ class GridMovementSystem:
     """网格移动系统 - Phase 1"""
 
     @staticmethod
-    def get_grid_by_id(grid_id):
-        """获取网格数据"""
+    def get_grid_by_id(grid_id, snapshot=None):
+        """获取网格数据（传入世界快照时优先从快照读取）"""
+        if snapshot:
+            grid = snapshot.get_grid(grid_id)
+            if grid:
+                return grid
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -339,8 +377,10 @@ class GridMovementSystem:
                 return cur.fetchone()
 
     @staticmethod
-    def get_grids_by_location(location_id):
-        """获取某个地点的所有网格"""
+    def get_grids_by_location(location_id, snapshot=None):
+        """获取某个地点的所有网格（传入世界快照时从快照读取）"""
+        if snapshot:
+            return snapshot.get_grids_by_location(location_id)
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -349,7 +389,7 @@ class GridMovementSystem:
                 return cur.fetchall()
 
     @staticmethod
-    def find_path_to_grid(start_grid_id, target_grid_id, max_depth=3):
+    def find_path_to_grid(start_grid_id, target_grid_id, max_depth=3, snapshot=None):
         """
         使用BFS查找从起始grid到目标grid的路径
 
@@ -376,7 +416,7 @@ class GridMovementSystem:
                 continue
 
             # 获取当前grid
-            current_grid = GridMovementSystem.get_grid_by_id(current_id)
+            current_grid = GridMovementSystem.get_grid_by_id(current_id, snapshot)
             if not current_grid:
                 continue
 
@@ -390,7 +430,7 @@ class GridMovementSystem:
                     continue
 
                 # 获取下一个grid的名称
-                next_grid = GridMovementSystem.get_grid_by_id(next_id)
+                next_grid = GridMovementSystem.get_grid_by_id(next_id, snapshot)
                 if not next_grid:
                     continue
 
@@ -412,7 +452,7 @@ class GridMovementSystem:
         return {'found': False, 'path': [], 'names': []}
 
     @staticmethod
-    def detect_movement(action_text, current_grid_id):
+    def detect_movement(action_text, current_grid_id, snapshot=None):
         """
         检测玩家是否尝试移动到其他网格（支持跨grid路径查找）
 
@@ -426,7 +466,7 @@ class GridMovementSystem:
         if not current_grid_id:
             return None
 
-        current_grid = GridMovementSystem.get_grid_by_id(current_grid_id)
+        current_grid = GridMovementSystem.get_grid_by_id(current_grid_id, snapshot)
         if not current_grid:
             return None
 
@@ -503,7 +543,7 @@ class GridMovementSystem:
             # 获取当前location的所有grids
             current_location_id = current_grid.get('location_id')
             if current_location_id:
-                all_grids = GridMovementSystem.get_grids_by_location(current_location_id)
+                all_grids = GridMovementSystem.get_grids_by_location(current_location_id, snapshot)
 
                 # 在所有grids中查找名称匹配的
                 for grid in all_grids:
@@ -521,7 +561,8 @@ class GridMovementSystem:
                         path_result = GridMovementSystem.find_path_to_grid(
                             current_grid_id,
                             grid['id'],
-                            max_depth=3
+                            max_depth=3,
+                            snapshot=snapshot
                         )
 
                         if path_result['found']:
@@ -584,7 +625,7 @@ class GridMovementSystem:
                 conn.commit()
 
     @staticmethod
-    def execute_movement(user_id, world_id, new_grid_id):
+    def execute_movement(user_id, world_id, new_grid_id, snapshot=None):
         """
         执行移动，更新数据库
 
@@ -595,7 +636,7 @@ class GridMovementSystem:
             'is_first_visit': bool
         }
         """
-        new_grid = GridMovementSystem.get_grid_by_id(new_grid_id)
+        new_grid = GridMovementSystem.get_grid_by_id(new_grid_id, snapshot)
         if not new_grid:
             return {'moved': False, 'error': 'Grid not found'}
 
@@ -609,6 +650,14 @@ class GridMovementSystem:
                         updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = %s AND world_id = %s
                 """, (new_grid_id, new_grid['location_id'], user_id, world_id))
+                # 玩家进入预生成地点 → 转为正式地点，不再参与淘汰
+                cur.execute("""
+                    UPDATE world_locations
+                    SET is_speculative = FALSE, is_discovered = TRUE, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND is_speculative
+                """, (new_grid['location_id'],))
+                if cur.rowcount:
+                    bump_world_version(cur, world_id=world_id)
                 conn.commit()
 
         # 检查是否首次访问
@@ -640,32 +689,61 @@ class WorldExpansionEngine:
         return False
 
     @staticmethod
-    def generate_new_location(world_id, generation_context):
-        """AI生成新地点（由AI服务调用）"""
+    def generate_new_location(world_id, generation_context, world=None, from_location=None, direction=None):
+        """
+        AI生成新地点
+        提供 world / from_location 时调用 AI 生成与出发地点相邻的地点，否则（或 AI 失败时）返回占位数据，
+        占位数据带 is_placeholder=True
+        """
         import uuid
         location_id = str(uuid.uuid4())
 
-        # 这里会调用AI服务生成地点详情
-        # 当前返回占位数据
-        return {
+        location = {
             'id': location_id,
             'world_id': world_id,
             'location_name': '未知区域',
             'description': '一片等待探索的神秘之地...',
             'is_ai_generated': True,
+            'is_placeholder': True,
             'generation_context': generation_context
         }
 
+        if world and from_location:
+            from .ai_service import AdventureAIService
+            try:
+                ai_data = AdventureAIService.generate_adjacent_location(
+                    world.get('world_name'), world.get('world_lore'), from_location, direction or ''
+                )
+            except Exception as e:
+                print(f"AI 生成新地点失败: {e}")
+                ai_data = None
+
+            if isinstance(ai_data, dict) and ai_data.get('name'):
+                try:
+                    danger_level = max(1, min(10, int(ai_data.get('danger_level', 5))))
+                except (TypeError, ValueError):
+                    danger_level = 5
+                location.update({
+                    'location_name': ai_data['name'],
+                    'location_type': ai_data.get('type') or 'wilderness',
+                    'description': ai_data.get('description', ''),
+                    'danger_level': danger_level,
+                    'is_placeholder': False
+                })
+
+        return location
+
     @staticmethod
     def save_new_location(location_data):
-        """保存新生成的地点"""
+        """保存新生成的地点（is_speculative=True 表示预生成、尚无玩家到访）"""
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO world_locations
                     (id, world_id, location_name, location_type, description,
-                     danger_level, is_ai_generated, generation_context)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                     danger_level, is_ai_generated, generation_context,
+                     is_speculative, source_grid_id, speculated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
                     RETURNING *
                 """, (
                     location_data['id'],
@@ -675,9 +753,12 @@ class WorldExpansionEngine:
                     location_data.get('description', ''),
                     location_data.get('danger_level', 5),
                     location_data.get('is_ai_generated', False),
-                    location_data.get('generation_context', '')
+                    location_data.get('generation_context', ''),
+                    location_data.get('is_speculative', False),
+                    location_data.get('source_grid_id')
                 ))
                 location = cur.fetchone()
+                bump_world_version(cur, world_id=location_data['world_id'])
                 conn.commit()
                 return location
 
@@ -755,118 +836,104 @@ class GameEngine:
 
         return result
 
-    def get_world_context_for_ai(self, world, progress, run):
+    def get_world_context_for_ai(self, world, progress, run, snapshot=None):
         """
         为AI生成完整的世界上下文（Phase 1 - 包含网格信息）
+        地点/网格/NPC/任务来自世界快照缓存；任务进度属于玩家状态，实时查询
         """
         # 兼容 world 参数可能是 world 对象（包含 'id'）或 run_data 对象（包含 'world_id'）
         world_id = world.get('id') or world.get('world_id')
 
-        with DatabaseManager.get_db() as conn:
-            with conn.cursor() as cur:
-                # 获取当前位置
-                current_location = None
-                if progress.get('current_location_id'):
-                    cur.execute("""
-                        SELECT * FROM world_locations WHERE id = %s
-                    """, (progress['current_location_id'],))
-                    current_location = cur.fetchone()
+        if snapshot is None:
+            snapshot = get_snapshot(world_id, world.get('world_version'))
+
+        current_location = None
+        current_grid = None
+        nearby_npcs = []
+        current_quest = None
+        discovered_locations = []
+
+        if snapshot:
+            # 获取当前位置
+            if progress.get('current_location_id'):
+                current_location = snapshot.get_location(progress['current_location_id'])
+
+            # Phase 1: 获取当前网格
+            if progress.get('current_grid_id'):
+                current_grid = snapshot.get_grid(progress['current_grid_id'])
+
+                # 如果有当前网格，从网格数据中获取 NPC 信息
+                if current_grid:
+                    npcs_present = current_grid.get('npcs_present', [])
+                    if isinstance(npcs_present, str):
+                        npcs_present = json.loads(npcs_present)
+
+                    # 合并网格中的活动信息和快照中的NPC详情
+                    npc_details = {
+                        npc['id']: npc
+                        for npc in snapshot.get_npcs([n.get('npc_id') for n in npcs_present if n.get('npc_id')])
+                    }
+                    for npc_info in npcs_present:
+                        npc_id = npc_info.get('npc_id')
+                        if npc_id in npc_details:
+                            npc = dict(npc_details[npc_id])
+                            npc['activity'] = npc_info.get('activity', '')
+                            npc['position'] = npc_info.get('position', '')
+                            nearby_npcs.append(npc)
+            elif current_location:
+                # Fallback: 旧版本逻辑，基于地点获取NPC
+                nearby_npcs = snapshot.get_location_npcs(current_location['id'])
+
+            # 获取当前任务
+            if run.get('current_quest_id'):
+                current_quest = snapshot.get_quest(run['current_quest_id'])
+
+            # 获取已访问的地点
+            discovered_ids = progress.get('discovered_locations', [])
+            if isinstance(discovered_ids, str):
+                discovered_ids = json.loads(discovered_ids)
+            for loc_id in discovered_ids or []:
+                loc = snapshot.get_location(loc_id)
+                if loc:
+                    discovered_locations.append({
+                        'location_name': loc['location_name'],
+                        'description': loc['description']
+                    })
 
-                # Phase 1: 获取当前网格
-                current_grid = None
-                if progress.get('current_grid_id'):
-                    cur.execute("""
-                        SELECT * FROM location_grids WHERE id = %s
-                    """, (progress['current_grid_id'],))
-                    current_grid = cur.fetchone()
-
-                    # 如果有当前网格，从网格数据中获取 NPC 信息
-                    if current_grid:
-                        npcs_present = current_grid.get('npcs_present', [])
-                        if isinstance(npcs_present, str):
-                            npcs_present = json.loads(npcs_present)
-
-                        # 获取这些NPC的详细信息
-                        nearby_npcs = []
-                        npc_ids = [npc.get('npc_id') for npc in npcs_present if npc.get('npc_id')]
-                        if npc_ids:
-                            cur.execute("""
-                                SELECT * FROM world_npcs
-                                WHERE id = ANY(%s) AND is_alive = TRUE
-                            """, (npc_ids,))
-                            npc_details = {npc['id']: npc for npc in cur.fetchall()}
-
-                            # 合并网格中的活动信息和数据库中的NPC详情
-                            for npc_info in npcs_present:
-                                npc_id = npc_info.get('npc_id')
-                                if npc_id in npc_details:
-                                    npc = dict(npc_details[npc_id])
-                                    npc['activity'] = npc_info.get('activity', '')
-                                    npc['position'] = npc_info.get('position', '')
-                                    nearby_npcs.append(npc)
-                else:
-                    # Fallback: 旧版本逻辑，基于地点获取NPC
-                    nearby_npcs = []
-                    if current_location:
-                        cur.execute("""
-                            SELECT * FROM world_npcs
-                            WHERE current_location_id = %s AND is_alive = TRUE
-                            LIMIT 5
-                        """, (current_location['id'],))
-                        nearby_npcs = cur.fetchall()
-
-                # 获取当前任务
-                current_quest = None
-                if run.get('current_quest_id'):
-                    cur.execute("""
-                        SELECT * FROM world_quests WHERE id = %s
-                    """, (run['current_quest_id'],))
-                    current_quest = cur.fetchone()
-
-                # 获取已访问的地点
-                discovered_locations = []
-                discovered_ids = progress.get('discovered_locations', [])
-                if isinstance(discovered_ids, str):
-                    discovered_ids = json.loads(discovered_ids)
-                if discovered_ids:
-                    cur.execute("""
-                        SELECT location_name, description FROM world_locations
-                        WHERE id = ANY(%s)
-                    """, (discovered_ids,))
-                    discovered_locations = cur.fetchall()
-
-                # 获取任务进度（在同一个连接中）
-                quest_progress = None
-                if run.get('current_quest_id'):
+        # 获取任务进度（玩家状态，实时查询）
+        quest_progress = None
+        if run.get('current_quest_id'):
+            with DatabaseManager.get_db() as conn:
+                with conn.cursor() as cur:
                     cur.execute("""
                         SELECT quest_progress FROM player_world_progress
                         WHERE user_id = %s AND world_id = %s
                     """, (progress.get('user_id'), world_id))
                     result = cur.fetchone()
 
-                    # 调试日志
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.info(f"[任务进度加载] user_id={progress.get('user_id')}, world_id={world_id}")
-                    logger.info(f"[任务进度加载] current_quest_id={run.get('current_quest_id')} (类型: {type(run.get('current_quest_id')).__name__})")
-
-                    if result and result.get('quest_progress'):
-                        raw_progress = result['quest_progress']
-                        logger.info(f"[任务进度加载] 数据库中的 quest_progress keys: {list(raw_progress.keys())}")
-                        logger.info(f"[任务进度加载] 完整数据: {raw_progress}")
-
-                        quest_id_str = str(run['current_quest_id'])
-                        quest_progress = raw_progress.get(quest_id_str, {
-                            'checkpoints_completed': [],
-                            'current_checkpoint': 0
-                        })
-                        logger.info(f"[任务进度加载] 查找 key='{quest_id_str}' 的结果: {quest_progress}")
-                    else:
-                        logger.info(f"[任务进度加载] 数据库中没有找到 quest_progress 或 result 为空")
-                        quest_progress = {
-                            'checkpoints_completed': [],
-                            'current_checkpoint': 0
-                        }
+            # 调试日志
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.info(f"[任务进度加载] user_id={progress.get('user_id')}, world_id={world_id}")
+            logger.info(f"[任务进度加载] current_quest_id={run.get('current_quest_id')} (类型: {type(run.get('current_quest_id')).__name__})")
+
+            if result and result.get('quest_progress'):
+                raw_progress = result['quest_progress']
+                logger.info(f"[任务进度加载] 数据库中的 quest_progress keys: {list(raw_progress.keys())}")
+                logger.info(f"[任务进度加载] 完整数据: {raw_progress}")
+
+                quest_id_str = str(run['current_quest_id'])
+                quest_progress = raw_progress.get(quest_id_str, {
+                    'checkpoints_completed': [],
+                    'current_checkpoint': 0
+                })
+                logger.info(f"[任务进度加载] 查找 key='{quest_id_str}' 的结果: {quest_progress}")
+            else:
+                logger.info(f"[任务进度加载] 数据库中没有找到 quest_progress 或 result 为空")
+                quest_progress = {
+                    'checkpoints_completed': [],
+                    'current_checkpoint': 0
+                }
 
         context = {
             'world_name': world.get('world_name'),
@@ -7,8 +7,13 @@ import uuid
 import json
 from datetime import datetime
 from database import DatabaseManager
+import message_cursor
 from .ai_service import AdventureAIService  # AI 服务统一接口
 from .game_engine import GameEngine  # V2 游戏引擎
+from .dao import WorldGenerationJobDAO, AdventureRunMessageDAO
+from .world_jobs import submit_world_generation  # 世界异步生成
+from .expansion_worker import schedule_expansion  # 相邻地点预生成
+from .world_cache import get_snapshot  # 世界快照缓存
 
 SLUG = "world_adventure"
 
@@ -42,47 +47,13 @@ def _get_user_id():
     return None
 
 def _get_session_id():
-    """获取会话 ID(用于游客)"""
+    """获取会话 ID(用于游客，没有时生成)"""
     from flask import session
+    if not (session.get('id') or session.get('session_id')):
+        session['session_id'] = uuid.uuid4().hex[:8]
     return session.get('id') or session.get('session_id')
 
 
-def generate_world_with_ai(template, world_name, user_prompt=None, stability=50, danger=50, mystery=50):
-    """使用 AI 生成世界内容"""
-    try:
-        world_data = AdventureAIService.generate_world(
-            template=template,
-            world_name=world_name,
-            user_prompt=user_prompt,
-            stability=stability,
-            danger=danger,
-            mystery=mystery
-        )
-
-        # 如果 AI 返回 None，使用默认值
-        if world_data is None:
-            return {
-                "world_description": f"{world_name}是一个神秘的世界，等待勇敢的冒险者探索。",
-                "world_lore": "关于这个世界的历史，还有许多未解之谜...",
-                "locations": [],
-                "factions": [],
-                "npcs": []
-            }
-
-        return world_data
-
-    except Exception as e:
-        print(f"AI 生成世界失败: {e}")
-        # 返回默认值
-        return {
-            "world_description": f"{world_name}是一个神秘的世界，等待勇敢的冒险者探索。",
-            "world_lore": "关于这个世界的历史，还有许多未解之谜...",
-            "locations": [],
-            "factions": [],
-            "npcs": []
-        }
-
-
 def generate_dm_response(run, character, world, player_action):
     """AI DM 生成响应"""
     try:
@@ -199,7 +170,7 @@ def run_play_page(run_id):
             cur.execute("""
                 SELECT
                     r.*,
-                    w.world_name, w.stability, w.danger, w.mystery,
+                    w.world_name, w.stability, w.danger, w.mystery, w.world_version,
                     c.char_name, c.char_class,
                     c.ability_combat, c.ability_social, c.ability_stealth,
                     c.ability_knowledge, c.ability_survival
@@ -213,80 +184,62 @@ def run_play_page(run_id):
             if not run:
                 return "Run 不存在", 404
 
-            # V2: 获取当前任务信息
-            current_quest = None
-            quest_progress = None
-            if run.get('current_quest_id'):
-                cur.execute("""
-                    SELECT * FROM world_quests WHERE id = %s
-                """, (run['current_quest_id'],))
-                current_quest = cur.fetchone()
-
-                # 获取玩家任务进度
-                if current_quest:
-                    cur.execute("""
-                        SELECT quest_progress FROM player_world_progress
-                        WHERE user_id = %s AND world_id = %s
-                    """, (run['user_id'], run['world_id']))
-                    progress_row = cur.fetchone()
-                    if progress_row and progress_row['quest_progress']:
-                        quest_progress = progress_row['quest_progress'].get(str(run['current_quest_id']), {})
-
-            # V2: 获取当前地点信息
-            current_location = None
-            if run.get('current_location_id'):
-                cur.execute("""
-                    SELECT * FROM world_locations WHERE id = %s
-                """, (run['current_location_id'],))
-                current_location = cur.fetchone()
-
-            # Phase 1: 获取当前网格信息
-            current_grid = None
+            # 玩家状态（实时）：任务进度 + 当前网格
             cur.execute("""
-                SELECT current_grid_id FROM player_world_progress
+                SELECT quest_progress, current_grid_id FROM player_world_progress
                 WHERE user_id = %s AND world_id = %s
             """, (run['user_id'], run['world_id']))
             progress = cur.fetchone()
 
-            if progress and progress.get('current_grid_id'):
-                cur.execute("""
-                    SELECT * FROM location_grids WHERE id = %s
-                """, (progress['current_grid_id'],))
-                current_grid = cur.fetchone()
-
-            # V2: 获取附近的 NPC（Phase 1: 从网格数据获取）
-            nearby_npcs = []
-            if current_grid:
-                # Phase 1: 从网格的 npcs_present 获取
-                import json
-                npcs_present = current_grid.get('npcs_present', [])
-                if isinstance(npcs_present, str):
-                    npcs_present = json.loads(npcs_present)
-
-                npc_ids = [npc.get('npc_id') for npc in npcs_present if npc.get('npc_id')]
-                if npc_ids:
-                    cur.execute("""
-                        SELECT * FROM world_npcs WHERE id = ANY(%s)
-                    """, (npc_ids,))
-                    npc_details = {npc['id']: npc for npc in cur.fetchall()}
-
-                    # 合并活动信息
-                    for npc_info in npcs_present:
-                        npc_id = npc_info.get('npc_id')
-                        if npc_id in npc_details:
-                            npc = dict(npc_details[npc_id])
-                            npc['activity'] = npc_info.get('activity', '')
-                            npc['position'] = npc_info.get('position', '')
-                            nearby_npcs.append(npc)
-            elif run.get('current_location_id'):
-                # Fallback: 旧版本逻辑
-                cur.execute("""
-                    SELECT * FROM world_npcs
-                    WHERE world_id = %s AND current_location_id = %s
-                    ORDER BY interaction_count DESC
-                    LIMIT 5
-                """, (run['world_id'], run['current_location_id']))
-                nearby_npcs = cur.fetchall()
+    # 世界静态内容走快照缓存
+    snapshot = get_snapshot(run['world_id'], run.get('world_version'))
+
+    # V2: 获取当前任务信息
+    current_quest = None
+    quest_progress = None
+    if run.get('current_quest_id') and snapshot:
+        current_quest = snapshot.get_quest(run['current_quest_id'])
+
+        # 获取玩家任务进度
+        if current_quest and progress and progress['quest_progress']:
+            quest_progress = progress['quest_progress'].get(str(run['current_quest_id']), {})
+
+    # V2: 获取当前地点信息
+    current_location = None
+    if run.get('current_location_id') and snapshot:
+        current_location = snapshot.get_location(run['current_location_id'])
+
+    # Phase 1: 获取当前网格信息
+    current_grid = None
+    if progress and progress.get('current_grid_id') and snapshot:
+        current_grid = snapshot.get_grid(progress['current_grid_id'])
+
+    # V2: 获取附近的 NPC（Phase 1: 从网格数据获取）
+    nearby_npcs = []
+    if current_grid:
+        # Phase 1: 从网格的 npcs_present 获取
+        npcs_present = current_grid.get('npcs_present', [])
+        if isinstance(npcs_present, str):
+            npcs_present = json.loads(npcs_present)
+
+        npc_ids = [npc.get('npc_id') for npc in npcs_present if npc.get('npc_id')]
+        npc_details = {npc['id']: npc for npc in snapshot.get_npcs(npc_ids, alive_only=False)}
+
+        # 合并活动信息
+        for npc_info in npcs_present:
+            npc_id = npc_info.get('npc_id')
+            if npc_id in npc_details:
+                npc = dict(npc_details[npc_id])
+                npc['activity'] = npc_info.get('activity', '')
+                npc['position'] = npc_info.get('position', '')
+                nearby_npcs.append(npc)
+    elif run.get('current_location_id') and snapshot:
+        # Fallback: 旧版本逻辑
+        nearby_npcs = sorted(
+            snapshot.get_location_npcs(run['current_location_id'], alive_only=False, limit=None),
+            key=lambda n: n.get('interaction_count') or 0,
+            reverse=True
+        )[:5]
 
     # 权限检查(简化版)
     if user_id and run.get('user_id') != user_id:
@@ -308,7 +261,7 @@ def run_play_page(run_id):
 # ========================================
 @bp.post("/api/worlds/create")
 def api_world_create():
-    """创建世界（含 AI 生成）"""
+    """创建世界（提交后台 AI 生成任务，返回 job_id 供轮询）"""
     try:
         user_id = _get_user_id()
         data = request.get_json() or {}
@@ -334,47 +287,45 @@ def api_world_create():
         if not template:
             return jsonify({"ok": False, "error": "模板不存在"}), 400
 
-        # AI 生成世界内容
-        world_data = generate_world_with_ai(
-            template, world_name, user_prompt,
-            stability, danger, mystery
-        )
-
-        # 生成世界 ID
+        # 先写入占位世界，内容由后台任务逐步补全
         world_id = str(uuid.uuid4())
 
-        # 保存到数据库
         with DatabaseManager.get_db() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO adventure_worlds
                     (id, owner_user_id, template_id, world_name, world_description,
                      world_lore, stability, danger, mystery,
-                     locations_data, factions_data, npcs_data)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING *
+                     locations_data, factions_data, npcs_data, generation_status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, '[]', '[]', '[]', 'pending')
                 """, (
                     world_id,
                     user_id,
                     template_id,
                     world_name,
-                    world_data.get('world_description', ''),
-                    world_data.get('world_lore', ''),
+                    '世界正在生成中...',
+                    '',
                     stability,
                     danger,
-                    mystery,
-                    json.dumps(world_data.get('locations', [])),
-                    json.dumps(world_data.get('factions', [])),
-                    json.dumps(world_data.get('npcs', []))
+                    mystery
                 ))
-                world = cur.fetchone()
                 conn.commit()
 
+        job = WorldGenerationJobDAO.create(world_id, user_id or _get_session_id())
+        submit_world_generation(job['id'], world_id, template, {
+            "world_name": world_name,
+            "user_prompt": user_prompt,
+            "stability": stability,
+            "danger": danger,
+            "mystery": mystery
+        })
+
         return jsonify({
             "ok": True,
             "world_id": world_id,
-            "world": dict(world) if world else None
-        })
+            "job_id": job['id'],
+            "poll_url": url_for(f"{SLUG}.api_world_job_status", job_id=job['id'])
+        }), 202
 
     except Exception as e:
         print(f"创建世界失败: {e}")
@@ -386,6 +337,43 @@ def api_world_create():
         }), 500
 
 
+@bp.get("/api/worlds/jobs/<job_id>")
+def api_world_job_status(job_id):
+    """查询世界生成任务进度（前端轮询）"""
+    try:
+        job = WorldGenerationJobDAO.get_by_id(job_id)
+        if not job:
+            return jsonify({"ok": False, "error": "任务不存在"}), 404
+
+        # 权限检查：登录用户的世界按 owner 校验；游客世界按创建任务时的会话校验
+        if job.get('owner_user_id'):
+            allowed = str(job['owner_user_id']) == str(_get_user_id())
+        else:
+            allowed = bool(job.get('user_id')) and job['user_id'] == _get_session_id()
+        if not allowed:
+            return jsonify({"ok": False, "error": "无权访问"}), 403
+
+        errors = job.get('errors') or []
+        if isinstance(errors, str):
+            errors = json.loads(errors)
+
+        return jsonify({
+            "ok": True,
+            "job_id": job['id'],
+            "world_id": job['world_id'],
+            "status": job['status'],
+            "stage": job['stage'],
+            "done_steps": job['done_steps'],
+            "total_steps": job['total_steps'],
+            "playable": job.get('generation_status') in ('playable', 'ready'),
+            "errors": errors
+        })
+
+    except Exception as e:
+        print(f"查询世界生成任务失败: {e}")
+        return jsonify({"ok": False, "error": f"查询失败: {str(e)}"}), 500
+
+
 @bp.post("/api/characters/create")
 def api_character_create():
     """创建角色"""
@@ -470,6 +458,8 @@ def api_run_start():
                 world = cur.fetchone()
                 if not world:
                     return jsonify({"ok": False, "error": "世界不存在"}), 400
+                if world.get('generation_status') in ('pending', 'generating'):
+                    return jsonify({"ok": False, "error": "世界仍在生成中，请稍后再试"}), 409
 
                 cur.execute("SELECT * FROM adventure_characters WHERE id = %s", (character_id,))
                 character = cur.fetchone()
@@ -601,7 +591,7 @@ def api_run_action(run_id):
                         r.run_title, r.mission_objective, r.current_quest_id,
                         r.current_location_id,
                         w.id as world_id, w.world_name, w.world_lore, w.world_description,
-                        w.stability, w.danger, w.mystery,
+                        w.stability, w.danger, w.mystery, w.world_version,
                         c.id as character_id, c.char_name, c.char_class, c.background,
                         c.ability_combat, c.ability_social, c.ability_stealth,
                         c.ability_knowledge, c.ability_survival
@@ -643,11 +633,15 @@ def api_run_action(run_id):
             progress
         )
 
+        # 世界静态内容快照（按 world_version 缓存，本回合内复用）
+        snapshot = get_snapshot(run_data['world_id'], run_data.get('world_version'))
+
         # 获取完整的世界上下文
         world_context = engine.get_world_context_for_ai(
             run_data,
             progress,
-            run_data
+            run_data,
+            snapshot
         )
 
         # 【V2 新增】智能行为分析
@@ -666,7 +660,7 @@ def api_run_action(run_id):
         current_grid_id = progress.get('current_grid_id')
         if current_grid_id:
             # 检测是否有移动意图（现在返回字典而不是grid_id）
-            movement_info = GridMovementSystem.detect_movement(action_text, current_grid_id)
+            movement_info = GridMovementSystem.detect_movement(action_text, current_grid_id, snapshot)
 
             if movement_info:
                 target_grid_id = movement_info['target_grid_id']
@@ -677,7 +671,8 @@ def api_run_action(run_id):
                 move_result = GridMovementSystem.execute_movement(
                     user_id,
                     run_data['world_id'],
-                    target_grid_id
+                    target_grid_id,
+                    snapshot
                 )
 
                 if move_result.get('moved'):
@@ -698,7 +693,7 @@ def api_run_action(run_id):
 
                     # 更新 progress 和 world_context
                     progress = engine.state.get_or_create_player_progress(user_id, run_data['world_id'])
-                    world_context = engine.get_world_context_for_ai(run_data, progress, run_data)
+                    world_context = engine.get_world_context_for_ai(run_data, progress, run_data, snapshot)
 
         # 【V2 新增】自动更新世界状态（NPC关系、地点探索）
         state_updates = ActionAnalyzer.auto_update_world_state(
@@ -754,7 +749,8 @@ def api_run_action(run_id):
                         world_context = engine.get_world_context_for_ai(
                             run_data,
                             engine.state.get_or_create_player_progress(user_id, run_data['world_id']),
-                            run_data
+                            run_data,
+                            snapshot
                         )
                     break
 
@@ -840,6 +836,10 @@ def api_run_action(run_id):
         updated_quest = world_context.get('current_quest')
         updated_quest_progress = world_context.get('quest_progress') or {}  # 确保不是 None
 
+        # 后台预生成相邻地点（不阻塞本回合）
+        if updated_grid:
+            schedule_expansion(run_data['world_id'], updated_grid.get('id'), action_text)
+
         # 构建简化的NPC数据（用于前端显示）
         npcs_for_frontend = []
         if updated_npcs:
@@ -898,21 +898,41 @@ def api_run_action(run_id):
 
 @bp.get("/api/runs/<run_id>/messages")
 def api_run_messages(run_id):
-    """获取 Run 的所有消息"""
-    with DatabaseManager.get_db() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT role, content, turn_number, created_at
-                FROM adventure_run_messages
-                WHERE run_id = %s
-                ORDER BY created_at ASC
-            """, (run_id,))
-            messages = cur.fetchall()
+    """
+    获取 Run 的消息
+    不带参数时返回全部消息（兼容旧前端），同时给出 next_cursor；
+    带 after / before / limit 时按 (created_at, id) 游标分页，语义同 /api/spread/messages
+    """
+    fields = ("role", "content", "turn_number", "created_at")
+    if not any(k in request.args for k in ("after", "before", "limit")):
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, role, content, turn_number, created_at
+                    FROM adventure_run_messages
+                    WHERE run_id = %s
+                    ORDER BY created_at ASC, id ASC
+                """, (run_id,))
+                messages = cur.fetchall()
+        page = message_cursor.payload(messages, False, fields=fields)
+        page["ok"] = True
+        return jsonify(page)
 
-    return jsonify({
-        "ok": True,
-        "messages": [dict(msg) for msg in messages]
-    })
+    limit = request.args.get("limit", 50, type=int) or 50
+    limit = min(200, max(1, limit))
+    try:
+        if "before" in request.args:
+            cursor = request.args.get("before")
+            rows, has_more = AdventureRunMessageDAO.get_messages_before(run_id, cursor, limit)
+        else:
+            cursor = request.args.get("after")
+            rows, has_more = AdventureRunMessageDAO.get_messages_since(run_id, cursor, limit)
+    except ValueError:
+        return jsonify({"ok": False, "error": "游标无效"}), 400
+
+    page = message_cursor.payload(rows, has_more, cursor, fields=fields)
+    page["ok"] = True
+    return jsonify(page)
 
 
 @bp.post("/api/runs/<run_id>/complete")
@@ -0,0 +1,160 @@
+"""
+世界快照缓存
+世界的静态内容（世界本身 / 地点 / 网格 / NPC / 任务）在游玩中几乎不变，
+按 adventure_worlds.world_version 缓存整份快照，避免每个请求按 id 重复查询。
+- 世界内容变化（update_stats / 世界扩展 / NPC 死亡 / 异步生成写入）时递增版本号
+- 玩家个人状态（进度、已发现网格、任务进度）不进快照，始终实时查询
+- 快照中的 NPC 互动次数等统计字段可能略有滞后，仅用于展示与 AI 上下文
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from database import DatabaseManager
+
+# 每个进程最多缓存的世界数
+WORLD_SNAPSHOT_CACHE_SIZE = int(os.getenv("WORLD_SNAPSHOT_CACHE_SIZE", "32"))
+
+_CACHE = OrderedDict()  # world_id -> (version, snapshot)
+_LOCK = threading.Lock()
+
+
+def bump_world_version(cur, world_id=None, location_id=None):
+    """
+    在调用方的事务内递增世界版本号（传 world_id 或 location_id 之一）
+    随调用方 commit 一起生效，其他进程下次读取时自动失效
+    """
+    if world_id:
+        cur.execute("""
+            UPDATE adventure_worlds SET world_version = world_version + 1
+            WHERE id = %s
+        """, (world_id,))
+    elif location_id:
+        cur.execute("""
+            UPDATE adventure_worlds SET world_version = world_version + 1
+            WHERE id = (SELECT world_id FROM world_locations WHERE id = %s)
+        """, (location_id,))
+
+
+def invalidate(world_id):
+    """丢弃本进程中的世界快照"""
+    with _LOCK:
+        _CACHE.pop(world_id, None)
+
+
+def _load_snapshot(world_id):
+    """一次连接内加载世界的全部静态内容"""
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM adventure_worlds WHERE id = %s", (world_id,))
+            world = cur.fetchone()
+            if not world:
+                return None
+
+            cur.execute("SELECT * FROM world_locations WHERE world_id = %s", (world_id,))
+            locations = cur.fetchall()
+
+            cur.execute("""
+                SELECT g.* FROM location_grids g
+                JOIN world_locations l ON l.id = g.location_id
+                WHERE l.world_id = %s
+            """, (world_id,))
+            grids = cur.fetchall()
+
+            cur.execute("SELECT * FROM world_npcs WHERE world_id = %s", (world_id,))
+            npcs = cur.fetchall()
+
+            cur.execute("SELECT * FROM world_quests WHERE world_id = %s", (world_id,))
+            quests = cur.fetchall()
+
+    grids_by_location = {}
+    for grid in grids:
+        for key in ('connected_grids', 'npcs_present', 'interactive_objects'):
+            if isinstance(grid.get(key), str):
+                grid[key] = json.loads(grid[key])
+        grids_by_location.setdefault(grid['location_id'], []).append(grid)
+
+    return WorldSnapshot(
+        world=world,
+        locations={l['id']: l for l in locations},
+        grids={g['id']: g for g in grids},
+        grids_by_location=grids_by_location,
+        npcs={n['id']: n for n in npcs},
+        quests={q['id']: q for q in quests}
+    )
+
+
+def get_snapshot(world_id, version=None):
+    """
+    获取世界快照
+    version 由调用方顺带查出（如 run 查询 JOIN adventure_worlds 时带上 world_version）时
+    可省去一次版本查询；不传则查询当前版本
+    """
+    if not world_id:
+        return None
+
+    if version is None:
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT world_version FROM adventure_worlds WHERE id = %s", (world_id,))
+                row = cur.fetchone()
+        if not row:
+            return None
+        version = row['world_version']
+
+    with _LOCK:
+        cached = _CACHE.get(world_id)
+        if cached and cached[0] == version:
+            _CACHE.move_to_end(world_id)
+            return cached[1]
+
+    snapshot = _load_snapshot(world_id)
+    if snapshot is None:
+        return None
+
+    with _LOCK:
+        # 加载期间版本可能再次变化；以调用方看到的版本入缓存，下次版本不符会重新加载
+        _CACHE[world_id] = (version, snapshot)
+        _CACHE.move_to_end(world_id)
+        while len(_CACHE) > WORLD_SNAPSHOT_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return snapshot
+
+
+class WorldSnapshot:
+    """世界静态内容快照（只读，调用方需要修改时先 dict() 复制）"""
+
+    def __init__(self, world, locations, grids, grids_by_location, npcs, quests):
+        self.world = world
+        self.locations = locations
+        self.grids = grids
+        self.grids_by_location = grids_by_location
+        self.npcs = npcs
+        self.quests = quests
+
+    def get_location(self, location_id):
+        return self.locations.get(location_id)
+
+    def get_grid(self, grid_id):
+        return self.grids.get(grid_id)
+
+    def get_grids_by_location(self, location_id):
+        return self.grids_by_location.get(location_id, [])
+
+    def get_quest(self, quest_id):
+        return self.quests.get(quest_id)
+
+    def get_npcs(self, npc_ids, alive_only=True):
+        result = []
+        for npc_id in npc_ids:
+            npc = self.npcs.get(npc_id)
+            if npc and (npc.get('is_alive') or not alive_only):
+                result.append(npc)
+        return result
+
+    def get_location_npcs(self, location_id, alive_only=True, limit=5):
+        npcs = [
+            n for n in self.npcs.values()
+            if n.get('current_location_id') == location_id and (n.get('is_alive') or not alive_only)
+        ]
+        return npcs[:limit]
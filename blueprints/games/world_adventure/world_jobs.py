@@ -0,0 +1,378 @@
+"""
+世界异步生成任务
+流程：骨架（单次 AI 调用）→ 并行生成各地点网格 + 主线任务 → 逐步写库
+起始地点写入完成后世界即可游玩（generation_status = 'playable'）
+"""
+import os
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from database import DatabaseManager
+from .ai_service import AdventureAIService
+from .dao import WorldGenerationJobDAO
+from .world_cache import bump_world_version
+
+# 同时运行的生成任务数
+WORLD_GEN_JOB_WORKERS = int(os.getenv("WORLD_GEN_JOB_WORKERS", "2"))
+# 单个任务内并行的 AI 调用数（控制对上游 API 的并发压力）
+WORLD_GEN_PARALLELISM = int(os.getenv("WORLD_GEN_PARALLELISM", "3"))
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor():
+    """进程级后台线程池（懒加载）"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(1, WORLD_GEN_JOB_WORKERS),
+                    thread_name_prefix="world-gen"
+                )
+    return _EXECUTOR
+
+
+def submit_world_generation(job_id, world_id, template, params):
+    """
+    提交世界生成任务
+    WORLD_GEN_ASYNC=0 时在当前请求内同步执行（无常驻进程的部署环境兜底）
+    """
+    template = dict(template)
+    if os.getenv("WORLD_GEN_ASYNC", "1") == "0":
+        run_world_generation(job_id, world_id, template, params)
+    else:
+        _get_executor().submit(run_world_generation, job_id, world_id, template, params)
+
+
+def _default_skeleton(world_name):
+    """AI 不可用时的默认骨架"""
+    return {
+        "world_description": f"{world_name}是一个神秘的世界，等待勇敢的冒险者探索。",
+        "world_lore": "关于这个世界的历史，还有许多未解之谜...",
+        "locations": [
+            {"name": "起始小镇", "type": "town", "description": "冒险者们出发的地方。", "danger_level": 1}
+        ],
+        "factions": [],
+        "npcs": []
+    }
+
+
+def _clamp(value, low, high, default):
+    try:
+        return max(low, min(high, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _set_world_status(world_id, status):
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE adventure_worlds
+                SET generation_status = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (status, world_id))
+            conn.commit()
+
+
+def _save_skeleton(world_id, skeleton):
+    """
+    写入骨架：世界描述 + 地点/势力/NPC 基础行（单事务）
+    返回 (locations, npcs)，locations 第一个为起始地点
+    """
+    raw_locations = [l for l in (skeleton.get('locations') or []) if isinstance(l, dict) and l.get('name')]
+    if not raw_locations:
+        raw_locations = _default_skeleton('')['locations']
+
+    # 起始地点：危险度最低的地点（与 api_run_start 的选取规则一致）
+    raw_locations.sort(key=lambda l: _clamp(l.get('danger_level'), 1, 10, 5))
+
+    locations = []
+    for i, loc in enumerate(raw_locations):
+        locations.append({
+            'id': str(uuid.uuid4()),
+            'name': loc['name'],
+            'type': loc.get('type') or 'wilderness',
+            'description': loc.get('description', ''),
+            'danger_level': _clamp(loc.get('danger_level'), 1, 10, 5),
+            'is_start': i == 0
+        })
+    loc_by_name = {l['name']: l for l in locations}
+
+    npcs = []
+    for npc in skeleton.get('npcs') or []:
+        if not isinstance(npc, dict) or not npc.get('name'):
+            continue
+        home = loc_by_name.get(npc.get('location')) or locations[0]
+        npcs.append({
+            'id': str(uuid.uuid4()),
+            'name': npc['name'],
+            'role': npc.get('role', ''),
+            'personality': npc.get('personality', ''),
+            'description': npc.get('secrets', ''),
+            'location_id': home['id']
+        })
+
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE adventure_worlds
+                SET world_description = %s,
+                    world_lore = %s,
+                    locations_data = %s,
+                    factions_data = %s,
+                    npcs_data = %s,
+                    generation_status = 'generating',
+                    world_version = world_version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (
+                skeleton.get('world_description', ''),
+                skeleton.get('world_lore', ''),
+                json.dumps(skeleton.get('locations', []), ensure_ascii=False),
+                json.dumps(skeleton.get('factions', []), ensure_ascii=False),
+                json.dumps(skeleton.get('npcs', []), ensure_ascii=False),
+                world_id
+            ))
+
+            for loc in locations:
+                cur.execute("""
+                    INSERT INTO world_locations
+                    (id, world_id, location_name, location_type, description,
+                     danger_level, is_discovered, is_ai_generated)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE)
+                """, (
+                    loc['id'], world_id, loc['name'], loc['type'],
+                    loc['description'], loc['danger_level'], loc['is_start']
+                ))
+
+            for faction in skeleton.get('factions') or []:
+                if not isinstance(faction, dict) or not faction.get('name'):
+                    continue
+                cur.execute("""
+                    INSERT INTO world_factions (id, world_id, faction_name, description)
+                    VALUES (%s, %s, %s, %s)
+                """, (str(uuid.uuid4()), world_id, faction['name'], faction.get('stance', '')))
+
+            for npc in npcs:
+                cur.execute("""
+                    INSERT INTO world_npcs
+                    (id, world_id, npc_name, role, personality, description,
+                     current_location_id, home_location_id, is_ai_generated)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, TRUE)
+                """, (
+                    npc['id'], world_id, npc['name'], npc['role'], npc['personality'],
+                    npc['description'], npc['location_id'], npc['location_id']
+                ))
+
+            conn.commit()
+
+    return locations, npcs
+
+
+def build_location_grids(world_name, world_lore, location, npcs):
+    """
+    生成并写入单个地点的网格（AI 失败时写入一个入口网格兜底）
+    返回 (入口网格 ID, 是否使用了兜底网格)
+    """
+    local_npcs = [n for n in npcs if n['location_id'] == location['id']]
+    npc_id_by_name = {n['name']: n['id'] for n in local_npcs}
+
+    result = AdventureAIService.generate_location_grids(
+        world_name, world_lore, location, [n['name'] for n in local_npcs]
+    )
+    raw_grids = [g for g in ((result or {}).get('grids') or []) if isinstance(g, dict) and g.get('name')]
+    if not raw_grids:
+        raw_grids = [{
+            "name": f"{location['name']}入口",
+            "type": "entrance",
+            "description": location.get('description', ''),
+            "position": {"x": 0, "y": 0},
+            "connections": [],
+            "objects": [],
+            "npcs": [{"name": n['name'], "activity": "", "position": ""} for n in local_npcs]
+        }]
+
+    # 网格名 → ID，用于把 connections 中的网格名解析为 grid_id
+    grid_ids = {g['name']: str(uuid.uuid4()) for g in raw_grids}
+
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            for grid in raw_grids:
+                connections = [
+                    {
+                        'direction': c.get('direction', ''),
+                        'grid_id': grid_ids[c.get('target')],
+                        'target_name': c.get('target')
+                    }
+                    for c in (grid.get('connections') or [])
+                    if isinstance(c, dict) and c.get('target') in grid_ids and c.get('target') != grid['name']
+                ]
+                npcs_present = [
+                    {
+                        'npc_id': npc_id_by_name[n.get('name')],
+                        'activity': n.get('activity', ''),
+                        'position': n.get('position', '')
+                    }
+                    for n in (grid.get('npcs') or [])
+                    if isinstance(n, dict) and n.get('name') in npc_id_by_name
+                ]
+                cur.execute("""
+                    INSERT INTO location_grids
+                    (id, location_id, grid_name, grid_type, description, grid_position,
+                     connected_grids, atmosphere, npcs_present, interactive_objects,
+                     first_visit_description)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    grid_ids[grid['name']],
+                    location['id'],
+                    grid['name'],
+                    grid.get('type') or 'area',
+                    grid.get('description') or location.get('description', ''),
+                    json.dumps(grid.get('position') or {"x": 0, "y": 0}),
+                    json.dumps(connections, ensure_ascii=False),
+                    grid.get('atmosphere'),
+                    json.dumps(npcs_present, ensure_ascii=False),
+                    json.dumps(grid.get('objects') or [], ensure_ascii=False),
+                    grid.get('first_visit_description')
+                ))
+            bump_world_version(cur, location_id=location['id'])
+            conn.commit()
+
+    return grid_ids[raw_grids[0]['name']], result is None
+
+
+class FallbackGridsError(RuntimeError):
+    """地点已写入兜底网格：可以游玩，但记为子任务错误"""
+
+
+def _generate_location(world_name, world_lore, location, npcs):
+    """世界生成子任务：地点网格（兜底时记为子任务错误）"""
+    _, used_fallback = build_location_grids(world_name, world_lore, location, npcs)
+    if used_fallback:
+        raise FallbackGridsError(f"地点「{location['name']}」网格生成失败，已使用默认网格")
+
+
+def _generate_quest(world_id, world_name, world_lore, locations, npcs):
+    """生成并写入主线任务"""
+    quest = AdventureAIService.generate_main_quest(
+        world_name, world_lore,
+        [l['name'] for l in locations],
+        [n['name'] for n in npcs]
+    )
+    if not isinstance(quest, dict) or not quest.get('quest_name'):
+        raise RuntimeError("主线任务生成失败")
+
+    # 检查点地点名 → 地点 ID（CheckpointDetector 按 location ID 校验）
+    loc_id_by_name = {l['name']: l['id'] for l in locations}
+    checkpoints = []
+    for i, cp in enumerate(quest.get('checkpoints') or [], start=1):
+        if not isinstance(cp, dict):
+            continue
+        checkpoints.append({
+            'id': cp.get('id', i),
+            'description': cp.get('description', ''),
+            'location': loc_id_by_name.get(cp.get('location'), ''),
+            'action_type': cp.get('action_type', ''),
+            'target_npc': cp.get('target_npc') or ''
+        })
+
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO world_quests
+                (id, world_id, quest_name, quest_type, description, difficulty,
+                 checkpoints, location_id, is_active)
+                VALUES (%s, %s, %s, 'main', %s, %s, %s, %s, TRUE)
+            """, (
+                str(uuid.uuid4()), world_id, quest['quest_name'],
+                quest.get('description', ''),
+                _clamp(quest.get('difficulty'), 1, 10, 1),
+                json.dumps(checkpoints, ensure_ascii=False),
+                locations[0]['id']
+            ))
+            bump_world_version(cur, world_id=world_id)
+            conn.commit()
+
+
+def run_world_generation(job_id, world_id, template, params):
+    """执行世界生成任务（后台线程入口）"""
+    world_name = params.get('world_name', '未命名世界')
+    try:
+        WorldGenerationJobDAO.update(job_id, status='running', stage='skeleton')
+
+        # 1. 骨架
+        try:
+            skeleton = AdventureAIService.generate_world_skeleton(
+                template, world_name, params.get('user_prompt'),
+                params.get('stability', 50), params.get('danger', 50), params.get('mystery', 50)
+            )
+        except Exception as e:
+            print(f"AI 生成世界骨架失败: {e}")
+            skeleton = None
+        if not isinstance(skeleton, dict):
+            skeleton = _default_skeleton(world_name)
+
+        locations, npcs = _save_skeleton(world_id, skeleton)
+        world_lore = skeleton.get('world_lore', '')
+
+        # 2. 并行细化：每个地点一个步骤 + 主线任务一个步骤
+        WorldGenerationJobDAO.update(job_id, stage='locations', total_steps=len(locations) + 1)
+
+        with ThreadPoolExecutor(max_workers=max(1, WORLD_GEN_PARALLELISM)) as ex:
+            futures = {}
+            # 起始地点最先提交，尽早变为可游玩
+            for loc in locations:
+                fut = ex.submit(_generate_location, world_name, world_lore, loc, npcs)
+                futures[fut] = loc
+            fut = ex.submit(_generate_quest, world_id, world_name, world_lore, locations, npcs)
+            futures[fut] = None
+
+            for fut in as_completed(futures):
+                loc = futures[fut]
+                error = None
+                has_grids = True
+                try:
+                    fut.result()
+                except FallbackGridsError as e:
+                    error = str(e)
+                except Exception as e:
+                    # 网格在单事务内写入，失败时该地点没有任何网格
+                    error = str(e)
+                    has_grids = False
+                    print(f"世界生成子任务失败 job={job_id}: {e}")
+
+                is_start = loc is not None and loc['is_start']
+                if is_start and not has_grids:
+                    # 起始地点没有网格就无法进入世界：重试一次，仍失败则整个任务失败
+                    try:
+                        _generate_location(world_name, world_lore, loc, npcs)
+                        error = None
+                    except FallbackGridsError as e:
+                        error = str(e)
+                    except Exception as e:
+                        WorldGenerationJobDAO.step_done(job_id, str(e))
+                        for f in futures:
+                            f.cancel()
+                        raise RuntimeError(f"起始地点「{loc['name']}」生成失败: {e}")
+                WorldGenerationJobDAO.step_done(job_id, error)
+
+                if is_start:
+                    _set_world_status(world_id, 'playable')
+                    WorldGenerationJobDAO.update(job_id, status='playable')
+
+        _set_world_status(world_id, 'ready')
+        WorldGenerationJobDAO.update(job_id, status='done', stage='finished')
+
+    except Exception as e:
+        print(f"世界生成任务失败 job={job_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        try:
+            _set_world_status(world_id, 'failed')
+            WorldGenerationJobDAO.update(job_id, status='failed')
+        except Exception:
+            pass
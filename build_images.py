@@ -0,0 +1,129 @@
+"""
+塔罗牌面图片构建：按宽度分档的 WebP / AVIF
+
+为 static/images/tarot/*.jpg 生成：
+  - derived/<牌名>-<宽度>.webp / .avif（宽度档位见 WIDTHS，不超过原图宽度；Pillow 不支持 AVIF 时只生成 WebP）
+  - derived/index.json：各牌尺寸与文件大小，image_assets.py 据此输出 <picture> / srcset
+
+用法（牌面图片有改动时，部署前执行并提交生成的文件；之后再执行 build_static.py 更新哈希清单）：
+    python build_images.py
+    python build_images.py --check   # 只检查是否有牌面缺少派生图，缺少时退出码为 1
+"""
+import argparse
+import io
+import json
+import os
+import sys
+
+from PIL import Image, features
+
+from image_assets import TAROT_DIR, DERIVED_DIR, INDEX_NAME
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SRC_DIR = os.path.join(STATIC_DIR, TAROT_DIR)
+OUT_DIR = os.path.join(STATIC_DIR, DERIVED_DIR)
+
+# 牌阵缩略图（约 62px，2x 屏 128）/ 移动端单牌（约 200px）/ 桌面单牌（300px）
+WIDTHS = (128, 200, 300)
+WEBP_QUALITY = 78
+AVIF_QUALITY = 55
+
+
+def _iter_cards():
+    for name in sorted(os.listdir(SRC_DIR)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in (".jpg", ".jpeg", ".png") and not name.startswith("."):
+            yield stem, os.path.join(SRC_DIR, name)
+
+
+def _write_if_changed(path, data):
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def _encode(img, fmt):
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=6)
+    else:
+        img.save(buf, "AVIF", quality=AVIF_QUALITY, speed=4)
+    return buf.getvalue()
+
+
+def _resize(img, width):
+    if width >= img.width:
+        return img
+    height = round(img.height * width / img.width)
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def build(write=True):
+    formats = ["avif", "webp"] if features.check("avif") else ["webp"]
+    if write:
+        os.makedirs(OUT_DIR, exist_ok=True)
+
+    cards = {}
+    for stem, path in _iter_cards():
+        with Image.open(path) as src:
+            img = src.convert("RGB")
+        entry = {"w": img.width, "h": img.height, "jpg": os.path.getsize(path)}
+        # 原图比最小档还窄时至少保留原宽度一档
+        widths = [w for w in WIDTHS if w <= img.width] or [img.width]
+        for fmt in formats:
+            entry[fmt] = {}
+            for width in widths:
+                out = os.path.join(STATIC_DIR, f"{DERIVED_DIR}/{stem}-{width}.{fmt}")
+                if write:
+                    data = _encode(_resize(img, width), fmt)
+                    _write_if_changed(out, data)
+                    entry[fmt][str(width)] = len(data)
+                elif os.path.exists(out):
+                    entry[fmt][str(width)] = os.path.getsize(out)
+        cards[stem] = entry
+
+    return {"formats": formats, "widths": list(WIDTHS), "cards": cards}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="塔罗牌面 WebP / AVIF 派生图")
+    parser.add_argument("--check", action="store_true", help="只检查派生图是否齐全")
+    args = parser.parse_args()
+
+    if args.check:
+        index = build(write=False)
+        missing = [
+            stem for stem, card in index["cards"].items()
+            if any(not card.get(fmt) for fmt in index["formats"])
+        ]
+        if missing or not os.path.exists(os.path.join(OUT_DIR, INDEX_NAME)):
+            print(f"缺少派生图：{', '.join(missing) or INDEX_NAME}，请执行 python build_images.py")
+            sys.exit(1)
+        print(f"派生图齐全（{len(index['cards'])} 张牌）")
+        return
+
+    if not features.check("avif"):
+        print("当前 Pillow 不支持 AVIF，只生成 WebP")
+
+    index = build(write=True)
+    data = json.dumps(index, ensure_ascii=False, indent=1, sort_keys=True).encode("utf-8") + b"\n"
+    _write_if_changed(os.path.join(OUT_DIR, INDEX_NAME), data)
+
+    jpg = sum(c["jpg"] for c in index["cards"].values())
+    print(f"{len(index['cards'])} 张牌，格式 {'/'.join(index['formats'])}，档位 {index['widths']}")
+    for fmt in index["formats"]:
+        for width in index["widths"]:
+            total = sum(c[fmt].get(str(width), 0) for c in index["cards"].values())
+            print(f"  {fmt:<5}{width:>4}w  {total / 1024:>7.0f} KB")
+    print(f"  原图 JPEG  {jpg / 1024:>7.0f} KB")
+    print("完成后请执行 python build_static.py 更新哈希清单")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+静态资源构建：内容哈希清单 + 预压缩
+
+为 static/ 下的每个文件计算内容哈希，写入 static/asset-manifest.json；
+文本类资源（CSS / JS / SVG / JSON / 字体 TTF 等）额外生成 .gz（以及安装了 brotli 时的 .br）同名文件。
+运行时由 static_assets.py 读取清单：url_for 输出带哈希的地址并按 immutable 长缓存，/sw.js 的缓存名随之变化。
+
+用法（静态资源有改动时，部署前执行并提交生成的文件）：
+    python build_static.py
+    python build_static.py --check   # 只检查清单是否过期，过期时退出码为 1
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+from static_assets import MANIFEST_NAME, hashed_name
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# 值得压缩的类型（JPEG / PNG / WOFF2 本身已压缩）
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".webmanifest", ".ttf", ".otf", ".txt", ".html", ".map"}
+# 压缩后至少要小 10% 才保留
+MIN_RATIO = 0.9
+
+
+def _iter_static_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            if name == MANIFEST_NAME or name.endswith((".gz", ".br")) or name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+
+
+def _write_if_changed(path, data):
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def _compress(rel, path, data):
+    """生成 .gz / .br；返回 {gzip: bool, br: bool} 与节省字节数"""
+    result, saved = {"gzip": False, "br": False}, 0
+    if os.path.splitext(rel)[1].lower() not in COMPRESSIBLE:
+        return result, saved
+
+    # mtime=0 保证同样内容的 .gz 字节一致，避免无意义的 diff
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data) * MIN_RATIO:
+        _write_if_changed(path + ".gz", gz)
+        result["gzip"] = True
+        saved = len(data) - len(gz)
+    elif os.path.exists(path + ".gz"):
+        os.remove(path + ".gz")
+
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data) * MIN_RATIO:
+            _write_if_changed(path + ".br", br)
+            result["br"] = True
+            saved = max(saved, len(data) - len(br))
+        elif os.path.exists(path + ".br"):
+            os.remove(path + ".br")
+    return result, saved
+
+
+def build_manifest(write=True):
+    files = {}
+    saved_total = 0
+    for rel, path in _iter_static_files():
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        entry = {"hashed": hashed_name(rel, digest), "size": len(data)}
+        if write:
+            flags, saved = _compress(rel, path, data)
+            entry.update(flags)
+            saved_total += saved
+        files[rel] = entry
+
+    version = hashlib.sha256(
+        "\n".join(f"{k}:{v['hashed']}" for k, v in sorted(files.items())).encode("utf-8")
+    ).hexdigest()[:10]
+    return {"version": version, "files": files}, saved_total
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(STATIC_DIR, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="静态资源指纹与预压缩")
+    parser.add_argument("--check", action="store_true", help="只检查清单是否与 static/ 一致")
+    args = parser.parse_args()
+
+    if args.check:
+        current, _ = build_manifest(write=False)
+        existing = _read_manifest() or {}
+        if existing.get("version") != current["version"]:
+            print("asset-manifest.json 已过期，请执行 python build_static.py")
+            sys.exit(1)
+        print(f"asset-manifest.json 已是最新（version {current['version']}）")
+        return
+
+    if brotli is None:
+        print("未安装 brotli，只生成 .gz（pip install brotli 后重新构建可得到 .br）")
+
+    manifest, saved = build_manifest(write=True)
+    data = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8") + b"\n"
+    _write_if_changed(os.path.join(STATIC_DIR, MANIFEST_NAME), data)
+
+    compressed = sum(1 for e in manifest["files"].values() if e.get("gzip") or e.get("br"))
+    print(f"{len(manifest['files'])} 个文件，{compressed} 个预压缩，节省约 {saved / 1024:.0f} KB")
+    print(f"version {manifest['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -52,9 +52,49 @@ class Config:
     # Webhook 验证（Workflow 的最后一个 HTTP 节点以 Header 带上 X-WEBHOOK-SECRET）
     WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "change-me-too")
 
+    # ===== 分享图导出 =====
+    # auto：有 Playwright 用浏览器截图，没有（或浏览器起不来）时用 Pillow 原生渲染
+    # playwright / pillow：强制使用其中一种
+    SHARE_EXPORT_RENDERER = os.getenv("SHARE_EXPORT_RENDERER", "auto").strip().lower()
+
+    # 分享页：渲染结果缓存时长（秒）；浏览量批量写回的间隔（秒）与单批最多分享数
+    SHARE_PAGE_CACHE_TTL = int(os.getenv("SHARE_PAGE_CACHE_TTL", "300"))
+    SHARE_PAGE_CACHE_SIZE = int(os.getenv("SHARE_PAGE_CACHE_SIZE", "512"))
+    SHARE_VIEW_FLUSH_INTERVAL = int(os.getenv("SHARE_VIEW_FLUSH_INTERVAL", "10"))
+    SHARE_VIEW_FLUSH_MAX = int(os.getenv("SHARE_VIEW_FLUSH_MAX", "500"))
+
+    # 当前用户缓存（秒 / 条数）：0 表示每个请求都查库
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+
+    # 会话存储：server（Cookie 只带 ID，内容存 web_sessions 表）/ cookie（Flask 默认签名 Cookie）
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "server").strip().lower()
+    SESSION_STORE_TTL = int(os.getenv("SESSION_STORE_TTL", str(3 * 24 * 3600)))  # 非长期会话的保留时长（秒）
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "4096"))
+    SESSION_PURGE_INTERVAL = int(os.getenv("SESSION_PURGE_INTERVAL", "3600"))
+
+    # 运势文案缓存：按量化后的运势画像（牌 / 正逆位 / 五维星级 / 总评 / 元素）复用 Dify 文案
+    # 每个画像最多 FORTUNE_TEXT_VARIANTS 个版本（按用户分散命中）；进程内 LRU 条数；库表最多保留行数
+    FORTUNE_TEXT_CACHE_ENABLED = os.getenv("FORTUNE_TEXT_CACHE_ENABLED", "1") in ("1", "true", "True")
+    FORTUNE_TEXT_VARIANTS = int(os.getenv("FORTUNE_TEXT_VARIANTS", "3"))
+    FORTUNE_TEXT_CACHE_SIZE = int(os.getenv("FORTUNE_TEXT_CACHE_SIZE", "2048"))
+    FORTUNE_TEXT_CACHE_MAX_ROWS = int(os.getenv("FORTUNE_TEXT_CACHE_MAX_ROWS", "50000"))
+
+    # 牌阵推荐索引：目录重载间隔 / 人气（日汇总表）刷新间隔（秒）
+    SPREAD_INDEX_TTL = int(os.getenv("SPREAD_INDEX_TTL", "3600"))
+    SPREAD_POPULARITY_TTL = int(os.getenv("SPREAD_POPULARITY_TTL", "600"))
+    # 目录达到这么多个牌阵才用 NumPy 向量化打分（小目录逐个计算更快，也省去冷启动导入 NumPy）
+    SPREAD_INDEX_NUMPY_MIN = int(os.getenv("SPREAD_INDEX_NUMPY_MIN", "100"))
+
+    # 牌阵占卜记录视图缓存（引导流程轮询 get_reading）：条目有效期（秒）/ 进程内最多条数
+    READING_VIEW_TTL = int(os.getenv("READING_VIEW_TTL", "90"))
+    READING_VIEW_CACHE_SIZE = int(os.getenv("READING_VIEW_CACHE_SIZE", "1024"))
+
     # ===== Conversation 日界线配置 =====
     APP_TIMEZONE = os.environ.get("APP_TIMEZONE", "Asia/Shanghai")  # 也可用 "Asia/Tokyo"
     DAILY_CONV_CUTOFF_HOUR = int(os.environ.get("DAILY_CONV_CUTOFF_HOUR", "1"))  # 01:00 切日
+    # 当日 conversation_id 进程内缓存条数（app._dc_select / _dc_upsert）
+    DAILY_CID_CACHE_SIZE = int(os.environ.get("DAILY_CID_CACHE_SIZE", "4096"))
 
     # Flask 配置
     SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
@@ -101,6 +141,8 @@ class Config:
         'session_timeout_minutes': 30,
         'max_history_messages': 10  # 传给AI的历史消息数
     }
+    # 对话收尾写入（AI 回复 + conversation_id）推迟到响应发出后执行
+    CHAT_DEFER_FINAL_WRITES = os.getenv("CHAT_DEFER_FINAL_WRITES", "1") in ("1", "true", "True")
     
     # Dify 聊天专用 API（可选）
     DIFY_CHAT_API_KEY = os.environ.get('DIFY_CHAT_API_KEY', DIFY_API_KEY)
@@ -68,6 +68,42 @@ def _normalize_json_list(val):
             return []
     return []
 
+def _patch_reading_view(reading_id, **fields):
+    """spread_readings 状态类字段更新后同步修补进程内视图缓存（见 reading_view.py）"""
+    try:
+        import reading_view
+        reading_view.patch(reading_id, **fields)
+    except Exception as e:
+        print(f"[reading_view] patch failed: {e}")
+
+def _keyset_messages(table, owner_col, owner_id, columns, cursor=None, limit=50, before=False):
+    """
+    消息表按 (created_at, id) keyset 分页（游标格式见 message_cursor.py）
+    - before=False：游标之后的消息（增量拉取；无游标时从第一条开始）
+    - before=True：游标之前的一页（向前翻页；无游标时取最新一页）
+    返回 (按时间升序的行, has_more)；表名 / 列名只来自 DAO 内的常量
+    """
+    import message_cursor
+    key = message_cursor.decode(cursor)
+    cond, params = f"{owner_col} = %s", [owner_id]
+    if key:
+        cond += " AND (created_at, id) < (%s, %s)" if before else " AND (created_at, id) > (%s, %s)"
+        params.extend(key)
+    order = "DESC" if before else "ASC"
+    params.append(limit + 1)
+    with DatabaseManager.get_db() as conn:
+        with conn.cursor() as cursor_:
+            cursor_.execute(f"""
+                SELECT {columns} FROM {table}
+                WHERE {cond}
+                ORDER BY created_at {order}, id {order}
+                LIMIT %s
+            """, params)
+            rows, has_more = message_cursor.page(cursor_.fetchall(), limit)
+    if before:
+        rows.reverse()
+    return rows, has_more
+
 # ==== 使用既有表：share_cards ====
 # 表结构：
 # share_cards(id serial, share_id varchar(20) unique, user_id varchar(50),
@@ -162,6 +198,133 @@ class ShareDAO:
             with conn.cursor() as cur:
                 cur.execute(sql, [share_id])
 
+    @staticmethod
+    def increment_views_batch(counts: dict):
+        """批量累加浏览量：{share_id: 增量} → 一条 UPDATE ... FROM (VALUES ...)"""
+        if not counts:
+            return
+        sql = """
+        UPDATE share_cards AS s
+        SET view_count = s.view_count + v.n
+        FROM (VALUES %s) AS v(share_id, n)
+        WHERE s.share_id = v.share_id
+        """
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur, sql, list(counts.items()),
+                    template="(%s, %s::int)", page_size=max(len(counts), 1)
+                )
+            conn.commit()
+
+class WebSessionDAO:
+    """服务端会话存储（web_sessions 表，见 migrations/20251205_web_sessions.sql）"""
+
+    @staticmethod
+    def get(session_id):
+        """返回 {data, version, expires_at}；不存在或已过期返回 None"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT data, version, expires_at
+                    FROM web_sessions
+                    WHERE id = %s AND expires_at > NOW()
+                """, (session_id,))
+                row = cur.fetchone()
+                if row is not None:
+                    row = dict(row)
+                    row["data"] = bytes(row["data"])
+                return row
+
+    @staticmethod
+    def save(session_id, data: bytes, version: int, expires_at: datetime):
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO web_sessions (id, data, version, expires_at, updated_at)
+                    VALUES (%s, %s, %s, %s, NOW())
+                    ON CONFLICT (id) DO UPDATE
+                    SET data = EXCLUDED.data,
+                        version = EXCLUDED.version,
+                        expires_at = EXCLUDED.expires_at,
+                        updated_at = NOW()
+                """, (session_id, psycopg2.Binary(data), version, expires_at))
+            conn.commit()
+
+    @staticmethod
+    def delete(session_id):
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM web_sessions WHERE id = %s", (session_id,))
+            conn.commit()
+
+    @staticmethod
+    def purge_expired(limit=1000):
+        """删除已过期的会话（分批，避免长事务）；返回删除条数"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM web_sessions
+                    WHERE id IN (
+                        SELECT id FROM web_sessions WHERE expires_at < NOW() LIMIT %s
+                    )
+                """, (limit,))
+                deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+
+class FortuneTextCacheDAO:
+    """运势文案缓存（fortune_text_cache 表，见 migrations/20251206_fortune_text_cache.sql）"""
+
+    @staticmethod
+    def get(profile_key, variant):
+        """命中时顺带刷新 last_used_at / hits（LRU 淘汰依据）；返回文案 dict 或 None"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE fortune_text_cache
+                    SET last_used_at = NOW(), hits = hits + 1
+                    WHERE profile_key = %s AND variant = %s
+                    RETURNING text
+                """, (profile_key, variant))
+                row = cur.fetchone()
+            conn.commit()
+        if not row:
+            return None
+        text = row["text"]
+        return json.loads(text) if isinstance(text, str) else text
+
+    @staticmethod
+    def put(profile_key, variant, profile, text):
+        """写入一个版本；并发写同一槽位时保留先写入的"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO fortune_text_cache (profile_key, variant, profile, text)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (profile_key, variant) DO NOTHING
+                """, (profile_key, variant, Json(profile), Json(text)))
+            conn.commit()
+
+    @staticmethod
+    def evict_lru(max_rows, batch=1000):
+        """超过 max_rows 时按 last_used_at 删除最久未用的一批；返回删除条数"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM fortune_text_cache
+                    WHERE (profile_key, variant) IN (
+                        SELECT profile_key, variant FROM fortune_text_cache
+                        ORDER BY last_used_at DESC
+                        OFFSET %s LIMIT %s
+                    )
+                """, (max_rows, batch))
+                deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+
 class DifyConversationDAO:
     @staticmethod
     def get_conversation_id(user_ref: str, day_key: str,
@@ -337,6 +500,35 @@ class SpreadDAO:
                 rows = cur.fetchall()
                 return {r['spread_id']: r['cnt'] for r in rows}
 
+    @staticmethod
+    def rollup_popularity(days=2):
+        """把最近 days 天的 spread_readings 按 (牌阵, 日期) 汇总进 spread_popularity_daily（覆盖写）"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO spread_popularity_daily (spread_id, day, cnt)
+                    SELECT spread_id, date, COUNT(*)
+                    FROM spread_readings
+                    WHERE date >= CURRENT_DATE - %s::int
+                      AND spread_id IS NOT NULL
+                    GROUP BY spread_id, date
+                    ON CONFLICT (spread_id, day) DO UPDATE SET cnt = EXCLUDED.cnt
+                """, (days,))
+            conn.commit()
+
+    @staticmethod
+    def get_popularity_rollup(days=30):
+        """从日汇总表取全部牌阵最近 days 天的使用次数：{spread_id: cnt}"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT spread_id, SUM(cnt) AS cnt
+                    FROM spread_popularity_daily
+                    WHERE day >= (CURRENT_DATE - INTERVAL '%s day')
+                    GROUP BY spread_id
+                """, (days,))
+                return {r['spread_id']: int(r['cnt']) for r in cur.fetchall()}
+
     @staticmethod
     def used_recently(user_id, spread_ids, days=14):
         if not user_id or not spread_ids:
@@ -409,6 +601,7 @@ class SpreadDAO:
                     UPDATE spread_readings SET status = %s WHERE id = %s
                 """, (status, reading_id))
                 conn.commit()
+        _patch_reading_view(reading_id, status=status)
 
     @staticmethod
     def get_status(reading_id):
@@ -445,6 +638,7 @@ class SpreadDAO:
                     WHERE id = %s
                 """, (interpretation, reading_id))
                 conn.commit()
+        _patch_reading_view(reading_id, initial_interpretation=interpretation)
 
     @staticmethod
     def update_conversation_id(reading_id, conversation_id):
@@ -457,6 +651,7 @@ class SpreadDAO:
                     WHERE id = %s
                 """, (conversation_id, reading_id))
                 conn.commit()
+        _patch_reading_view(reading_id, conversation_id=conversation_id)
 
     @staticmethod
     def save_message(message_data):
@@ -487,6 +682,28 @@ class SpreadDAO:
                 """, (reading_id,))
                 return cursor.fetchall()
 
+    @staticmethod
+    def get_messages_since(reading_id, cursor=None, limit=200):
+        """增量拉取：游标之后的消息，返回 (rows, has_more)"""
+        return _keyset_messages("spread_messages", "reading_id", reading_id,
+                                "id, role, content, created_at", cursor, limit)
+
+    @staticmethod
+    def get_messages_before(reading_id, cursor=None, limit=50):
+        """向前翻页：游标之前的一页（无游标取最新一页），返回 (rows, has_more)"""
+        return _keyset_messages("spread_messages", "reading_id", reading_id,
+                                "id, role, content, created_at", cursor, limit, before=True)
+
+    @staticmethod
+    def count_messages(reading_id):
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT COUNT(*) AS count FROM spread_messages WHERE reading_id = %s
+                """, (reading_id,))
+                row = cursor.fetchone()
+                return int(row["count"]) if row else 0
+
     @staticmethod
     def get_today_spread_count(user_id, session_id, date):
         """获取今日占卜次数"""
@@ -587,6 +804,18 @@ class ChatDAO:
                 """, {'session_id': session_id, 'limit': limit})
                 return cursor.fetchall()
 
+    @staticmethod
+    def get_messages_since(session_id, cursor=None, limit=200):
+        """增量拉取：游标之后的消息，返回 (rows, has_more)"""
+        return _keyset_messages("chat_messages", "session_id", session_id,
+                                "id, role, content, created_at", cursor, limit)
+
+    @staticmethod
+    def get_messages_before(session_id, cursor=None, limit=50):
+        """向前翻页：游标之前的一页（无游标取最新一页），返回 (rows, has_more)"""
+        return _keyset_messages("chat_messages", "session_id", session_id,
+                                "id, role, content, created_at", cursor, limit, before=True)
+
     @staticmethod
     def get_daily_usage(user_id, session_id, date):
         """获取每日使用次数"""
@@ -616,6 +845,82 @@ class ChatDAO:
                 conn.commit()
                 return result['count'] if result else 1
 
+    @staticmethod
+    def begin_turn(session_id, user_id, date, content, history_limit=10):
+        """
+        一轮对话的前半段（一条语句、一个事务）：
+        写入用户消息 + 使用次数 +1，并在同一次往返里带回会话信息与最近 history_limit 条历史
+        （新消息对同一语句里的 SELECT 不可见，用 RETURNING 的结果补进历史）
+        返回会话行（附加 usage_count、history：按时间倒序、reply_at）；会话不存在时不写入并返回 None
+        reply_at：为 AI 回复预留的 created_at（紧跟本条用户消息），finish_turn 推迟执行时
+        回复仍排在本条之后、下一轮用户消息之前
+        """
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    WITH sess AS (
+                        SELECT * FROM chat_sessions WHERE id = %(session_id)s
+                    ),
+                    msg AS (
+                        INSERT INTO chat_messages (session_id, role, content)
+                        SELECT id, 'user', %(content)s FROM sess
+                        RETURNING id, role, content, created_at
+                    ),
+                    usage AS (
+                        INSERT INTO chat_usage (user_id, session_id, date, count)
+                        SELECT %(user_id)s, %(session_id)s, %(date)s, 1 FROM sess
+                        ON CONFLICT (user_id, date)
+                        DO UPDATE SET count = chat_usage.count + 1
+                        RETURNING count
+                    ),
+                    hist AS (
+                        SELECT id, role, content, created_at FROM (
+                            SELECT id, role, content, created_at
+                            FROM chat_messages WHERE session_id = %(session_id)s
+                            UNION ALL
+                            SELECT id, role, content, created_at FROM msg
+                        ) h
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %(history_limit)s
+                    )
+                    SELECT sess.*,
+                           (SELECT count FROM usage) AS usage_count,
+                           (SELECT created_at FROM msg) + interval '1 microsecond' AS reply_at,
+                           COALESCE((SELECT json_agg(json_build_object('role', role, 'content', content)
+                                                     ORDER BY created_at DESC, id DESC)
+                                     FROM hist), '[]'::json) AS history
+                    FROM sess
+                """, {
+                    'session_id': session_id,
+                    'user_id': user_id,
+                    'date': date,
+                    'content': content,
+                    'history_limit': history_limit
+                })
+                row = cursor.fetchone()
+                conn.commit()
+                return row
+
+    @staticmethod
+    def finish_turn(session_id, answer, conversation_id=None, created_at=None):
+        """
+        一轮对话的后半段：保存 AI 回复 +（有变化时）更新 conversation_id，同一事务提交
+        created_at：begin_turn 返回的 reply_at；不传时按写入时间
+        """
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO chat_messages (session_id, role, content, created_at)
+                    VALUES (%s, 'assistant', %s, COALESCE(%s, CURRENT_TIMESTAMP))
+                """, (session_id, answer, created_at))
+                if conversation_id:
+                    cursor.execute("""
+                        UPDATE chat_sessions
+                        SET conversation_id = %s
+                        WHERE id = %s AND conversation_id IS DISTINCT FROM %s
+                    """, (conversation_id, session_id, conversation_id))
+                conn.commit()
+
     @staticmethod
     def get_session_by_id(session_id):
         """根据ID获取会话"""
@@ -752,6 +1057,53 @@ class ReadingDAO:
             traceback.print_exc()
             return False
 
+    @staticmethod
+    def list_missing_fortune(date, limit=5000):
+        """列出某天已抽牌（登录用户）但还没有运势数据的记录，夜间批量预计算用"""
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT r.user_id, r.date, r.card_id, r.direction, c.name AS card_name
+                    FROM readings r
+                    JOIN tarot_cards c ON r.card_id = c.id
+                    WHERE r.date = %s
+                      AND r.user_id IS NOT NULL
+                      AND r.fortune_data IS NULL
+                    ORDER BY r.user_id
+                    LIMIT %s
+                """, (date, limit))
+                return cursor.fetchall()
+
+    @staticmethod
+    def update_fortunes_many(date, fortunes):
+        """
+        批量写入运势数据：fortunes 为 [(user_id, fortune_data)]，只写仍为空的记录（不覆盖期间已生成的）
+        返回实际写入的行数（重跑 / 并发预计算时已有运势的记录不计）
+        """
+        if not fortunes:
+            return 0
+        saved = 0
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                # 每 500 条一条 UPDATE ... FROM unnest(...)，rowcount 即本批实际更新的行数
+                for i in range(0, len(fortunes), 500):
+                    page = fortunes[i:i + 500]
+                    cursor.execute("""
+                        UPDATE readings r
+                        SET fortune_data = v.data::jsonb,
+                            fortune_generated_at = CURRENT_TIMESTAMP
+                        FROM unnest(%s, %s) AS v(user_id, data)
+                        WHERE r.user_id = v.user_id AND r.date = %s
+                          AND r.fortune_data IS NULL
+                    """, (
+                        [user_id for user_id, _ in page],
+                        [json.dumps(data, ensure_ascii=False) for _, data in page],
+                        date
+                    ))
+                    saved += cursor.rowcount
+                conn.commit()
+                return saved
+
     @staticmethod
     def get_fortune(user_id, date):
         """获取运势数据"""
@@ -866,6 +1218,19 @@ class CardDAO:
                 """, (card_id,))
                 return cursor.fetchone()
 
+    @staticmethod
+    def get_many_with_energy(card_ids):
+        """批量获取塔罗牌完整信息，返回 {id: row}"""
+        if not card_ids:
+            return {}
+        with DatabaseManager.get_db() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT * FROM tarot_cards WHERE id = ANY(%s)",
+                    (list(card_ids),)
+                )
+                return {row["id"]: row for row in cursor.fetchall()}
+
 
 # =========================
 #  Daily Bulletin DAO
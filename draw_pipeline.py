@@ -0,0 +1,135 @@
+"""
+抽牌后台流水线（每日一牌）
+/draw 写入抽牌记录后立即在后台并发启动「今日解读」与「运势」两个生成任务，
+/result 与 /api/fortune/<date> 先看结果是否已就绪，未就绪时在有界时间内等待进行中的任务，
+首次打开页面不必从零开始等 LLM。
+- 任务按 (用户键, 日期, 类型) 去重：同一用户同一天同类任务只跑一个
+- 任务函数由调用方传入（app.py 负责落库 / 拍平等细节），本模块只管调度与等待
+- 结果在进程内保留 DRAW_PIPELINE_RETENTION 秒：访客的结果无法在后台写入会话，
+  由随后的请求取走后写回会话；登录用户的结果任务内已落库
+- 任务只存在于当前进程：请求落到别的实例时 wait() 返回 None，调用方按原来的同步路径生成
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+DRAW_PIPELINE_ENABLED = os.getenv("DRAW_PIPELINE_ENABLED", "1") in ("1", "true", "True")
+DRAW_PIPELINE_WORKERS = int(os.getenv("DRAW_PIPELINE_WORKERS", "4"))
+# 页面等待进行中任务的上限（秒），超时后页面先用默认文案，结果就绪后下次访问即可看到
+DRAW_PIPELINE_WAIT = float(os.getenv("DRAW_PIPELINE_WAIT", "20"))
+DRAW_PIPELINE_RETENTION = int(os.getenv("DRAW_PIPELINE_RETENTION", "600"))
+
+INSIGHT = "insight"
+FORTUNE = "fortune"
+
+_EXECUTOR = None
+_LOCK = threading.Lock()
+_JOBS = {}  # (user_key, day, kind) -> (started_at, Future)
+_STATS = {"started": 0, "deduped": 0, "ready": 0, "waited": 0, "timeouts": 0, "missing": 0, "failed": 0}
+
+
+def _get_executor():
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(1, DRAW_PIPELINE_WORKERS),
+                    thread_name_prefix="draw-pipeline"
+                )
+    return _EXECUTOR
+
+
+def _prune(now):
+    """调用方持有 _LOCK：丢弃超过保留期的已完成任务"""
+    for key in [k for k, (t, f) in _JOBS.items() if f.done() and now - t > DRAW_PIPELINE_RETENTION]:
+        _JOBS.pop(key, None)
+
+
+def start(user_key, day, jobs):
+    """
+    jobs：{kind: 无参函数}；同一 (user_key, day, kind) 已有任务时跳过
+    返回实际提交的任务类型列表
+    """
+    if not DRAW_PIPELINE_ENABLED or not user_key:
+        return []
+    submitted = []
+    now = time.monotonic()
+    executor = _get_executor()
+    with _LOCK:
+        _prune(now)
+        for kind, fn in jobs.items():
+            key = (str(user_key), str(day), kind)
+            if key in _JOBS:
+                _STATS["deduped"] += 1
+                continue
+            try:
+                future = executor.submit(_run, kind, fn)
+            except RuntimeError:
+                # 解释器退出时线程池已关闭
+                break
+            _JOBS[key] = (now, future)
+            _STATS["started"] += 1
+            submitted.append(kind)
+    return submitted
+
+
+def _run(kind, fn):
+    try:
+        return fn()
+    except Exception as e:
+        print(f"[draw_pipeline] {kind} failed: {e}")
+        with _LOCK:
+            _STATS["failed"] += 1
+        return None
+
+
+def pending(user_key, day, kind):
+    with _LOCK:
+        job = _JOBS.get((str(user_key), str(day), kind))
+    return job is not None and not job[1].done()
+
+
+def wait(user_key, day, kind, timeout=None, consume=True):
+    """
+    取任务结果：已完成立即返回；进行中最多等 timeout 秒（默认 DRAW_PIPELINE_WAIT）
+    没有任务 / 超时 / 任务失败时返回 None；consume=True 时取到结果后移除任务
+    """
+    key = (str(user_key), str(day), kind)
+    with _LOCK:
+        job = _JOBS.get(key)
+    if job is None:
+        with _LOCK:
+            _STATS["missing"] += 1
+        return None
+
+    future = job[1]
+    was_done = future.done()
+    try:
+        result = future.result(timeout=DRAW_PIPELINE_WAIT if timeout is None else timeout)
+    except FutureTimeout:
+        with _LOCK:
+            _STATS["timeouts"] += 1
+        return None
+
+    with _LOCK:
+        _STATS["ready" if was_done else "waited"] += 1
+        if consume and result is not None and _JOBS.get(key) is job:
+            _JOBS.pop(key, None)
+    return result
+
+
+def discard(user_key, day):
+    """重新抽牌等场景：丢弃该用户当天的任务结果（进行中的任务不会被中断）"""
+    with _LOCK:
+        for key in [k for k in _JOBS if k[0] == str(user_key) and k[1] == str(day)]:
+            _JOBS.pop(key, None)
+
+
+def stats():
+    with _LOCK:
+        s = dict(_STATS)
+        s["jobs"] = len(_JOBS)
+        s["pending"] = sum(1 for _, f in _JOBS.values() if not f.done())
+    return s
@@ -0,0 +1,257 @@
+"""
+运势批量计算（夜间预计算用）
+与 FortuneService._calculate_scores / _scores_to_stars / _generate_lucky_elements 逐位一致：
+两者都按 md5 种子初始化 random.Random（MT19937）。这里用 NumPy 把 N 个用户的 MT19937
+初始化（init_by_array）与前若干个输出一次性向量化算出，再按 CPython 的 random() /
+getrandbits() / _randbelow() 规则取数，结果与逐个调用标量路径完全相同。
+
+NumPy 已列入 requirements.txt（线上走向量化路径）；本地未安装时退回逐个调用标量路径（结果相同，只是慢）。
+本模块只在夜间批量任务里按需导入，不计入请求的冷启动。
+首次使用时会用合成样本与标量路径比对一次，不一致（如 CPython 改了取数规则）时也退回标量路径。
+"""
+import hashlib
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+N_DIMENSIONS = 5
+# 每个用户预先生成的 MT 输出个数：分数 5 个 double 用 10 个，幸运元素 4 次拒绝采样通常不超过 10 个
+WORDS = 64
+
+_N = 624
+_M = 397
+_MASK32 = 0xFFFFFFFF
+
+_engine_ok = None
+
+
+def md5_seed(seed_str):
+    """与标量路径相同的种子：md5 前 8 位十六进制"""
+    return int(hashlib.md5(seed_str.encode()).hexdigest()[:8], 16)
+
+
+def score_seed(direction, date, user_id):
+    return md5_seed(f"{direction}{date}{user_id or 'guest'}")
+
+
+def lucky_seed(element, date, user_id):
+    return md5_seed(f"{element}{date}{user_id or 'guest'}_lucky")
+
+
+# ---------- 向量化 MT19937 ----------
+
+def _init_genrand_base():
+    mt = [0] * _N
+    mt[0] = 19650218
+    for i in range(1, _N):
+        mt[i] = (1812433253 * (mt[i - 1] ^ (mt[i - 1] >> 30)) + i) & _MASK32
+    return mt
+
+
+_BASE = None
+
+
+def _mt_words(seeds, count=WORDS):
+    """
+    seeds：N 个 32 位种子（random.Random(seed) 的种子，seed < 2**32）
+    返回 (N, count) 的 uint64 数组：每行是该种子 MT19937 的前 count 个 32 位输出
+    状态按 uint32 存放，乘加自然按 2**32 回绕，免去逐步取模；中间结果写入预分配缓冲区
+    """
+    global _BASE
+    if _BASE is None:
+        _BASE = np.array(_init_genrand_base(), dtype=np.uint32)
+    assert count <= _N - _M
+
+    key = np.asarray(seeds, dtype=np.uint32)
+    mt = np.repeat(_BASE[:, None], len(key), axis=1)  # (624, N)
+    tmp = np.empty(len(key), dtype=np.uint32)
+
+    def mix(i, mult):
+        prev = mt[i - 1]
+        np.right_shift(prev, 30, out=tmp)
+        np.bitwise_xor(tmp, prev, out=tmp)
+        np.multiply(tmp, np.uint32(mult), out=tmp)
+        np.bitwise_xor(mt[i], tmp, out=mt[i])
+
+    # init_by_array(key=[seed])：key 长度为 1，j 恒为 0
+    i = 1
+    for _ in range(_N):
+        mix(i, 1664525)
+        np.add(mt[i], key, out=mt[i])
+        i += 1
+        if i >= _N:
+            mt[0] = mt[_N - 1]
+            i = 1
+    for _ in range(_N - 1):
+        mix(i, 1566083941)
+        np.subtract(mt[i], np.uint32(i), out=mt[i])
+        i += 1
+        if i >= _N:
+            mt[0] = mt[_N - 1]
+            i = 1
+    mt[0] = 0x80000000
+
+    # 第一次 twist 的前 count 个（count <= 227 时只依赖旧状态，可整体向量化）
+    y = (mt[:count] & np.uint32(0x80000000)) | (mt[1:count + 1] & np.uint32(0x7FFFFFFF))
+    out = mt[_M:_M + count] ^ (y >> 1) ^ np.where(y & 1, np.uint32(0x9908B0DF), np.uint32(0))
+    # tempering
+    out ^= out >> 11
+    out ^= (out << 7) & np.uint32(0x9D2C5680)
+    out ^= (out << 15) & np.uint32(0xEFC60000)
+    out ^= out >> 18
+    return out.T.astype(np.uint64)
+
+
+def _doubles(words, start, n):
+    """random.random()：每个 double 用两个 32 位输出（高 27 位 + 高 26 位）"""
+    a = (words[:, start:start + 2 * n:2] >> 5).astype(np.float64)
+    b = (words[:, start + 1:start + 2 * n:2] >> 6).astype(np.float64)
+    return (a * 67108864.0 + b) * (1.0 / 9007199254740992.0)
+
+
+def _randbelow(words, pos, n):
+    """
+    random._randbelow_with_getrandbits(n)：取 k = n.bit_length() 位，>= n 时重取
+    pos：每行下一个可用输出的下标（原地推进）；返回 (值数组, 取数越界的行掩码)
+    """
+    k = int(n).bit_length()
+    rows = np.arange(words.shape[0])
+    result = np.zeros(words.shape[0], dtype=np.int64)
+    pending = np.ones(words.shape[0], dtype=bool)
+    overflow = np.zeros(words.shape[0], dtype=bool)
+    while pending.any():
+        overflow |= pending & (pos >= words.shape[1])
+        pending &= ~overflow
+        idx = rows[pending]
+        if not len(idx):
+            break
+        r = (words[idx, pos[idx]] >> (32 - k)).astype(np.int64)
+        pos[idx] += 1
+        ok = r < n
+        result[idx[ok]] = r[ok]
+        pending[idx[ok]] = False
+    return result, overflow
+
+
+# ---------- 与标量路径对应的批量计算 ----------
+
+def _np_scores(base_energies, directions, dates, user_ids):
+    seeds = [score_seed(d, dt, u) for d, dt, u in zip(directions, dates, user_ids)]
+    flux = 0.95 + _doubles(_mt_words(seeds, 2 * N_DIMENSIONS), 0, N_DIMENSIONS) * 0.2
+    modifier = np.array([1.2 if d == "正位" else 0.8 for d in directions], dtype=np.float64)
+    # 与标量路径相同的运算顺序：base * modifier * flux
+    raw = np.asarray(base_energies, dtype=np.float64) * modifier[:, None] * flux
+    return np.clip(np.trunc(raw), 0, 100).astype(np.int64).tolist()
+
+
+def _np_lucky(elements, dates, user_ids, colors_by_element, hours, compass):
+    seeds = [lucky_seed(e, dt, u) for e, dt, u in zip(elements, dates, user_ids)]
+    words = _mt_words(seeds)
+    pos = np.zeros(len(seeds), dtype=np.int64)
+    palettes = [colors_by_element.get(e, ["紫色", "白色"]) for e in elements]
+
+    # 颜色候选数可能不同（未知元素只有 2 个），按候选数分组取数
+    color_idx = np.zeros(len(seeds), dtype=np.int64)
+    overflow = np.zeros(len(seeds), dtype=bool)
+    sizes = np.array([len(p) for p in palettes])
+    for n in np.unique(sizes):
+        rows = np.where(sizes == n)[0]
+        sub_pos = pos[rows]
+        vals, of = _randbelow(words[rows], sub_pos, int(n))
+        pos[rows] = sub_pos
+        color_idx[rows] = vals
+        overflow[rows] |= of
+
+    number, of1 = _randbelow(words, pos, 9)
+    hour_idx, of2 = _randbelow(words, pos, len(hours))
+    dir_idx, of3 = _randbelow(words, pos, len(compass))
+    overflow |= of1 | of2 | of3
+
+    result = []
+    for r in range(len(seeds)):
+        if overflow[r]:
+            result.append(None)  # 预生成的输出不够用，由调用方按标量路径重算
+            continue
+        result.append({
+            "color": palettes[r][int(color_idx[r])],
+            "number": int(number[r]) + 1,
+            "hour": hours[int(hour_idx[r])],
+            "direction": compass[int(dir_idx[r])],
+        })
+    return result
+
+
+def batch_scores(base_energies, directions, dates, user_ids):
+    """base_energies: N×5；返回 N×5 的 int 列表，与 FortuneService._calculate_scores 逐行一致"""
+    from services import FortuneService
+    if not base_energies:
+        return []
+    if _use_numpy():
+        return _np_scores(base_energies, directions, dates, user_ids)
+    return [FortuneService._calculate_scores(list(b), d, dt, u)
+            for b, d, dt, u in zip(base_energies, directions, dates, user_ids)]
+
+
+def batch_stars(scores):
+    """FortuneService._scores_to_stars 的向量化版本"""
+    from services import FortuneService
+    if np is None or not scores:
+        return [FortuneService._scores_to_stars(row) for row in scores]
+    s = np.asarray(scores)
+    thresholds = [90, 80, 70, 60, 50, 40, 30, 20, 10]
+    stars = [5.0, 4.5, 4.0, 3.5, 3.0, 2.5, 2.0, 1.5, 1.0]
+    return np.select([s >= t for t in thresholds], stars, default=0.5).tolist()
+
+
+def batch_lucky(elements, dates, user_ids):
+    """与 FortuneService._generate_lucky_elements 逐行一致：choice(颜色) → randint(1, 9) → choice(时辰) → choice(方位)"""
+    from services import FortuneService
+    if not elements:
+        return []
+    if not _use_numpy():
+        return [FortuneService._generate_lucky_elements(e, dt, u)
+                for e, dt, u in zip(elements, dates, user_ids)]
+    result = _np_lucky(elements, dates, user_ids, FortuneService.ELEMENT_COLORS,
+                       FortuneService.LUCKY_HOURS, FortuneService.LUCKY_DIRECTIONS)
+    return [
+        r if r is not None else FortuneService._generate_lucky_elements(elements[i], dates[i], user_ids[i])
+        for i, r in enumerate(result)
+    ]
+
+
+def _use_numpy():
+    """NumPy 可用且抽样结果与标量路径一致"""
+    global _engine_ok
+    if np is None:
+        return False
+    if _engine_ok is None:
+        try:
+            _engine_ok = _self_check()
+        except Exception as e:
+            print(f"[fortune_batch] self check failed: {e}")
+            _engine_ok = False
+        if not _engine_ok:
+            print("[fortune_batch] 向量化结果与标量路径不一致，改用逐个计算")
+    return _engine_ok
+
+
+def _self_check():
+    """用一组合成样本比对向量化与标量路径（分数 + 幸运元素）"""
+    from datetime import date
+    from services import FortuneService
+    elements = list(FortuneService.ELEMENT_COLORS) + ["未知"]
+    bases = [[40 + i * 7 % 60, 55, 70 - i, 30 + i, 90] for i in range(16)]
+    dirs = ["正位" if i % 2 else "逆位" for i in range(16)]
+    dates = [date(2025, 1 + i % 12, 1 + i % 28) for i in range(16)]
+    users = [None] + [f"user-{i}" for i in range(1, 16)]
+    elems = [elements[i % len(elements)] for i in range(16)]
+
+    expected = [FortuneService._calculate_scores(b, d, dt, u) for b, d, dt, u in zip(bases, dirs, dates, users)]
+    if _np_scores(bases, dirs, dates, users) != expected:
+        return False
+    expected = [FortuneService._generate_lucky_elements(e, dt, u) for e, dt, u in zip(elems, dates, users)]
+    got = _np_lucky(elems, dates, users, FortuneService.ELEMENT_COLORS,
+                    FortuneService.LUCKY_HOURS, FortuneService.LUCKY_DIRECTIONS)
+    return all(g is None or g == e for g, e in zip(got, expected))
@@ -0,0 +1,171 @@
+"""
+运势文案缓存（按量化后的运势画像复用 Dify 文案）
+FortuneService.generate_fortune_text 的输出（总评 / 各维度建议 / 宜 / 忌）主要取决于：
+牌名、正逆位、五维星级、总评标签、元素与特殊事件，与具体用户无关。因此：
+- 键 = sha256(画像版本 + 规范化画像)；分数只取星级（已按 0.5 星量化），幸运元素与原始总分不参与。
+  为保证复用的文案不与其他用户的幸运元素矛盾，可缓存画像调用 Dify 时提示词与入参里也不带这些字段
+  （见 FortuneService.generate_fortune_text）
+- 每个画像最多 FORTUNE_TEXT_VARIANTS 个版本：按 (用户, 日期, 画像) 哈希分到某个槽位，
+  槽位已有文案即命中，空槽位才实时调用 Dify 并回填，避免同画像的所有人看到同一段话
+- 两级存储：进程内 LRU（FORTUNE_TEXT_CACHE_SIZE 条）+ fortune_text_cache 表（按 last_used_at 淘汰）
+- 只缓存 Dify 的有效输出；兜底的默认文案不入缓存
+- stats() 提供命中率（进程内 / 库表 / 未命中），由 /internal/fortune/text-cache-metrics 输出
+"""
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import Config
+
+# 画像字段或提示词变化时递增，旧缓存自然不再命中
+PROFILE_VERSION = 2
+# 只缓存与画像相关的字段；lucky_* 每人不同，由 fortune_data 本身提供
+TEXT_FIELDS = ("summary", "dimension_advice", "do", "dont")
+# 每写入这么多条检查一次库表行数上限
+EVICT_EVERY = 200
+
+_LOCK = threading.Lock()
+_LRU = OrderedDict()  # (profile_key, variant) -> text
+_STATS = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+_writes_since_evict = 0
+
+
+def profile(fortune_data):
+    """规范化画像；维度不是列表（已拍平的数据）时返回 None，不参与缓存"""
+    dims = fortune_data.get("dimensions")
+    if not isinstance(dims, list) or not dims:
+        return None
+    return {
+        "card": fortune_data.get("card_name"),
+        "direction": fortune_data.get("direction"),
+        "stars": [[d.get("name"), float(d.get("stars") or 0)] for d in dims],
+        "label": fortune_data.get("overall_label"),
+        "element": fortune_data.get("element"),
+        "events": sorted(fortune_data.get("special_events") or []),
+    }
+
+
+def profile_key(prof):
+    raw = json.dumps({"v": PROFILE_VERSION, "p": prof}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def variant_for(key, user_ref, day):
+    """同一用户同一天稳定落在同一个版本；不同用户分散到各版本"""
+    n = max(1, Config.FORTUNE_TEXT_VARIANTS)
+    h = hashlib.md5(f"{key}:{user_ref or 'guest'}:{day}".encode("utf-8")).hexdigest()
+    return int(h[:8], 16) % n
+
+
+def _day_of(fortune_data):
+    return str(fortune_data.get("generated_at") or "")[:10]
+
+
+def slot(fortune_data, user_ref=None):
+    """返回 (profile, profile_key, variant)；不可缓存时返回 None"""
+    if not Config.FORTUNE_TEXT_CACHE_ENABLED:
+        return None
+    prof = profile(fortune_data)
+    if prof is None:
+        return None
+    key = profile_key(prof)
+    return prof, key, variant_for(key, user_ref, _day_of(fortune_data))
+
+
+def cacheable(fortune_data):
+    """该运势数据的文案是否走缓存（生成文案时据此去掉因人而异的字段）"""
+    return slot(fortune_data) is not None
+
+
+def lookup(fortune_data, user_ref=None):
+    """命中返回文案 dict（副本），未命中返回 None"""
+    from database import FortuneTextCacheDAO
+
+    s = slot(fortune_data, user_ref)
+    if s is None:
+        return None
+    _, key, variant = s
+    with _LOCK:
+        text = _LRU.get((key, variant))
+        if text is not None:
+            _LRU.move_to_end((key, variant))
+            _STATS["memory_hits"] += 1
+            return copy.deepcopy(text)
+
+    try:
+        text = FortuneTextCacheDAO.get(key, variant)
+    except Exception as e:
+        print(f"[fortune_text_cache] get failed: {e}")
+        text = None
+        with _LOCK:
+            _STATS["errors"] += 1
+
+    with _LOCK:
+        if text is None:
+            _STATS["misses"] += 1
+            return None
+        _STATS["db_hits"] += 1
+        _remember(key, variant, text)
+    return copy.deepcopy(text)
+
+
+def store(fortune_data, text, user_ref=None):
+    """回填 Dify 的有效输出（只保留 TEXT_FIELDS）"""
+    from database import FortuneTextCacheDAO
+    global _writes_since_evict
+
+    s = slot(fortune_data, user_ref)
+    if s is None or not isinstance(text, dict):
+        return
+    prof, key, variant = s
+    text = {k: text[k] for k in TEXT_FIELDS if k in text}
+
+    with _LOCK:
+        _remember(key, variant, text)
+        _STATS["stores"] += 1
+        _writes_since_evict += 1
+        evict = _writes_since_evict >= EVICT_EVERY
+        if evict:
+            _writes_since_evict = 0
+
+    try:
+        FortuneTextCacheDAO.put(key, variant, prof, text)
+        if evict:
+            deleted = FortuneTextCacheDAO.evict_lru(Config.FORTUNE_TEXT_CACHE_MAX_ROWS)
+            with _LOCK:
+                _STATS["evictions"] += deleted
+    except Exception as e:
+        print(f"[fortune_text_cache] put failed: {e}")
+        with _LOCK:
+            _STATS["errors"] += 1
+
+
+def _remember(key, variant, text):
+    """调用方持有 _LOCK"""
+    _LRU[(key, variant)] = copy.deepcopy(text)
+    _LRU.move_to_end((key, variant))
+    while len(_LRU) > Config.FORTUNE_TEXT_CACHE_SIZE:
+        _LRU.popitem(last=False)
+
+
+def stats():
+    with _LOCK:
+        s = dict(_STATS)
+        s["memory_entries"] = len(_LRU)
+    lookups = s["memory_hits"] + s["db_hits"] + s["misses"]
+    s["lookups"] = lookups
+    s["hit_rate"] = round((s["memory_hits"] + s["db_hits"]) / lookups, 4) if lookups else None
+    s["variants"] = Config.FORTUNE_TEXT_VARIANTS
+    return s
+
+
+def clear():
+    """清空进程内缓存与计数（库表不动）"""
+    global _writes_since_evict
+    with _LOCK:
+        _LRU.clear()
+        for k in _STATS:
+            _STATS[k] = 0
+        _writes_since_evict = 0
@@ -0,0 +1,94 @@
+"""
+塔罗牌面响应式图片（运行时部分）
+build_images.py 为 static/images/tarot/ 下的牌面生成按宽度分档的 WebP / AVIF，
+这里读取其 index.json，提供模板函数：
+- card_picture(src, alt, sizes, attrs)：输出 <picture>，AVIF / WebP 带 srcset，原 JPEG 兜底
+牌面不在索引中（外链 / 未构建）时原样输出 <img>
+"""
+import os
+import re
+import json
+import threading
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+TAROT_DIR = "images/tarot"
+DERIVED_DIR = f"{TAROT_DIR}/derived"
+INDEX_NAME = "index.json"
+
+_CARD_RE = re.compile(r"images/tarot/([^/?#]+)\.(?:jpe?g|png)(?:[?#].*)?$", re.IGNORECASE)
+
+_LOCK = threading.Lock()
+_STATE = {"static_folder": None, "index": None}
+
+
+def derived_name(stem, width, fmt):
+    return f"{DERIVED_DIR}/{stem}-{width}.{fmt}"
+
+
+def get_index():
+    index = _STATE["index"]
+    if index is None:
+        with _LOCK:
+            if _STATE["index"] is None:
+                path = os.path.join(_STATE["static_folder"] or "", DERIVED_DIR, INDEX_NAME)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        _STATE["index"] = json.load(f)
+                except (OSError, ValueError):
+                    _STATE["index"] = {"cards": {}}
+            index = _STATE["index"]
+    return index
+
+
+def card_stem(src):
+    """/static/images/tarot/00_fool.jpg、images/tarot/00_fool.jpg → 00_fool；外链返回 None"""
+    if not src or re.match(r"^(https?:)?//", src):
+        return None
+    m = _CARD_RE.search(src)
+    return m.group(1) if m else None
+
+
+def _attrs_html(attrs):
+    parts = []
+    for key, value in (attrs or {}).items():
+        if value is None or value is False:
+            continue
+        if value is True:
+            parts.append(f" {escape(key)}")
+        else:
+            parts.append(f' {escape(key)}="{escape(value)}"')
+    return "".join(parts)
+
+
+def card_picture(src, alt="", sizes="(max-width: 480px) 80vw, 300px", attrs=None):
+    """牌面 <picture>；attrs 为 <img> 上的其他属性（id / class / onerror ...）"""
+    img_attrs = {"src": src, "alt": alt, "loading": "lazy", "decoding": "async"}
+    img_attrs.update(attrs or {})
+
+    stem = card_stem(src)
+    card = get_index()["cards"].get(stem) if stem else None
+    if not card:
+        return Markup(f"<img{_attrs_html(img_attrs)}>")
+
+    img_attrs.setdefault("width", card["w"])
+    img_attrs.setdefault("height", card["h"])
+    sources = []
+    for fmt in ("avif", "webp"):
+        widths = sorted(int(w) for w in card.get(fmt, {}))
+        if not widths:
+            continue
+        srcset = ", ".join(
+            f"{url_for('static', filename=derived_name(stem, w, fmt))} {w}w" for w in widths
+        )
+        sources.append(
+            f'<source type="image/{fmt}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+        )
+    return Markup(f"<picture>{''.join(sources)}<img{_attrs_html(img_attrs)}></picture>")
+
+
+def init_app(app):
+    _STATE["static_folder"] = app.static_folder
+    _STATE["index"] = None
+    app.add_template_global(card_picture)
@@ -0,0 +1,91 @@
+"""
+牌面图片体积对比：原 JPEG vs WebP / AVIF 派生图（按页面统计）
+
+读取 build_images.py 生成的 derived/index.json，按各页面实际展示尺寸（默认 2x 屏）
+估算浏览器会从 srcset 中选到的档位，输出每页牌面图片的传输字节数与节省比例。
+
+用法（先执行 python build_images.py）：
+    python image_savings.py
+    python image_savings.py --dpr 3 --json
+"""
+import argparse
+import json
+import os
+
+from image_assets import DERIVED_DIR, INDEX_NAME
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# 页面 → (展示宽度 CSS px, 牌数)
+PAGES = {
+    "result（单牌结果页）": (300, 1),
+    "result 移动端": (200, 1),
+    "spread_chat 三张牌阵": (62, 3),
+    "spread_chat 十张牌阵（凯尔特十字）": (62, 10),
+}
+
+
+def _pick(widths, needed):
+    """与浏览器 srcset 选择一致：取不小于所需像素的最小档，都不够时取最大档"""
+    ordered = sorted(widths)
+    for w in ordered:
+        if w >= needed:
+            return w
+    return ordered[-1]
+
+
+def _avg(values):
+    values = list(values)
+    return sum(values) / len(values) if values else 0
+
+
+def measure(index, dpr):
+    cards = index["cards"]
+    report = {"dpr": dpr, "cards": len(cards), "pages": {}}
+
+    for page, (css_width, count) in PAGES.items():
+        needed = css_width * dpr
+        row = {"css_width": css_width, "cards": count, "jpg": round(_avg(c["jpg"] for c in cards.values()) * count)}
+        for fmt in ("webp", "avif"):
+            sizes = [
+                c[fmt][str(_pick([int(w) for w in c[fmt]], needed))]
+                for c in cards.values() if c.get(fmt)
+            ]
+            if sizes:
+                row[fmt] = round(_avg(sizes) * count)
+        best = min(v for k, v in row.items() if k in ("webp", "avif"))
+        row["best"] = best
+        row["saved_pct"] = round((1 - best / row["jpg"]) * 100, 1) if row["jpg"] else 0.0
+        report["pages"][page] = row
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="牌面图片派生格式的体积对比")
+    parser.add_argument("--dpr", type=float, default=2, help="设备像素比（默认 2）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    path = os.path.join(STATIC_DIR, DERIVED_DIR, INDEX_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        print(f"未找到 {path}，请先执行 python build_images.py")
+        raise SystemExit(1)
+
+    report = measure(index, args.dpr)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{report['cards']} 张牌，DPR {args.dpr}")
+    print(f"{'页面':<28}{'JPEG':>10}{'WebP':>10}{'AVIF':>10}{'节省':>8}")
+    for page, row in report["pages"].items():
+        cols = [row.get(k) for k in ("jpg", "webp", "avif")]
+        cells = "".join(f"{(str(round(v / 1024, 1)) + 'KB') if v else '-':>10}" for v in cols)
+        print(f"{page:<28}{cells}{row['saved_pct']:>7}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+冷启动导入耗时分析（python -X importtime 的自动化版本）
+
+在全新的 Python 进程里执行 import app，解析 -X importtime 输出，给出：
+  - import app 总耗时（多次取中位数）
+  - app 直接导入的各模块累计耗时（含其子依赖），按耗时排序
+  - 本应延迟到首次使用才导入的重量级依赖（Playwright / Pillow / qrcode / authlib）是否被提前导入
+
+冷启动预算：import app ≤ 900 ms（-X importtime 下的中位数；环境变量 IMPORT_BUDGET_MS 可改默认值）。
+--max-ms N 按 N 毫秒断言（等价于 --check --budget-ms N），--check 按默认预算断言；
+超出预算或重量级依赖被提前导入时退出码为 1，可放进部署前检查：
+    python import_profile.py
+    python import_profile.py --runs 5 --top 15 --json
+    python import_profile.py --max-ms 900
+
+不需要可连接的数据库，但 DATABASE_URL 等必填配置需有值。
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 冷启动预算（-X importtime 自身有开销，数值比实际导入略高）
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "900"))
+# 只应在首次使用时导入的顶层包
+DEFERRED_MODULES = ("playwright", "PIL", "qrcode", "authlib")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _run_importtime(target):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} 失败：\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append({"name": name, "self_us": int(self_us), "cum_us": int(cum_us),
+                         "depth": len(indent) // 2})
+    return rows
+
+
+def _direct_children(rows, target):
+    """-X importtime 按完成顺序输出，子模块在父模块之前；取 target 之前、深度为 target 深度 + 1 的行"""
+    idx = next((i for i in range(len(rows) - 1, -1, -1) if rows[i]["name"] == target), None)
+    if idx is None:
+        return None, []
+    parent = rows[idx]
+    children = []
+    for row in reversed(rows[:idx]):
+        if row["depth"] <= parent["depth"]:
+            break
+        if row["depth"] == parent["depth"] + 1:
+            children.append(row)
+    return parent, children
+
+
+def profile(target="app", runs=3):
+    totals, per_module, deferred = [], {}, set()
+    for _ in range(runs):
+        rows = _run_importtime(target)
+        parent, children = _direct_children(rows, target)
+        if parent is None:
+            raise RuntimeError(f"未在 importtime 输出中找到 {target}")
+        totals.append(parent["cum_us"] / 1000)
+        for row in children:
+            per_module.setdefault(row["name"], []).append(row["cum_us"] / 1000)
+        deferred.update(
+            r["name"] for r in rows if r["name"].split(".")[0] in DEFERRED_MODULES
+        )
+
+    modules = sorted(
+        ({"module": k, "cum_ms": round(statistics.median(v), 1)} for k, v in per_module.items()),
+        key=lambda r: r["cum_ms"], reverse=True
+    )
+    return {
+        "target": target,
+        "runs": runs,
+        "total_ms": round(statistics.median(totals), 1),
+        "self_ms": round(statistics.median(totals) - sum(m["cum_ms"] for m in modules), 1),
+        "modules": modules,
+        "deferred_imported": sorted({n.split(".")[0] for n in deferred}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py 冷启动导入耗时分析")
+    parser.add_argument("--target", default="app", help="要分析的模块（默认 app）")
+    parser.add_argument("--runs", type=int, default=3, help="新进程次数，取中位数")
+    parser.add_argument("--top", type=int, default=20, help="输出耗时最高的前 N 个直接依赖")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="冷启动预算（毫秒）")
+    parser.add_argument("--check", action="store_true", help="超出预算或重量级依赖被提前导入时退出码为 1")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="按该预算断言（毫秒），超出时退出码为 1；等价于 --check --budget-ms")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+    if args.max_ms is not None:
+        args.budget_ms, args.check = args.max_ms, True
+
+    report = profile(args.target, args.runs)
+    report["budget_ms"] = args.budget_ms
+    report["modules"] = report["modules"][:args.top]
+    failures = []
+    if report["total_ms"] > args.budget_ms:
+        failures.append(f"import {args.target} {report['total_ms']} ms 超出预算 {args.budget_ms} ms")
+    if report["deferred_imported"]:
+        failures.append(f"启动时导入了应延迟加载的依赖：{', '.join(report['deferred_imported'])}")
+    report["ok"] = not failures
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"import {args.target}：{report['total_ms']} ms（{args.runs} 次中位数，预算 {args.budget_ms} ms）")
+        print(f"  模块自身执行 {report['self_ms']} ms")
+        for m in report["modules"]:
+            print(f"  {m['cum_ms']:>8.1f} ms  {m['module']}")
+        for f in failures:
+            print(f"[FAIL] {f}")
+
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
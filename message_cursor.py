@@ -0,0 +1,63 @@
+"""
+消息历史的 keyset 游标（chat_messages / spread_messages / adventure_run_messages 共用）
+游标 = 最后一条（或第一条）消息的 (created_at, id)，编码为 URL 安全的不透明字符串：
+- 增量拉取：WHERE (created_at, id) > 游标，只返回新消息，与历史长度无关
+- 向前翻页：WHERE (created_at, id) < 游标，倒序取一页再翻转
+- 同一时间戳的多条消息按 id 区分，不会漏读 / 重读
+"""
+import base64
+from datetime import datetime
+
+
+def encode(row):
+    """由消息行（含 created_at / id）生成游标；缺字段时返回 None"""
+    if not row or row.get("created_at") is None or row.get("id") is None:
+        return None
+    ts = row["created_at"]
+    ts = ts.isoformat() if isinstance(ts, datetime) else str(ts)
+    raw = f"{ts}|{row['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode(cursor):
+    """
+    游标 -> (created_at, id)；空游标返回 None
+    格式不对时抛 ValueError（接口层返回 400）
+    """
+    if not cursor:
+        return None
+    try:
+        s = str(cursor)
+        raw = base64.urlsafe_b64decode(s + "=" * (-len(s) % 4)).decode("utf-8")
+        ts, _, msg_id = raw.partition("|")
+        created_at = datetime.fromisoformat(ts)
+    except Exception:
+        raise ValueError("bad cursor")
+    if not msg_id:
+        raise ValueError("bad cursor")
+    return created_at, msg_id
+
+
+def page(rows, limit):
+    """
+    DAO 多取一条判断 has_more；返回 (本页行, has_more)
+    rows 已是本页方向上的顺序
+    """
+    rows = list(rows or [])
+    return rows[:limit], len(rows) > limit
+
+
+def payload(rows, has_more, cursor=None, fields=("role", "content")):
+    """
+    统一的分页返回体：
+      messages     按时间升序，只含 fields
+      next_cursor  最后一条的游标（下次增量拉取用；本页为空时沿用传入的游标）
+      prev_cursor  第一条的游标（继续向前翻页用）
+      has_more     该方向上是否还有更多
+    """
+    return {
+        "messages": [{k: r.get(k) for k in fields} for r in rows],
+        "next_cursor": encode(rows[-1]) if rows else (cursor or None),
+        "prev_cursor": encode(rows[0]) if rows else None,
+        "has_more": has_more
+    }
@@ -0,0 +1,31 @@
+-- ========================================
+-- 世界异步生成任务
+-- 世界创建改为后台任务：先生成骨架，再并行生成地点网格 / NPC / 任务
+-- 创建时间：2025-12-01
+-- ========================================
+
+-- 世界生成状态：pending(排队) → generating(骨架已写入) → playable(起始地点就绪) → ready / failed
+ALTER TABLE adventure_worlds
+ADD COLUMN IF NOT EXISTS generation_status VARCHAR(20) DEFAULT 'ready';
+
+CREATE TABLE IF NOT EXISTS world_generation_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    world_id VARCHAR(36) REFERENCES adventure_worlds(id) ON DELETE CASCADE,
+    user_id VARCHAR(50),
+
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending/running/playable/done/failed
+    stage VARCHAR(50) DEFAULT 'queued',            -- queued/skeleton/locations/quests/finished
+    total_steps INT DEFAULT 0,
+    done_steps INT DEFAULT 0,
+    errors JSONB DEFAULT '[]',
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_world_gen_jobs_world ON world_generation_jobs(world_id);
+CREATE INDEX IF NOT EXISTS idx_world_gen_jobs_status ON world_generation_jobs(status);
+
+COMMENT ON TABLE world_generation_jobs IS '世界异步生成任务（供前端轮询进度）';
+COMMENT ON COLUMN adventure_worlds.generation_status IS '世界生成状态：pending/generating/playable/ready/failed';
@@ -0,0 +1,24 @@
+-- ========================================
+-- 世界预生成扩展
+-- 玩家到达边缘网格时，后台提前生成相邻地点；未被访问的预生成地点按 LRU 淘汰
+-- 创建时间：2025-12-02
+-- ========================================
+
+ALTER TABLE world_locations
+ADD COLUMN IF NOT EXISTS is_speculative BOOLEAN DEFAULT FALSE;
+
+-- 预生成地点挂接的来源网格（淘汰时需要移除来源网格上的连接）
+ALTER TABLE world_locations
+ADD COLUMN IF NOT EXISTS source_grid_id VARCHAR(36);
+
+-- LRU 时间戳：每次被再次“需要”时刷新
+ALTER TABLE world_locations
+ADD COLUMN IF NOT EXISTS speculated_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_locations_speculative
+    ON world_locations(world_id, speculated_at)
+    WHERE is_speculative;
+
+COMMENT ON COLUMN world_locations.is_speculative IS '预生成地点（尚无玩家进入），可被 LRU 淘汰';
+COMMENT ON COLUMN world_locations.source_grid_id IS '预生成地点连接到的来源网格';
+COMMENT ON COLUMN world_locations.speculated_at IS '预生成地点最近一次被需要的时间（LRU）';
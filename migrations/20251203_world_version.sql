@@ -0,0 +1,10 @@
+-- ========================================
+-- 世界版本号（世界快照缓存失效用）
+-- update_stats / 世界扩展 / NPC 死亡 / 异步生成写入时递增
+-- 创建时间：2025-12-03
+-- ========================================
+
+ALTER TABLE adventure_worlds
+ADD COLUMN IF NOT EXISTS world_version INT NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN adventure_worlds.world_version IS '世界静态内容版本号，变化时各进程的世界快照缓存自动失效';
@@ -0,0 +1,19 @@
+-- ========================================
+-- 服务端会话存储（session_store.py）
+-- Cookie 只携带签名后的会话 ID + 版本号，会话内容（访客抽牌、解读、运势等）存在这里
+-- data 为紧凑编码（Tagged JSON，较大时 zlib 压缩）；过期行由应用按批清理
+-- 创建时间：2025-12-05
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS web_sessions (
+    id          VARCHAR(64) PRIMARY KEY,
+    data        BYTEA NOT NULL,
+    version     INT NOT NULL DEFAULT 1,
+    expires_at  TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_web_sessions_expires_at ON web_sessions (expires_at);
+
+COMMENT ON TABLE web_sessions IS '服务端会话：Flask session 内容，Cookie 中只保存 ID';
+COMMENT ON COLUMN web_sessions.version IS '每次写入递增；Cookie 携带版本号，进程内缓存版本一致时免查库';
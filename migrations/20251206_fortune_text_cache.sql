@@ -0,0 +1,24 @@
+-- ========================================
+-- 运势文案缓存（fortune_text_cache.py）
+-- 运势文案主要取决于：牌、正逆位、五维星级、总评、元素、特殊事件
+-- 按这些字段的规范化画像（profile_key = sha256）缓存 Dify 生成的文案，每个画像保留若干版本（variant）
+-- last_used_at 为 LRU 淘汰依据，超出行数上限时由应用分批删除最久未用的记录
+-- 创建时间：2025-12-06
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS fortune_text_cache (
+    profile_key   VARCHAR(64) NOT NULL,
+    variant       SMALLINT NOT NULL DEFAULT 0,
+    profile       JSONB NOT NULL,
+    text          JSONB NOT NULL,
+    hits          INT NOT NULL DEFAULT 0,
+    created_at    TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_used_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (profile_key, variant)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fortune_text_cache_last_used ON fortune_text_cache (last_used_at);
+
+COMMENT ON TABLE fortune_text_cache IS '运势文案缓存：按量化运势画像复用 Dify 文案';
+COMMENT ON COLUMN fortune_text_cache.profile IS '画像原文（便于排查）：card / direction / stars / label / element / events';
+COMMENT ON COLUMN fortune_text_cache.variant IS '同一画像的第几个版本，按用户 + 日期哈希分配';
@@ -0,0 +1,29 @@
+-- ========================================
+-- 牌阵人气日汇总（spread_index.py）
+-- 推荐打分用的 30 天人气原来每次请求都对 spread_readings 做 COUNT，
+-- 现在由应用定期把最近两天的明细汇总进本表（覆盖写），推荐索引只对本表求和
+-- 创建时间：2025-12-07
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS spread_popularity_daily (
+    spread_id  VARCHAR(64) NOT NULL,
+    day        DATE NOT NULL,
+    cnt        INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (spread_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_spread_popularity_daily_day ON spread_popularity_daily (day);
+
+-- 汇总只扫最近两天的明细
+CREATE INDEX IF NOT EXISTS idx_spread_readings_date ON spread_readings (date);
+
+-- 回填最近 30 天
+INSERT INTO spread_popularity_daily (spread_id, day, cnt)
+SELECT spread_id, date, COUNT(*)
+FROM spread_readings
+WHERE date >= CURRENT_DATE - 30
+  AND spread_id IS NOT NULL
+GROUP BY spread_id, date
+ON CONFLICT (spread_id, day) DO UPDATE SET cnt = EXCLUDED.cnt;
+
+COMMENT ON TABLE spread_popularity_daily IS '牌阵每日使用次数汇总（推荐人气）';
@@ -0,0 +1,19 @@
+-- ========================================
+-- 消息历史 keyset 分页索引（message_cursor.py）
+-- chat_messages / spread_messages / adventure_run_messages 的历史接口改为
+-- 按 (created_at, id) 游标增量拉取 / 向前翻页，需要与之匹配的复合索引，
+-- 否则每次拉取仍要对整段会话排序
+-- 创建时间：2025-12-08
+-- ========================================
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_keyset
+    ON chat_messages (session_id, created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_spread_messages_reading_keyset
+    ON spread_messages (reading_id, created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_run_messages_run_keyset
+    ON adventure_run_messages (run_id, created_at, id);
+
+-- 单列 run_id 索引已被上面的复合索引覆盖
+DROP INDEX IF EXISTS idx_run_messages_run;
@@ -0,0 +1,92 @@
+"""
+小游戏插件 - 冷启动压测（插件导入耗时分布）
+
+每轮起一个全新的 Python 进程（等价于一次 Vercel 冷启动），测：
+  - import app 耗时（含所有插件的导入与蓝图注册）
+  - 首个请求耗时
+  - 每个插件模块的导入耗时（plugins.plugin_import_times()；先导入的插件会分摊共享依赖）
+
+用法（不需要可连接的数据库，但 DATABASE_URL 等必填配置需有值）：
+    python plugin_cold_start_bench.py --runs 10
+    python plugin_cold_start_bench.py --runs 10 --path /g/world_adventure/ --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 子进程内执行：测 import app 与首个请求
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as m
+t1 = time.perf_counter()
+client = m.app.test_client()
+t2 = time.perf_counter()
+status = client.get(sys.argv[1]).status_code
+t3 = time.perf_counter()
+from plugins import plugin_import_times
+print("__BENCH__" + json.dumps({
+    "import_ms": (t1 - t0) * 1000, "first_request_ms": (t3 - t2) * 1000,
+    "status": status, "plugins": plugin_import_times(),
+}))
+"""
+
+
+def _probe(path):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, path], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    line = next(l for l in out.splitlines() if l.startswith("__BENCH__"))
+    return json.loads(line[len("__BENCH__"):])
+
+
+def _summary(values):
+    return {
+        "p50_ms": round(statistics.median(values), 1),
+        "mean_ms": round(statistics.mean(values), 1),
+        "min_ms": round(min(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="插件冷启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="起多少个新进程")
+    parser.add_argument("--path", default="/g/tic_tac_toe/", help="首个请求的地址")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    _probe(args.path)  # 预热一次：生成 .pyc / 填充系统页缓存，不计入
+    samples = [_probe(args.path) for _ in range(args.runs)]
+    slugs = sorted({slug for s in samples for slug in s["plugins"]})
+    report = {
+        "runs": args.runs,
+        "path": args.path,
+        "import": _summary([s["import_ms"] for s in samples]),
+        "first_request": _summary([s["first_request_ms"] for s in samples]),
+        "status": samples[-1]["status"],
+        "plugins": {slug: _summary([s["plugins"].get(slug, 0.0) for s in samples]) for slug in slugs},
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{args.runs} 个新进程，首个请求 {args.path}（{report['status']}）")
+    print(f"import app p50 {report['import']['p50_ms']}ms，首请求 p50 {report['first_request']['p50_ms']}ms")
+    print(f"{'插件':<18}{'导入 p50':>10}")
+    ranked = sorted(report["plugins"].items(), key=lambda kv: kv[1]["p50_ms"], reverse=True)
+    for slug, r in ranked:
+        print(f"{slug:<18}{r['p50_ms']:>8}ms")
+    total = sum(r["p50_ms"] for r in report["plugins"].values())
+    print(f"插件导入合计约 {total:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 # plugins.py
+"""
+小游戏插件注册：自动发现 base_pkg.*.plugin，调用 get_meta()/get_blueprint() 注册到 /g/<slug>
+每个插件的导入耗时记录在 plugin_import_times()，用于定位拖慢冷启动的插件（见 plugin_cold_start_bench.py）
+"""
 import importlib, pkgutil
+import time
 from typing import List, Dict
 
 _PLUGINS: List[Dict] = []
+_IMPORT_MS: Dict[str, float] = {}   # slug -> 插件模块导入耗时（毫秒）
 
 def register_plugins(app, base_pkg="games"):
     """
@@ -17,11 +23,13 @@ def register_plugins(app, base_pkg="games"):
 
     for m in pkgutil.iter_modules(pkg.__path__):
         mod_name = f"{base_pkg}.{m.name}.plugin"
+        t0 = time.perf_counter()
         try:
             mod = importlib.import_module(mod_name)
         except ModuleNotFoundError:
             # 子目录没有 plugin.py，跳过
             continue
+        elapsed = (time.perf_counter() - t0) * 1000
 
         get_meta = getattr(mod, "get_meta", None)
         get_bp   = getattr(mod, "get_blueprint", None)
@@ -35,7 +43,11 @@ def register_plugins(app, base_pkg="games"):
 
         app.register_blueprint(bp, url_prefix=f"/g/{slug}")
         _PLUGINS.append(meta)
+        _IMPORT_MS[slug] = round(elapsed, 1)
         print(f"[plugins] Registered '{slug}' at /g/{slug}/")
 
 def plugin_metas() -> List[Dict]:
     return list(_PLUGINS)
+
+def plugin_import_times() -> Dict[str, float]:
+    return dict(_IMPORT_MS)
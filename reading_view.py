@@ -0,0 +1,190 @@
+"""
+牌阵占卜记录视图缓存（引导流程 / Dify Chatflow 轮询用）
+一次引导会话里 /api/guided/get_reading、/api/guided/reveal_card、聊天接口会反复读取同一条
+spread_readings 与其牌阵配置，每次都重新解析 cards / positions JSON、重拼 cards_layout。
+这里按 reading_id 缓存归一化后的视图：
+- 抽牌后 cards、牌阵、问题、归属（user_id / session_id）都不再变化，可以放心缓存
+- 状态类字段（status / initial_interpretation / conversation_id）由 SpreadDAO 的更新方法就地修补；
+  其他实例的更新最迟在 READING_VIEW_TTL 秒后生效（需要权威状态的地方仍直接查库，如 get_status）
+- 牌阵配置按 spread_id 单独缓存（多个 reading 共用）
+- 进程内 LRU，最多 READING_VIEW_CACHE_SIZE 条
+"""
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from config import Config
+
+# 由 SpreadDAO 的更新方法修补的字段
+MUTABLE_FIELDS = ("status", "initial_interpretation", "conversation_id")
+
+_LOCK = threading.Lock()
+_VIEWS = OrderedDict()   # reading_id -> (expires_at, ReadingView)
+_SPREADS = {}            # spread_id -> (expires_at, spread)
+_STATS = {"hits": 0, "misses": 0, "patches": 0, "invalidations": 0}
+
+
+def _parse_list(val):
+    if isinstance(val, str):
+        try:
+            val = json.loads(val) or []
+        except Exception:
+            return []
+    if isinstance(val, dict):
+        # {"0": {...}, "1": {...}} 形式
+        try:
+            return [val[str(i)] for i in sorted(map(int, val.keys()))]
+        except Exception:
+            return []
+    return list(val) if isinstance(val, (list, tuple)) else []
+
+
+class ReadingView:
+    """一条占卜记录的归一化视图；对外返回的都是副本"""
+
+    def __init__(self, reading, spread):
+        reading = dict(reading)
+        reading["cards"] = _parse_list(reading.get("cards"))
+        self.reading = reading
+        self.spread = dict(spread or {})
+        self.positions = _parse_list(self.spread.get("positions"))
+        self.spread["positions"] = self.positions
+
+        items = []
+        for i, c in enumerate(reading["cards"]):
+            pos = self.positions[i] if i < len(self.positions) else {}
+            items.append({
+                "index": i,
+                "position_name": pos.get("name", f"位置{i+1}"),
+                "position_meaning": pos.get("meaning", ""),
+                "card_id": c.get("card_id"),
+                "card_name": c.get("card_name", ""),
+                "direction": c.get("direction", ""),
+                "image": c.get("image", "")
+            })
+        self.items = items
+        # 未遮罩时的 cards_layout（最常见的请求形态）
+        self.layout_full = layout_text(items)
+
+    @property
+    def card_count(self):
+        return len(self.reading["cards"])
+
+    def reading_dict(self):
+        return copy.deepcopy(self.reading)
+
+    def cards(self, mask_until=None):
+        """get_reading 的 cards：mask_until 之后的卡遮罩"""
+        cards = [dict(it) for it in self.items]
+        if isinstance(mask_until, int):
+            for it in cards:
+                if it["index"] >= mask_until:
+                    it.update({"card_name": "", "direction": "", "image": "", "masked": True})
+        return cards
+
+    def layout(self, cards, masked):
+        return layout_text(cards) if masked else self.layout_full
+
+    def spread_dict(self):
+        return {
+            "id": self.spread.get("id") or self.reading.get("spread_id"),
+            "name": self.spread.get("name", ""),
+            "description": self.spread.get("description", ""),
+            "card_count": int(self.spread.get("card_count") or len(self.items)),
+            "positions": copy.deepcopy(self.positions)
+        }
+
+    def card_at(self, index):
+        """SpreadService.get_card_at 的结果：原始卡信息 + 位置信息"""
+        cards = self.reading["cards"]
+        if index < 0 or index >= len(cards):
+            raise IndexError("card index out of range")
+        card = dict(cards[index])
+        pos = self.positions[index] if index < len(self.positions) else {"index": index, "name": f"位置{index+1}", "meaning": ""}
+        card["position_info"] = {
+            "index": pos.get("index", index),
+            "name": pos.get("name", f"位置{index+1}"),
+            "meaning": pos.get("meaning", "")
+        }
+        return card
+
+
+def layout_text(cards):
+    lines = []
+    for i, c in enumerate(cards, 1):
+        pos = c["position_name"]
+        mean = c["position_meaning"]
+        cn = c["card_name"] or "（未揭示）"
+        dr = c["direction"] or ""
+        lines.append(f"{i}. {pos}（{mean}）\n   {cn}{f'（{dr}）' if dr else ''}")
+    return "\n".join(lines)
+
+
+def _get_spread(spread_id):
+    from database import SpreadDAO
+    now = time.monotonic()
+    with _LOCK:
+        hit = _SPREADS.get(spread_id)
+        if hit and hit[0] > now:
+            return hit[1]
+    spread = SpreadDAO.get_spread_by_id(spread_id)
+    if spread:
+        with _LOCK:
+            _SPREADS[spread_id] = (now + Config.SPREAD_INDEX_TTL, spread)
+    return spread
+
+
+def get(reading_id):
+    """返回 ReadingView；记录不存在返回 None（不缓存不存在的结果）"""
+    from database import SpreadDAO
+    if not reading_id:
+        return None
+    now = time.monotonic()
+    with _LOCK:
+        hit = _VIEWS.get(reading_id)
+        if hit and hit[0] > now:
+            _VIEWS.move_to_end(reading_id)
+            _STATS["hits"] += 1
+            return hit[1]
+        _STATS["misses"] += 1
+
+    reading = SpreadDAO.get_by_id(reading_id)
+    if not reading:
+        return None
+    view = ReadingView(reading, _get_spread(reading["spread_id"]) if reading.get("spread_id") else {})
+    with _LOCK:
+        _VIEWS[reading_id] = (now + Config.READING_VIEW_TTL, view)
+        _VIEWS.move_to_end(reading_id)
+        while len(_VIEWS) > Config.READING_VIEW_CACHE_SIZE:
+            _VIEWS.popitem(last=False)
+    return view
+
+
+def patch(reading_id, **fields):
+    """SpreadDAO 更新状态类字段后调用：已缓存时就地修补，未缓存时什么也不做"""
+    with _LOCK:
+        hit = _VIEWS.get(reading_id)
+        if not hit:
+            return
+        for k, v in fields.items():
+            if k in MUTABLE_FIELDS:
+                hit[1].reading[k] = v
+        _STATS["patches"] += 1
+
+
+def invalidate(reading_id):
+    with _LOCK:
+        if _VIEWS.pop(reading_id, None) is not None:
+            _STATS["invalidations"] += 1
+
+
+def stats():
+    with _LOCK:
+        s = dict(_STATS)
+        s["size"] = len(_VIEWS)
+        s["spreads"] = len(_SPREADS)
+    total = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / total, 4) if total else None
+    return s
@@ -9,8 +9,14 @@ import json
 from datetime import datetime, timezone, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import Config
-from database import UserDAO, ReadingDAO, CardDAO, ChatDAO, DatabaseManager, SpreadDAO, ShareDAO
+from database import UserDAO, ReadingDAO, CardDAO, ChatDAO, SpreadDAO, ShareDAO
 import hmac, hashlib, base64, time
+import atexit
+import threading
+from collections import OrderedDict
+import spread_index
+import reading_view
+import message_cursor
 
 def _norm(s):  # 简易归一
     return (s or '').strip().lower()
@@ -30,22 +36,8 @@ def _fit_bucket(val, target):
     return 1.0 if val == target else 0.6 if abs(val - target) == 1 else 0.2
 
 def _special_rule_boost(name, desc, question):
-    text = f"{name} {desc}".lower()
-    q = (question or '').lower()
-    boost = 0.0
-    # 是/否
-    if any(k in q for k in ['是否','能不能','要不要','可不可以','yes or no','yes/no']):
-        if any(k in text for k in ['是否','yes','no']): boost += 1.0
-    # 时间/时机
-    if any(k in q for k in ['什么时候','多久','何时','时机','时间','未来几','近三月','时间线']):
-        if any(k in text for k in ['时间','时机','流向','时间线']): boost += 0.8
-    # 选择题
-    if any(k in q for k in ['还是','两者','二选一','抉择','选择题']):
-        if any(k in text for k in ['选择','抉择','二选一']): boost += 0.8
-    # 关系/全景
-    if any(k in q for k in ['他对我','关系','现状','阻碍','全貌','全景','综合']):
-        if any(k in text for k in ['凯尔特','十字','马掌','关系','全景']): boost += 0.6
-    return min(boost, 1.2)
+    # 规则定义见 spread_index.RULE_GROUPS（推荐索引按同一份规则预先算好每个牌阵的命中情况）
+    return spread_index.rule_boost(spread_index.rule_mask(name, desc), spread_index.rule_weights(question))
 
 def _sign_candidate_ids(spread_ids, user_ref):
     payload = json.dumps({
@@ -277,19 +269,88 @@ class ShareService:
             return None
         return data
 
+    # 浏览量先在进程内累加，按间隔一次性写回（热门分享页每次访问不再各占一条 UPDATE）
+    _view_lock = threading.Lock()
+    _pending_views = {}
+    _last_view_flush = time.monotonic()
+
     @staticmethod
     def increment_view_count(share_id: str):
-        ShareDAO.increment_view(share_id)
+        with ShareService._view_lock:
+            ShareService._pending_views[share_id] = ShareService._pending_views.get(share_id, 0) + 1
+            due = (
+                time.monotonic() - ShareService._last_view_flush >= Config.SHARE_VIEW_FLUSH_INTERVAL
+                or len(ShareService._pending_views) >= Config.SHARE_VIEW_FLUSH_MAX
+            )
+        if due:
+            ShareService.flush_view_counts()
+
+    @staticmethod
+    def flush_view_counts():
+        """写回累计的浏览量；失败时把增量放回，下次再写"""
+        with ShareService._view_lock:
+            pending = ShareService._pending_views
+            ShareService._pending_views = {}
+            ShareService._last_view_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            ShareDAO.increment_views_batch(pending)
+        except Exception as e:
+            print(f"[ShareService] flush view counts failed: {e}")
+            with ShareService._view_lock:
+                for share_id, n in pending.items():
+                    ShareService._pending_views[share_id] = ShareService._pending_views.get(share_id, 0) + n
+            return 0
+        return len(pending)
+
+# 进程退出前写回尚未刷新的浏览量
+atexit.register(ShareService.flush_view_counts)
+
 
 class UserService:
     """用户服务"""
 
+    # 当前用户的进程内缓存：user_id -> (过期时间, 用户行)，避免每个请求都查一次 users
+    # 本进程内的资料变更 / 登录 / 退出 / 账号关联会主动失效；其他进程最多延迟 USER_CACHE_TTL 秒
+    _user_cache_lock = threading.Lock()
+    _user_cache = OrderedDict()
+
+    @staticmethod
+    def get_user(user_id):
+        """按 ID 取用户（带短 TTL 缓存），返回副本，调用方修改不会污染缓存"""
+        if not user_id:
+            return None
+        now = time.monotonic()
+        with UserService._user_cache_lock:
+            hit = UserService._user_cache.get(user_id)
+            if hit and hit[0] > now:
+                UserService._user_cache.move_to_end(user_id)
+                return dict(hit[1])
+
+        user = UserDAO.get_by_id(user_id)
+        if user is None or Config.USER_CACHE_TTL <= 0:
+            return user
+        with UserService._user_cache_lock:
+            UserService._user_cache[user_id] = (now + Config.USER_CACHE_TTL, dict(user))
+            UserService._user_cache.move_to_end(user_id)
+            while len(UserService._user_cache) > Config.USER_CACHE_SIZE:
+                UserService._user_cache.popitem(last=False)
+        return dict(user)
+
+    @staticmethod
+    def invalidate_user(user_id):
+        """用户资料变更后调用"""
+        with UserService._user_cache_lock:
+            UserService._user_cache.pop(user_id, None)
+
     @staticmethod
     def authenticate(username, password):
         """用户认证"""
         user = UserDAO.get_by_username(username)
         if user and check_password_hash(user['password_hash'], password):
             UserDAO.update_visit(user['id'])
+            UserService.invalidate_user(user['id'])
             return user
         return None
 
@@ -361,6 +422,32 @@ class TarotService:
             'recent_readings': recent_readings
         }
 
+def _run_after_response(fn, label):
+    """
+    把收尾写入推迟到响应发出之后（Werkzeug call_on_close）
+    没有请求上下文或关闭了 CHAT_DEFER_FINAL_WRITES 时立即执行
+    call_on_close 执行时请求 / 应用上下文已经弹出，日志器在注册时先取好
+    """
+    from flask import has_request_context, after_this_request, current_app
+
+    if not Config.CHAT_DEFER_FINAL_WRITES or not has_request_context():
+        fn()
+        return
+
+    logger = current_app.logger
+
+    def _safe():
+        try:
+            fn()
+        except Exception:
+            logger.exception("[%s] deferred write failed", label)
+
+    @after_this_request
+    def _hook(response):
+        response.call_on_close(_safe)
+        return response
+
+
 class ChatService:
     # 拟真的限制提示消息池
     LIMIT_MESSAGES = [
@@ -425,35 +512,30 @@ class ChatService:
 
     @staticmethod
     def process_message(session_id, user_message, user_ref, conversation_id=None, ai_personality=None):
-        """处理用户消息并返回 AI 回复，同时保证 conversation_id 持久化"""
+        """
+        处理用户消息并返回 AI 回复，同时保证 conversation_id 持久化
+        数据库只有两次往返：
+          1) ChatDAO.begin_turn：写用户消息 + 使用次数 +1，同一语句带回会话与历史
+          2) ChatDAO.finish_turn：AI 回复 + conversation_id 一个事务提交，
+             默认在响应发出后执行（CHAT_DEFER_FINAL_WRITES），不占用户等待时间；
+             回复使用 begin_turn 预留的 reply_at 排序，即使晚于下一轮用户消息写入也排在它前面
+        """
         if not user_ref:
             raise ValueError("必须传入 user_ref（用户唯一标识）")
 
-        # 获取会话信息
-        chat_session = ChatDAO.get_session_by_id(session_id)
-        if not chat_session:
-            raise ValueError("会话不存在")
-
-        # 保存用户消息
-        ChatDAO.save_message({
-            'session_id': session_id,
-            'role': 'user',
-            'content': user_message
-        })
-
-        # 增加使用次数
         today = DateTimeService.get_beijing_date()
-        ChatDAO.increment_usage(
+        chat_session = ChatDAO.begin_turn(
+            session_id,
             user_id=user_ref,
-            session_id=session_id,
-            date=today
+            date=today,
+            content=user_message,
+            history_limit=Config.CHAT_FEATURES['max_history_messages']
         )
+        if not chat_session:
+            raise ValueError("会话不存在")
 
-        # 获取历史消息
-        messages = ChatDAO.get_session_messages(session_id)
-
-        # 构建上下文并调用 AI
-        context = ChatService.build_context(chat_session, messages)
+        # 构建上下文并调用 AI（history 已按时间倒序）
+        context = ChatService.build_context(chat_session, chat_session.get('history') or [])
 
         personality = ai_personality or chat_session.get('ai_personality', 'warm')
 
@@ -469,28 +551,21 @@ class ChatService:
         conv_id = None
         if isinstance(ai_response, dict):
             conv_id = ai_response.get("conversation_id")
-
-        # 保存 conversation_id 到数据库 & session
-        if conv_id and conv_id != chat_session.get('conversation_id'):
-            from flask import session as flask_session
-            flask_session['conversation_id'] = conv_id
-            flask_session.modified = True
-
-            with DatabaseManager.get_db() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        UPDATE chat_sessions
-                        SET conversation_id = %s
-                        WHERE id = %s
-                    """, (conv_id, session_id))
-                    conn.commit()
-
-        # 保存 AI 回复
-        ChatDAO.save_message({
-            'session_id': session_id,
-            'role': 'assistant',
-            'content': ai_response.get("answer") if isinstance(ai_response, dict) else ai_response
-        })
+        if conv_id == chat_session.get('conversation_id'):
+            conv_id = None
+
+        # conversation_id 写入 session 必须在响应发出前完成（随 Cookie 下发）
+        if conv_id:
+            from flask import session as flask_session, has_request_context
+            if has_request_context():
+                flask_session['conversation_id'] = conv_id
+                flask_session.modified = True
+
+        answer = ai_response.get("answer") if isinstance(ai_response, dict) else ai_response
+        _run_after_response(
+            lambda: ChatDAO.finish_turn(session_id, answer, conv_id, created_at=chat_session.get('reply_at')),
+            "chat finish_turn"
+        )
 
         return ai_response
 
@@ -971,6 +1046,17 @@ class FortuneService:
         "土": ["绿色", "棕色", "深绿色", "土黄色"]
     }
 
+    # 幸运时辰 / 方位
+    LUCKY_HOURS = [
+        "子时(23-1时)", "丑时(1-3时)", "寅时(3-5时)",
+        "卯时(5-7时)", "辰时(7-9时)", "巳时(9-11时)",
+        "午时(11-13时)", "未时(13-15时)", "申时(15-17时)",
+        "酉时(17-19时)", "戌时(19-21时)", "亥时(21-23时)"
+    ]
+    LUCKY_DIRECTIONS = ["东", "南", "西", "北", "东南", "西南", "东北", "西北"]
+
+    DIMENSION_NAMES = ["事业运", "财富运", "爱情运", "健康运", "贵人运"]
+
     # 特殊事件文案
     SPECIAL_EVENT_MESSAGES = {
         "transformation": "死神牌带来转变的力量，旧的结束意味着新的开始",
@@ -997,16 +1083,8 @@ class FortuneService:
             raise ValueError(f"Card not found: {card_id}")
 
         # 2. 提取基础能量值
-        base_energies = [
-            card_data.get('energy_career', 50),
-            card_data.get('energy_wealth', 50),
-            card_data.get('energy_love', 50),
-            card_data.get('energy_health', 50),
-            card_data.get('energy_social', 50)
-        ]
-
+        base_energies = FortuneService._base_energies(card_data)
         element = card_data.get('element', '土')
-        special_effect = card_data.get('special_effect')
 
         # 3. 计算修正后的分数
         scores = FortuneService._calculate_scores(
@@ -1021,6 +1099,63 @@ class FortuneService:
             element, date, user_id
         )
 
+        return FortuneService._assemble_fortune(
+            card_id, card_name, direction, date, card_data, scores, stars, lucky_elements
+        )
+
+    @staticmethod
+    def calculate_fortunes_batch(items):
+        """
+        批量计算运势（夜间预计算用），结果与逐个调用 calculate_fortune 相同
+        items：[{card_id, direction, date, user_id, card_name(可选)}]，返回同顺序的 fortune_data 列表；
+        牌不存在的项返回 None。分数与幸运元素由 fortune_batch 向量化计算（安装了 NumPy 时）
+        """
+        from database import CardDAO
+        import fortune_batch
+
+        if not items:
+            return []
+        cards = CardDAO.get_many_with_energy(sorted({it["card_id"] for it in items}))
+        valid = [it for it in items if it["card_id"] in cards]
+
+        scores = fortune_batch.batch_scores(
+            [FortuneService._base_energies(cards[it["card_id"]]) for it in valid],
+            [it["direction"] for it in valid],
+            [it["date"] for it in valid],
+            [it.get("user_id") for it in valid],
+        )
+        stars = fortune_batch.batch_stars(scores)
+        lucky = fortune_batch.batch_lucky(
+            [cards[it["card_id"]].get('element', '土') for it in valid],
+            [it["date"] for it in valid],
+            [it.get("user_id") for it in valid],
+        )
+
+        computed = {}
+        for it, sc, st, lk in zip(valid, scores, stars, lucky):
+            card_data = cards[it["card_id"]]
+            computed[id(it)] = FortuneService._assemble_fortune(
+                it["card_id"], it.get("card_name") or card_data.get("name"), it["direction"],
+                it["date"], card_data, sc, st, lk
+            )
+        return [computed.get(id(it)) for it in items]
+
+    @staticmethod
+    def _base_energies(card_data):
+        return [
+            card_data.get('energy_career', 50),
+            card_data.get('energy_wealth', 50),
+            card_data.get('energy_love', 50),
+            card_data.get('energy_health', 50),
+            card_data.get('energy_social', 50)
+        ]
+
+    @staticmethod
+    def _assemble_fortune(card_id, card_name, direction, date, card_data, scores, stars, lucky_elements):
+        """由分数 / 星级 / 幸运元素组装完整的运势数据"""
+        element = card_data.get('element', '土')
+        special_effect = card_data.get('special_effect')
+
         # 6. 检查特殊事件
         special_events = FortuneService._check_special_events(
             card_name, special_effect, date
@@ -1028,8 +1163,7 @@ class FortuneService:
 
         # 7. 构建维度数据
         dimensions = []
-        dimension_names = ["事业运", "财富运", "爱情运", "健康运", "贵人运"]
-        for i, name in enumerate(dimension_names):
+        for i, name in enumerate(FortuneService.DIMENSION_NAMES):
             dimensions.append({
                 "name": name,
                 "score": scores[i],
@@ -1145,17 +1279,10 @@ class FortuneService:
         lucky_number = rng.randint(1, 9)
 
         # 幸运时辰
-        hours = [
-            "子时(23-1时)", "丑时(1-3时)", "寅时(3-5时)",
-            "卯时(5-7时)", "辰时(7-9时)", "巳时(9-11时)",
-            "午时(11-13时)", "未时(13-15时)", "申时(15-17时)",
-            "酉时(17-19时)", "戌时(19-21时)", "亥时(21-23时)"
-        ]
-        lucky_hour = rng.choice(hours)
+        lucky_hour = rng.choice(FortuneService.LUCKY_HOURS)
 
         # 幸运方位
-        directions = ["东", "南", "西", "北", "东南", "西南", "东北", "西北"]
-        lucky_direction = rng.choice(directions)
+        lucky_direction = rng.choice(FortuneService.LUCKY_DIRECTIONS)
 
         return {
             "color": lucky_color,
@@ -1320,11 +1447,13 @@ class FortuneService:
 
 
     @staticmethod
-    def _call_dify_fortune_api(fortune_data, prompt):
+    def _call_dify_fortune_api(fortune_data, prompt, cacheable=False):
         """
         调用 Dify 运势专用 API，传递所有必填字段
         fortune_data: dict, 包含 card_name, direction, overall_score 等
         prompt: str, LLM 提示词
+        cacheable: 文案会按画像缓存给其他用户复用时为 True：
+                   幸运元素与原始分数因人而异、不在画像里，这些字段只传占位说明，避免写进文案
         """
         from config import Config
         import json
@@ -1332,20 +1461,28 @@ class FortuneService:
         import traceback
         from datetime import datetime
 
+        lucky = fortune_data.get("lucky_elements", {})
+        if cacheable:
+            omitted = "（不在文案中提及）"
+            lucky = {"color": omitted, "number": omitted, "hour": omitted, "direction": omitted}
+
         # 构建 payload，保证必填字段都传
         payload = {
             "inputs": {
                 "card_name": fortune_data.get("card_name", "未知牌"),
                 "direction": fortune_data.get("direction", "正位"),
-                "overall_score": str(fortune_data.get("overall_score", 50)),
+                "overall_score": (
+                    str(fortune_data.get("overall_label", "")) if cacheable
+                    else str(fortune_data.get("overall_score", 50))
+                ),
                 "dimensions": "\n".join(
                     f"{dim['name']}：{dim['stars']}星（{dim['level']}）"
                     for dim in fortune_data.get("dimensions", [])
                 ),
-                "lucky_color": fortune_data.get("lucky_elements", {}).get("color", ""),
-                "lucky_number": str(fortune_data.get("lucky_elements", {}).get("number", "")),
-                "lucky_hour": fortune_data.get("lucky_elements", {}).get("hour", ""),
-                "lucky_direction": fortune_data.get("lucky_elements", {}).get("direction", ""),
+                "lucky_color": lucky.get("color", ""),
+                "lucky_number": str(lucky.get("number", "")),
+                "lucky_hour": lucky.get("hour", ""),
+                "lucky_direction": lucky.get("direction", ""),
                 "special_messages": "\n".join(
                     FortuneService.SPECIAL_EVENT_MESSAGES.get(ev, "")
                     for ev in fortune_data.get("special_events", [])
@@ -1392,12 +1529,20 @@ class FortuneService:
 
 
     @staticmethod
-    def generate_fortune_text(fortune_data):
+    def generate_fortune_text(fortune_data, user_ref=None):
         """
         调用 Dify API 生成运势文案
         使用统一模板 {{变量}}
+        先查运势文案缓存（按量化画像 + 版本槽位，见 fortune_text_cache），未命中才实时调用 Dify
+        user_ref：用于把同画像的用户分散到不同版本
         """
         import json
+        import fortune_text_cache
+
+        cached = fortune_text_cache.lookup(fortune_data, user_ref)
+        if cached:
+            fortune_data['fortune_text'] = cached
+            return fortune_data
 
         # 准备 prompt 模板
         try:
@@ -1413,19 +1558,30 @@ class FortuneService:
              for ev in fortune_data.get("special_events", [])]
         )
 
+        # 可缓存的画像：文案会复用给同画像的其他用户，提示词里不放因人而异的幸运元素与原始分数
+        cacheable = fortune_text_cache.cacheable(fortune_data)
+        if cacheable:
+            score_line = "综合运势：{{overall_score}}"
+            lucky_block = ""
+            lucky_rule = "- 不要提及具体的幸运色、幸运数字、幸运时辰、幸运方位（页面另行展示）\n"
+        else:
+            score_line = "综合运势评分：{{overall_score}}/100"
+            lucky_block = """
+幸运元素：
+- 幸运色：{{lucky_color}}
+- 幸运数字：{{lucky_number}}
+- 幸运时辰：{{lucky_hour}}
+- 幸运方位：{{lucky_direction}}
+"""
+            lucky_rule = ""
+
         prompt = f"""
 用户抽到塔罗牌：{{{{card_name}}}}（{{{{direction}}}}）
-综合运势评分：{{{{overall_score}}}}/100
+{score_line}
 
 运势指数：
 {{{{dimensions}}}}
-
-幸运元素：
-- 幸运色：{{{{lucky_color}}}}
-- 幸运数字：{{{{lucky_number}}}}
-- 幸运时辰：{{{{lucky_hour}}}}
-- 幸运方位：{{{{lucky_direction}}}}
-
+{lucky_block}
 特殊提示：
 {{{{special_messages}}}}
 
@@ -1439,7 +1595,7 @@ class FortuneService:
 - 结合塔罗牌含义和运势数据
 - 语言积极正面，即使运势较低也要给出建设性建议
 - 建议要具体可执行
-
+{lucky_rule}
 返回 JSON 格式，字段：
 - summary: 今日运势总评
 - dimension_advice: 各维度建议
@@ -1448,12 +1604,13 @@ class FortuneService:
 """
 
         # 调用 Dify API
-        result = FortuneService._call_dify_fortune_api(fortune_data, prompt)
+        result = FortuneService._call_dify_fortune_api(fortune_data, prompt, cacheable=cacheable)
 
         # 解析结果
         if result and isinstance(result, dict):
             if all(k in result for k in ["summary", "dimension_advice", "do", "dont"]):
                 fortune_data['fortune_text'] = result
+                fortune_text_cache.store(fortune_data, result, user_ref)
             else:
                 print("[FortuneService] Unexpected format, using default text.")
                 fortune_data['fortune_text'] = FortuneService._generate_default_text(fortune_data)
@@ -1821,11 +1978,9 @@ class SpreadService:
     
     @staticmethod
     def get_reading(reading_id):
-        """获取占卜记录详情"""
-        reading = SpreadDAO.get_by_id(reading_id)
-        if reading and reading.get('cards'):
-            reading['cards'] = json.loads(reading['cards']) if isinstance(reading['cards'], str) else reading['cards']
-        return reading
+        """获取占卜记录详情（走 reading_view 进程内缓存，返回副本）"""
+        view = reading_view.get(reading_id)
+        return view.reading_dict() if view else None
     
     @staticmethod
     def get_chat_messages(reading_id):
@@ -1836,40 +1991,25 @@ class SpreadService:
             for msg in messages
         ] if messages else []
 
+    @staticmethod
+    def get_chat_messages_since(reading_id, cursor=None, limit=200):
+        """
+        增量拉取对话历史：cursor 为上次返回的 next_cursor（空表示从头）
+        返回 message_cursor.payload 格式；游标无效时抛 ValueError
+        """
+        rows, has_more = SpreadDAO.get_messages_since(reading_id, cursor, limit)
+        return message_cursor.payload(rows, has_more, cursor)
+
     @staticmethod
     def get_card_at(reading_id, index: int):
         """
         读取既有 reading.cards 的第 index 张，并补充该位置的位置信息（name/meaning）。
+        cards / positions 已在 reading_view 中归一化并缓存。
         """
-        reading = SpreadDAO.get_by_id(reading_id)
-        if not reading:
+        view = reading_view.get(reading_id)
+        if not view:
             raise ValueError("reading not found")
-
-        # 归一化 cards
-        cards = reading.get('cards') or []
-        if isinstance(cards, str):
-            import json
-            try:
-                cards = json.loads(cards) or []
-            except Exception:
-                cards = []
-
-        if index < 0 or index >= len(cards):
-            raise IndexError("card index out of range")
-
-        card = dict(cards[index])  # 复制以免副作用
-
-        # 取 positions
-        spread = SpreadDAO.get_spread_by_id(reading['spread_id'])
-        positions = (spread or {}).get('positions') or []
-        pos = positions[index] if index < len(positions) else {"index": index, "name": f"位置{index+1}", "meaning": ""}
-
-        card['position_info'] = {
-            "index": pos.get("index", index),
-            "name": pos.get("name", f"位置{index+1}"),
-            "meaning": pos.get("meaning", "")
-        }
-        return card
+        return view.card_at(index)
 
     @staticmethod
     def reveal_card(reading_id, index: int):
@@ -1909,60 +2049,44 @@ class SpreadService:
         # 1) 映射 depth -> card_count 区间
         min_c, max_c = _depth_window(depth or 'short')
 
-        # 2) 取初筛候选
-        cands = SpreadDAO.suggest_candidates(
+        # 2) 初筛候选（进程内推荐索引，不查库）
+        index = spread_index.get_index()
+        cands = index.candidates(
             topic=topic or None,
             min_cards=min_c, max_cards=max_c,
             max_difficulty=difficulty or None
         )
-        if not cands:
+        if not len(cands):
             # 兜底：不限制长度与难度，仅按 category=topic|通用
-            cands = SpreadDAO.suggest_candidates(topic=topic)
+            cands = index.candidates(topic=topic)
 
-        if not cands:
+        if not len(cands):
             return {'candidate_set_id': _sign_candidate_ids([], user_ref), 'items': []}
 
-        ids = [c['id'] for c in cands]
-        pop = SpreadDAO.get_popularity(ids, days=30)
+        # 唯一的按用户查询：近期用过的牌阵
+        ids = index.ids_at(cands)
         recent = SpreadDAO.used_recently(avoid_recent_user_id, ids, days=14) if avoid_recent_user_id else set()
 
-        # 3) 打分
-        # 归一化人气
-        max_pop = max(pop.values()) if pop else 0
-        def norm_pop(x): 
-            return (pop.get(x, 0) / max_pop) if max_pop else 0.0
-
+        # 3) 打分（人气按候选内最大值归一化）
         depth_target = 1 if max_c<=3 else 2 if max_c<=6 else 3
         w = dict(topic=0.30, depth=0.20, diff=0.15, rule=0.20, sim=0.10, pop=0.10, repeat=0.25)
-
-        scored = []
-        for s in cands:
-            topic_fit = 1.0 if _norm(s['category']) == _norm(topic) else (0.6 if _norm(s['category'])=='通用' else 0.2)
-            depth_fit = _fit_bucket( 1 if s['card_count']<=3 else 2 if s['card_count']<=6 else 3, depth_target)
-            diff_fit = _fit_bucket(_difficulty_rank(s['difficulty']), _difficulty_rank(difficulty or '简单'))
-            rule = _special_rule_boost(s['name'], s.get('description',''), question or '')
-            sim = 0.0  # 如需，可接 pg_trgm 相似度结果（此处先置 0）
-            p = norm_pop(s['id'])
-            rep = 1.0 if s['id'] in recent else 0.0
-
-            score = w['topic']*topic_fit + w['depth']*depth_fit + w['diff']*diff_fit + \
-                    w['rule']*rule + w['sim']*sim + w['pop']*p - w['repeat']*rep
-
-            scored.append((score, s))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        items = [
-            {
+        sim = index.similarity(question or '', cands)
+        scores = index.score_suggest(cands, topic, depth_target, difficulty, question or '', recent, weights=w, sim=sim)
+
+        # 稳定排序：同分保持目录顺序（card_count, name）
+        order = sorted(range(len(ids)), key=lambda k: scores[k], reverse=True)
+        items = []
+        for k in order[:max(topn, 2)]:
+            s = index.rows[cands[k]]
+            items.append({
               'spread_id': s['id'],
               'spread_name': s['name'],
               'card_count': s['card_count'],
-              'purpose': s.get('description','')[:60],
+              'purpose': (s.get('description') or '')[:60],
               'difficulty': s['difficulty'],
               'category': s['category'],
-              'score': round(score, 3)
-            }
-            for score, s in scored[:max(topn, 2)]
-        ]
+              'score': round(scores[k], 3)
+            })
 
         token = _sign_candidate_ids([it['spread_id'] for it in items], user_ref)
         return {'candidate_set_id': token, 'items': items}
@@ -1992,17 +2116,19 @@ class SpreadService:
         difficulty = (normalized or {}).get('difficulty') or None
         min_cards, max_cards = _depth_window(depth)
 
-        # 1) DB 初筛（只从库里取）
-        cands = SpreadDAO.suggest_candidates(
+        # 1) 初筛（推荐索引中的牌阵目录，只返回库里真实存在的牌阵）
+        index = spread_index.get_index()
+        cand_idx = index.candidates(
             topic=topic,
             min_cards=min_cards,
             max_cards=max_cards,
             max_difficulty=difficulty
         )
 
-        if not cands:
+        if not len(cand_idx):
             # 兜底：只按 topic/通用再取一次
-            cands = SpreadDAO.suggest_candidates(topic=topic)
+            cand_idx = index.candidates(topic=topic)
+        cands = [index.rows[i] for i in cand_idx]
 
         # 2) 把 LLM 推荐整理为易用的匹配词
         #    names/aka/tags 全部小写，min/max_cards 做容差
@@ -2029,28 +2155,12 @@ class SpreadService:
 
         depth_target = _depth_bucket(max_cards)
 
-        for s in cands:
-            s_name = (s['name'] or '')
-            s_name_l = s_name.lower()
-            s_desc = (s.get('description') or '')
-            s_cat  = (s.get('category') or '')
-            s_cnt  = int(s.get('card_count') or 0)
-            s_diff = (s.get('difficulty') or '')
-
-            # 主题匹配
-            topic_fit = 1.0 if (topic and s_cat == topic) else (0.6 if s_cat == '通用' else (0.2 if topic else 0.8))
-
-            # 深度匹配
-            depth_fit = 1.0 if _depth_bucket(s_cnt) == depth_target else 0.6 if abs(_depth_bucket(s_cnt) - depth_target) == 1 else 0.2
+        # 主题 / 深度 / 难度 / 规则由索引按列算好，这里只补 LLM 名称命中
+        topic_fit, depth_fit, diff_fit, rule = index.base_llm(cand_idx, topic, depth_target, difficulty, question)
 
-            # 难度匹配
-            diff_fit = 1.0
-            user_rank = _difficulty_rank(difficulty or '简单')
-            s_rank    = _difficulty_rank(s_diff)
-            if s_rank - user_rank == 1:
-                diff_fit = 0.5
-            elif s_rank - user_rank >= 2:
-                diff_fit = 0.0
+        for k, s in enumerate(cands):
+            s_name_l = (s['name'] or '').lower()
+            s_cnt  = int(s.get('card_count') or 0)
 
             # 名称/标签命中（只在 LLM 提供的推荐里找，不编造）
             name_hit = 0.0
@@ -2067,17 +2177,14 @@ class SpreadService:
                     if r['max'] and s_cnt > r['max'] + 1:
                         name_hit *= 0.8
 
-            # 特殊规则：根据 question 内容加权（不越界）
-            rule = _special_rule_boost(s_name, s_desc, question)
-
-            score = w['topic']*topic_fit + w['depth']*depth_fit + w['diff']*diff_fit + \
-                    w['rule']*rule + w['name']*name_hit
+            score = w['topic']*topic_fit[k] + w['depth']*depth_fit[k] + w['diff']*diff_fit[k] + \
+                    w['rule']*rule[k] + w['name']*name_hit
 
-            scored.append((score, s, name_hit))
+            scored.append((score, s, name_hit, rule[k]))
 
         scored.sort(key=lambda x: x[0], reverse=True)
         top_items = []
-        for score, s, name_hit in scored[:max(topn, 2)]:
+        for score, s, name_hit, rule_k in scored[:max(topn, 2)]:
             # 生成 why：优先用 LLM 的 why（若命中），否则根据匹配维度拼接
             why = ""
             if recs:
@@ -2092,7 +2199,7 @@ class SpreadService:
                     parts.append("张数匹配")
                 if name_hit >= 0.8:
                     parts.append("与推断名称/别名相符")
-                if _special_rule_boost(s['name'], s.get('description',''), question) >= 0.8:
+                if rule_k >= 0.8:
                     parts.append("针对你的问题类型更合适")
                 why = "、".join(parts) or "综合匹配较好"
 
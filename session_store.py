@@ -0,0 +1,240 @@
+"""
+服务端会话（替代 Flask 默认的签名 Cookie 会话）
+Cookie 里只保存签名后的「会话 ID + 版本号」，会话内容存在 Postgres 的 web_sessions 表：
+- 编码：Flask 的 Tagged JSON（与 Cookie 会话支持的类型一致），超过 COMPRESS_MIN 字节时 zlib 压缩
+- 进程内 LRU 缓存：Cookie 中的版本号与缓存一致时直接使用缓存，不查库；版本不一致（其他进程写过）才读库
+- 只有会话被修改（或长期会话临近过期需要续期）时才写库；清空会话时删除记录；/static/ 请求不读写会话
+- 空会话不建记录、不下发 Cookie；访客 session_id 由需要它的路由按需生成（app.ensure_session_id）
+- TTL：长期会话按 PERMANENT_SESSION_LIFETIME，其余按 SESSION_STORE_TTL；过期记录由写路径定期分批清理
+- 兼容：旧的签名 Cookie 会话首次访问时迁移到服务端；存储不可用时本次响应退回签名 Cookie
+"""
+import time
+import zlib
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession, SecureCookieSessionInterface
+from itsdangerous import Signer, BadSignature
+
+from config import Config
+from database import WebSessionDAO
+
+COMPRESS_MIN = 256
+_RAW, _ZLIB = b"j", b"z"
+
+_serializer = TaggedJSONSerializer()
+
+
+def encode(data: dict) -> bytes:
+    raw = _serializer.dumps(data).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return _ZLIB + packed
+    return _RAW + raw
+
+
+def decode(blob: bytes) -> dict:
+    if blob[:1] == _ZLIB:
+        blob = zlib.decompress(blob[1:])
+    else:
+        blob = blob[1:]
+    return _serializer.loads(blob.decode("utf-8"))
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, version=0, expires_at=None, detached=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.version = version
+        self.expires_at = expires_at
+        self.new = sid is None
+        # 静态资源请求 / 读库失败时不读写会话：内容为空，响应时不写库也不改 Cookie
+        self.detached = detached
+
+
+class _SessionCache:
+    """sid -> (version, blob, expires_at)"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, sid, version):
+        with self._lock:
+            hit = self._data.get(sid)
+            if not hit:
+                return None
+            if hit[0] != version or hit[2] <= datetime.now(timezone.utc):
+                self._data.pop(sid, None)
+                return None
+            self._data.move_to_end(sid)
+            return hit
+
+    def put(self, sid, version, blob, expires_at):
+        with self._lock:
+            self._data[sid] = (version, blob, expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class ServerSessionInterface(SessionInterface):
+    salt = "server-session"
+
+    def __init__(self):
+        self.cache = _SessionCache(Config.SESSION_CACHE_SIZE)
+        self.fallback = SecureCookieSessionInterface()
+        self._last_purge = time.monotonic()
+        self._purge_lock = threading.Lock()
+
+    # ---------- Cookie ----------
+
+    def _signer(self, app):
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt, key_derivation="hmac")
+
+    def _parse_cookie(self, app, value):
+        """返回 (sid, version)；不是本接口签发的 Cookie 返回 None"""
+        signer = self._signer(app)
+        if signer is None or not value:
+            return None
+        try:
+            payload = signer.unsign(value).decode("ascii")
+            sid, version = payload.rsplit(".", 1)
+            return sid, int(version)
+        except (BadSignature, ValueError):
+            return None
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime
+        return timedelta(seconds=Config.SESSION_STORE_TTL)
+
+    # ---------- 读 ----------
+
+    def open_session(self, app, request):
+        if self._signer(app) is None:
+            return None
+        if app.static_url_path and request.path.startswith(app.static_url_path + "/"):
+            return ServerSession(detached=True)
+        value = request.cookies.get(self.get_cookie_name(app))
+        parsed = self._parse_cookie(app, value)
+        if parsed is None:
+            if value:
+                # 旧的签名 Cookie 会话：读出内容，本次响应迁移到服务端
+                legacy = self.fallback.open_session(app, request)
+                if legacy:
+                    session = ServerSession(dict(legacy))
+                    session.modified = True
+                    return session
+            return ServerSession()
+
+        sid, version = parsed
+        hit = self.cache.get(sid, version)
+        if hit is None:
+            try:
+                row = WebSessionDAO.get(sid)
+            except Exception as e:
+                # 读库失败：本次按空会话处理，但不写回，避免覆盖掉 Cookie 与已有会话
+                print(f"[session_store] load failed: {e}")
+                return ServerSession(sid=sid, version=version, detached=True)
+            if row is None:
+                # 已过期或被清理：沿用同一个 ID 重新开始
+                return ServerSession(sid=sid)
+            hit = (row["version"], row["data"], row["expires_at"])
+            self.cache.put(sid, *hit)
+
+        version, blob, expires_at = hit
+        try:
+            data = decode(blob)
+        except Exception as e:
+            print(f"[session_store] decode failed: {e}")
+            data = {}
+        return ServerSession(data, sid=sid, version=version, expires_at=expires_at)
+
+    # ---------- 写 ----------
+
+    def save_session(self, app, session, response):
+        if getattr(session, "detached", False):
+            return
+        name = self.get_cookie_name(app)
+        cookie_kwargs = dict(
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            partitioned=self.get_cookie_partitioned(app),
+            samesite=self.get_cookie_samesite(app),
+            httponly=self.get_cookie_httponly(app),
+        )
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.cache.pop(session.sid)
+                    try:
+                        WebSessionDAO.delete(session.sid)
+                    except Exception as e:
+                        print(f"[session_store] delete failed: {e}")
+                response.delete_cookie(name, **cookie_kwargs)
+                response.vary.add("Cookie")
+            return
+
+        now = datetime.now(timezone.utc)
+        ttl = self._ttl(app, session)
+        # 长期会话的 Cookie 每次请求续期；服务端记录剩余不足一半时顺带续期
+        needs_refresh = session.expires_at is None or session.expires_at - now < ttl / 2
+
+        if session.modified or session.new or needs_refresh:
+            sid = session.sid or secrets.token_urlsafe(24)
+            version = session.version + 1
+            expires_at = now + ttl
+            blob = encode(dict(session))
+            try:
+                WebSessionDAO.save(sid, blob, version, expires_at)
+            except Exception as e:
+                # 存储不可用（表未迁移 / 数据库故障）：本次退回签名 Cookie，不丢会话内容
+                print(f"[session_store] save failed, falling back to cookie session: {e}")
+                self.fallback.save_session(app, session, response)
+                return
+            self.cache.put(sid, version, blob, expires_at)
+            session.sid, session.version, session.expires_at = sid, version, expires_at
+            self._maybe_purge()
+        elif not self.should_set_cookie(app, session):
+            return
+
+        value = self._signer(app).sign(f"{session.sid}.{session.version}".encode("ascii")).decode("ascii")
+        response.set_cookie(name, value, expires=self.get_expiration_time(app, session), **cookie_kwargs)
+        response.vary.add("Cookie")
+
+    def _maybe_purge(self):
+        """每 SESSION_PURGE_INTERVAL 秒最多清理一批过期记录"""
+        if time.monotonic() - self._last_purge < Config.SESSION_PURGE_INTERVAL:
+            return
+        if not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_purge = time.monotonic()
+            WebSessionDAO.purge_expired()
+        except Exception as e:
+            print(f"[session_store] purge failed: {e}")
+        finally:
+            self._purge_lock.release()
+
+
+def init_app(app):
+    """SESSION_BACKEND=server 时启用服务端会话（默认）；cookie 保持 Flask 默认行为"""
+    if Config.SESSION_BACKEND == "server":
+        app.session_interface = ServerSessionInterface()
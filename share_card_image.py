@@ -0,0 +1,474 @@
+"""
+分享卡片原生渲染（Pillow）
+不依赖浏览器，直接按 share_card.html 的版式合成 PNG：牌面、总分环、五维星级、总评、宜忌、幸运元素、二维码。
+- 数据与 share_card.html 相同：share_data（user_name / reading / fortune / created_at），
+  fortune 先经 flatten_fortune_for_share 拍平
+- 尺寸与 Playwright 导出一致：400×711 CSS 像素 × 2 倍
+- 中文字体：优先 SHARE_CARD_FONT / SHARE_CARD_FONT_BOLD，其次 static/fonts 与常见系统字体；
+  都没有时抛 RendererUnavailable，不输出中文显示为方框的卡片（font_available() 可预先判断）
+- 牌面只读 static/images/tarot 下的本地文件：外链只取路径部分映射到该目录，规范化后越界的一律拒绝，
+  不发起任何网络请求
+- 字体、背景、牌面图片都在进程内缓存，单次渲染只做绘制与编码
+"""
+import io
+import os
+import re
+from functools import lru_cache
+
+from urllib.parse import urlparse, unquote
+
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+from share_renderer import RendererUnavailable
+
+try:
+    import qrcode
+except Exception:
+    qrcode = None
+
+SCALE = 2
+WIDTH, HEIGHT = 400, 711
+PAD = 16
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_STATIC_DIR = os.path.join(_BASE_DIR, "static")
+_CARD_DIR = os.path.realpath(os.path.join(_STATIC_DIR, "images", "tarot"))
+
+# 颜色（与 share_card.html 的 CSS 变量一致）
+GOLD = (232, 212, 162)
+GOLD_LIGHT = (244, 229, 195)
+TEXT = (255, 255, 255)
+TEXT_LIGHT = (255, 255, 255, 217)
+TEXT_MUTED = (255, 255, 255, 153)
+GLASS = (255, 255, 255, 15)
+GLASS_LIGHT = (255, 255, 255, 26)
+BORDER = (255, 255, 255, 31)
+
+COLOR_MAP = {
+    "红": "#e85b70", "红色": "#e85b70", "玫红": "#ff4d6d", "粉": "#f4a5c7", "粉色": "#f4a5c7",
+    "橙": "#ffa24d", "橙色": "#ffa24d", "金": "#d6c3a3", "金色": "#d6c3a3",
+    "黄": "#ffd66b", "黄色": "#ffd66b", "绿": "#65c18c", "绿色": "#65c18c",
+    "蓝": "#6aa8ff", "蓝色": "#6aa8ff", "紫": "#8e6c88", "紫色": "#8e6c88",
+    "白": "#f8f4e9", "白色": "#f8f4e9", "黑": "#222", "黑色": "#222",
+}
+
+DIM_CONFIG = [
+    ("事业运", "事业"),
+    ("财富运", "财富"),
+    ("爱情运", "爱情"),
+    ("健康运", "健康"),
+    ("贵人运", "贵人"),
+]
+
+_FONT_CANDIDATES = {
+    "regular": [
+        os.path.join(_BASE_DIR, "static", "fonts", "NotoSerifSC-Regular.otf"),
+        os.path.join(_BASE_DIR, "static", "fonts", "NotoSansSC-Regular.otf"),
+        "/usr/share/fonts/opentype/noto/NotoSerifCJK-Regular.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+        "/System/Library/Fonts/PingFang.ttc",
+        "C:/Windows/Fonts/msyh.ttc",
+    ],
+    "bold": [
+        os.path.join(_BASE_DIR, "static", "fonts", "NotoSerifSC-Bold.otf"),
+        os.path.join(_BASE_DIR, "static", "fonts", "NotoSansSC-Bold.otf"),
+        "/usr/share/fonts/opentype/noto/NotoSerifCJK-Bold.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+        "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    ],
+}
+
+
+# ============ 资源 ============
+
+@lru_cache(maxsize=None)
+def _font_path(weight):
+    env = os.getenv("SHARE_CARD_FONT_BOLD" if weight == "bold" else "SHARE_CARD_FONT")
+    candidates = ([env] if env else []) + _FONT_CANDIDATES[weight]
+    if weight == "bold":
+        # 没有粗体时用常规字体
+        candidates += _FONT_CANDIDATES["regular"]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    print("[share_card_image] 未找到中文字体，设置 SHARE_CARD_FONT 指向 Noto Sans/Serif SC 等字体文件")
+    return None
+
+
+def font_available():
+    """是否找到了可显示中文的字体"""
+    return _font_path("regular") is not None
+
+
+@lru_cache(maxsize=64)
+def _font(size, weight="regular"):
+    path = _font_path(weight)
+    if not path:
+        raise RendererUnavailable("未找到中文字体，无法原生渲染分享图")
+    return ImageFont.truetype(path, int(size * SCALE))
+
+
+def _rgba(color, alpha=255):
+    if isinstance(color, str):
+        color = color.lstrip("#")
+        if len(color) == 3:
+            color = "".join(c * 2 for c in color)
+        return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4)) + (alpha,)
+    return color if len(color) == 4 else tuple(color) + (alpha,)
+
+
+@lru_cache(maxsize=1)
+def _background():
+    """渐变底 + 两团柔光（与 .frame / .bg-glow 对应），只生成一次"""
+    w, h = WIDTH * SCALE, HEIGHT * SCALE
+    top, bottom = Image.new("RGBA", (w, h), (42, 32, 65, 255)), Image.new("RGBA", (w, h), (26, 22, 37, 255))
+    mask = Image.linear_gradient("L").resize((w, h))
+    bg = Image.composite(bottom, top, mask)
+
+    glow = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    d = ImageDraw.Draw(glow)
+    r = 160 * SCALE
+    for (cx, cy), color in (((0.3, 0.2), (157, 126, 168, 40)), ((0.7, 0.8), (232, 212, 162, 26))):
+        x, y = int(w * cx), int(h * cy)
+        d.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    glow = glow.filter(ImageFilter.GaussianBlur(60 * SCALE))
+    return Image.alpha_composite(bg, glow).convert("RGB")
+
+
+@lru_cache(maxsize=1)
+def _corner_mask():
+    mask = Image.new("L", (WIDTH * SCALE, HEIGHT * SCALE), 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, WIDTH * SCALE - 1, HEIGHT * SCALE - 1), 20 * SCALE, fill=255)
+    return mask
+
+
+@lru_cache(maxsize=1)
+def _page_background():
+    """圆角外露出的页面底色（body 背景），与元素截图效果一致"""
+    return Image.new("RGB", (WIDTH * SCALE, HEIGHT * SCALE), (45, 27, 78))
+
+
+def card_image_path(src):
+    """
+    牌面地址 → static/images/tarot 下的本地文件路径
+    支持 /static/images/tarot/x.jpg、images/tarot/x.jpg 与同路径的完整 URL（只取路径，不请求外链）；
+    规范化后不在该目录内（其他目录、../ 越界、符号链接指向外部）或文件不存在时返回 None
+    """
+    if not isinstance(src, str) or not src:
+        return None
+    path = urlparse(src).path if src.startswith(("http://", "https://")) else src.split("?")[0].split("#")[0]
+    path = unquote(path).lstrip("/")
+    if path.startswith("static/"):
+        path = path[len("static/"):]
+    full = os.path.realpath(os.path.join(_STATIC_DIR, path))
+    try:
+        inside = os.path.commonpath([full, _CARD_DIR]) == _CARD_DIR and full != _CARD_DIR
+    except ValueError:
+        inside = False
+    return full if inside and os.path.isfile(full) else None
+
+
+def card_image_url(src):
+    """客户端传入的牌面地址 → 站内 /static/... 地址；不合法时返回空串"""
+    path = card_image_path(src)
+    if not path:
+        return ""
+    return "/static/" + os.path.relpath(path, os.path.realpath(_STATIC_DIR)).replace(os.sep, "/")
+
+
+@lru_cache(maxsize=128)
+def _card_image(src, size):
+    """加载牌面并裁剪到 size（object-fit: cover）；不在 static/images/tarot 内或加载失败返回 None"""
+    path = card_image_path(src)
+    if not path:
+        print(f"[share_card_image] 拒绝牌面图片 {src!r}：不在 static/images/tarot 内")
+        return None
+    try:
+        img = Image.open(path).convert("RGBA")
+    except Exception as e:
+        print(f"[share_card_image] 牌面图片加载失败 {src}: {e}")
+        return None
+
+    tw, th = size
+    ratio = max(tw / img.width, th / img.height)
+    img = img.resize((max(tw, round(img.width * ratio)), max(th, round(img.height * ratio))), Image.LANCZOS)
+    left, top = (img.width - tw) // 2, (img.height - th) // 2
+    return img.crop((left, top, left + tw, top + th))
+
+
+def _qr_image(data, size):
+    if not qrcode or not data:
+        return None
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=4, border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").get_image().convert("RGBA")
+    return img.resize((size, size), Image.NEAREST)
+
+
+# ============ 数据整理（与 share_card.html 的 render() 保持一致） ============
+
+def _label_score(s):
+    if s >= 85:
+        return "大吉"
+    if s >= 70:
+        return "中吉"
+    if s >= 55:
+        return "小吉"
+    return "平"
+
+
+def _parse_dims(fortune):
+    dims_map = fortune.get("dimensions_map")
+    if isinstance(dims_map, dict) and dims_map:
+        return {k: float(v or 0) for k, v in dims_map.items()}
+    out = {}
+    text = fortune.get("dimensions_text") or fortune.get("dimensions")
+    if isinstance(text, str):
+        for line in re.split(r"\n+", text):
+            m = re.match(r"^(.*?)[：:]\s*([\d.]+)\s*星", line)
+            if m:
+                out[m.group(1).strip()] = float(m.group(2))
+    return out
+
+
+def _color_hex(name):
+    for k, v in COLOR_MAP.items():
+        if k in (name or ""):
+            return v
+    return None
+
+
+def _date_str(created_at):
+    if not created_at:
+        return "--"
+    if hasattr(created_at, "strftime"):
+        return created_at.strftime("%Y.%m.%d")
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", str(created_at))
+    return f"{m.group(1)}.{m.group(2)}.{m.group(3)}" if m else str(created_at)
+
+
+# ============ 绘制工具 ============
+
+def _s(v):
+    return int(round(v * SCALE))
+
+
+def _text_width(font, text):
+    return font.getlength(text)
+
+
+def _ellipsize(font, text, max_w):
+    if _text_width(font, text) <= max_w:
+        return text
+    while text and _text_width(font, text + "…") > max_w:
+        text = text[:-1]
+    return text + "…"
+
+
+def _wrap(font, text, max_w, max_lines):
+    """中文按字符折行（英文单词不拆分），超出行数以省略号结尾"""
+    tokens = re.findall(r"[A-Za-z0-9'\-]+|\s|.", text or "")
+    lines, cur = [], ""
+    for tok in tokens:
+        if tok == "\n":
+            lines.append(cur)
+            cur = ""
+            continue
+        if _text_width(font, cur + tok) <= max_w or not cur:
+            cur += tok
+        else:
+            lines.append(cur.rstrip())
+            cur = tok.lstrip()
+        if len(lines) >= max_lines:
+            break
+    if len(lines) < max_lines and cur:
+        lines.append(cur)
+    elif len(lines) >= max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = _ellipsize(font, lines[-1] + "…", max_w)
+    return lines
+
+
+def _center_text(draw, cx, y, text, font, fill):
+    draw.text((cx - _text_width(font, text) / 2, y), text, font=font, fill=fill)
+
+
+def _star(draw, cx, cy, r, fill):
+    pts = [(50, 0), (61, 35), (98, 35), (68, 57), (79, 91), (50, 70), (21, 91), (32, 57), (2, 35), (39, 35)]
+    d = r * 2 / 100
+    draw.polygon([(cx - r + x * d, cy - r + y * d) for x, y in pts], fill=fill)
+
+
+def _lucky_icon(draw, kind, cx, cy, r):
+    """幸运元素小图标（✧ ☽ ◈ 在多数中文字体里没有字形，直接画）"""
+    if kind == "number":
+        _star(draw, cx, cy, r, GOLD_LIGHT)
+    elif kind == "hour":
+        draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=GOLD_LIGHT)
+        draw.ellipse((cx - r + r * 0.7, cy - r - r * 0.2, cx + r + r * 0.7, cy + r - r * 0.2), fill=(58, 48, 78))
+    else:
+        draw.polygon([(cx, cy - r), (cx + r, cy), (cx, cy + r), (cx - r, cy)], outline=GOLD_LIGHT, width=max(1, r // 4))
+        draw.polygon([(cx, cy - r / 2), (cx + r / 2, cy), (cx, cy + r / 2), (cx - r / 2, cy)], fill=GOLD_LIGHT)
+
+
+def _panel(draw, box, radius=10):
+    draw.rounded_rectangle(tuple(_s(v) for v in box), _s(radius), fill=GLASS, outline=BORDER, width=_s(1))
+
+
+# ============ 主渲染 ============
+
+def render_share_card(share_data, fortune, share_url=""):
+    """
+    share_data：{user_name, reading, created_at}
+    fortune：flatten_fortune_for_share 之后的运势数据
+    share_url：卡片底部显示并编码进二维码的链接
+    返回 PNG bytes（800×1422）
+    """
+    reading = share_data.get("reading") or {}
+    fortune = fortune or {}
+    if not font_available():
+        raise RendererUnavailable("未找到中文字体，无法原生渲染分享图")
+
+    img = _background().copy()
+    draw = ImageDraw.Draw(img, "RGBA")  # RGB 底图 + RGBA 画笔，半透明色才会混合
+    cx = WIDTH / 2
+
+    # 顶部
+    y = 14
+    brand = "R U O S H U I   T A R O T"
+    _center_text(draw, _s(cx), _s(y), brand, _font(9), GOLD_LIGHT + (204,))
+    info = f"{_date_str(share_data.get('created_at'))} · {share_data.get('user_name') or '神秘访客'}"
+    _center_text(draw, _s(cx), _s(y + 16), info, _font(10), TEXT_MUTED)
+
+    # 牌面
+    y = 56
+    card_box = (PAD, y, PAD + 130, y + 195)
+    src = reading.get("image") or reading.get("card_image") or ""
+    card = _card_image(src, (_s(130), _s(195))) if src else None
+    if card is not None:
+        mask = Image.new("L", card.size, 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, card.width - 1, card.height - 1), _s(10), fill=255)
+        img.paste(card, (_s(card_box[0]), _s(card_box[1])), mask)
+    else:
+        _panel(draw, card_box)
+        _star(draw, _s(PAD + 65), _s(y + 97), _s(18), TEXT_MUTED)
+
+    # 牌名 / 正逆位
+    ix = PAD + 130 + 16
+    info_w = WIDTH - PAD - ix
+    name = reading.get("card_name") or reading.get("name") or "—"
+    direction = reading.get("direction") or reading.get("card_direction") or "—"
+    name_font = _font(20, "bold")
+    draw.text((_s(ix), _s(y + 40)), _ellipsize(name_font, name, _s(info_w)), font=name_font, fill=GOLD_LIGHT)
+    draw.ellipse((_s(ix), _s(y + 77), _s(ix + 4), _s(y + 81)), fill=GOLD)
+    draw.text((_s(ix + 9), _s(y + 71)), direction, font=_font(12), fill=TEXT_LIGHT)
+
+    # 总分环
+    score = fortune.get("overall_score") or fortune.get("overall") or 0
+    try:
+        score = int(float(score))
+    except (TypeError, ValueError):
+        score = 0
+    ry = y + 108
+    ring = (_s(ix), _s(ry), _s(ix + 42), _s(ry + 42))
+    draw.ellipse(ring, outline=GLASS_LIGHT, width=_s(3))
+    if score:
+        draw.arc(ring, -90, -90 + 360 * max(0, min(100, score)) / 100, fill=GOLD, width=_s(3))
+    score_font = _font(16, "bold")
+    score_text = str(score) if score else "—"
+    bbox = draw.textbbox((0, 0), score_text, font=score_font)
+    draw.text(
+        (_s(ix + 21) - (bbox[2] - bbox[0]) / 2 - bbox[0], _s(ry + 21) - (bbox[3] - bbox[1]) / 2 - bbox[1]),
+        score_text, font=score_font, fill=GOLD
+    )
+    draw.text((_s(ix + 52), _s(ry + 6)), "FORTUNE", font=_font(9), fill=TEXT_MUTED)
+    draw.text((_s(ix + 52), _s(ry + 20)), _label_score(score), font=_font(14), fill=GOLD_LIGHT)
+
+    # 五维度
+    y = 265
+    dims = _parse_dims(fortune)
+    items = [(short, dims.get(key, dims.get(short))) for key, short in DIM_CONFIG]
+    items = [(short, v) for short, v in items if v is not None]
+    if items:
+        col_w = (WIDTH - PAD * 2) / len(items)
+        for i, (short, value) in enumerate(items):
+            mx = PAD + col_w * i + col_w / 2
+            draw.ellipse((_s(mx - 15), _s(y), _s(mx + 15), _s(y + 30)), fill=GLASS_LIGHT, outline=BORDER, width=_s(1))
+            _center_text(draw, _s(mx), _s(y + 7), short[0], _font(12), GOLD_LIGHT)
+            _center_text(draw, _s(mx), _s(y + 34), short, _font(9), TEXT_MUTED)
+            full = int(value)
+            for k in range(5):
+                _star(draw, _s(mx - 20 + k * 9 + 3.5), _s(y + 54), _s(3.5), GOLD if k < full else GLASS_LIGHT)
+
+    # 今日运势解读
+    y = 335
+    msg_box = (PAD, y, WIDTH - PAD, y + 215)
+    _panel(draw, msg_box, 14)
+    _center_text(draw, _s(cx), _s(y + 12), "今 日 运 势 解 读", _font(10), TEXT_LIGHT)
+    summary = fortune.get("summary") or "今日运势温和清澈，顺势而行，心怀澄净，足以接住温柔好运。"
+    text_font = _font(12)
+    lines = _wrap(text_font, summary, _s(WIDTH - PAD * 2 - 32), 4)
+    ty = y + 32
+    for line in lines:
+        _center_text(draw, _s(cx), _s(ty), line, text_font, TEXT_LIGHT)
+        ty += 19
+
+    # 宜 / 忌
+    tip_top = y + 32 + 19 * 4 + 6
+    col_w = (WIDTH - PAD * 2 - 24 - 8) / 2
+    item_font = _font(11)
+    for i, (title, entries) in enumerate((("今日宜做", fortune.get("do")), ("今日忌做", fortune.get("dont")))):
+        x0 = PAD + 12 + i * (col_w + 8)
+        _panel(draw, (x0, tip_top, x0 + col_w, y + 215 - 12))
+        _center_text(draw, _s(x0 + col_w / 2), _s(tip_top + 8), title, _font(10), TEXT_MUTED)
+        entries = [str(t) for t in (entries or []) if t][:3] or ["—"]
+        ly = tip_top + 28
+        for entry in entries:
+            draw.ellipse((_s(x0 + 9), _s(ly + 5), _s(x0 + 13), _s(ly + 9)), fill=GOLD_LIGHT)
+            draw.text((_s(x0 + 20), _s(ly)), _ellipsize(item_font, entry, _s(col_w - 28)), font=item_font, fill=TEXT_LIGHT)
+            ly += 20
+
+    # 幸运元素
+    y = 562
+    lucky = fortune.get("lucky_elements") or {}
+    values = [
+        ("color", fortune.get("lucky_color") or lucky.get("color") or ""),
+        ("number", str(fortune.get("lucky_number") or lucky.get("number") or "")),
+        ("hour", fortune.get("lucky_hour") or lucky.get("hour") or ""),
+        ("direction", fortune.get("lucky_direction") or lucky.get("direction") or ""),
+    ]
+    col_w = (WIDTH - PAD * 2) / 4
+    for i, (icon, value) in enumerate(values):
+        mx = PAD + col_w * i + col_w / 2
+        circle = (_s(mx - 10), _s(y), _s(mx + 10), _s(y + 20))
+        if icon == "color":
+            hex_color = _color_hex(value)
+            draw.ellipse(circle, fill=_rgba(hex_color) if hex_color else GLASS_LIGHT, outline=BORDER, width=_s(1))
+        else:
+            draw.ellipse(circle, fill=GLASS_LIGHT, outline=BORDER, width=_s(1))
+            _lucky_icon(draw, icon, _s(mx), _s(y + 10), _s(5))
+        _center_text(draw, _s(mx), _s(y + 25), _ellipsize(_font(9), value or "—", _s(col_w - 6)), _font(9), TEXT_LIGHT)
+
+    # 底部：二维码 + 站点
+    y = 640
+    site = share_url or "www.ruoshui.fun"
+    draw.rounded_rectangle((_s(PAD), _s(y), _s(PAD + 35), _s(y + 35)), _s(6), fill=(255, 255, 255, 255))
+    qr = _qr_image(share_url, _s(29)) if share_url else None
+    if qr is not None:
+        img.paste(qr, (_s(PAD + 3), _s(y + 3)))
+    draw.text((_s(PAD + 45), _s(y + 6)), "若水占卜 · 每日指引", font=_font(9), fill=TEXT_LIGHT)
+    draw.text(
+        (_s(PAD + 45), _s(y + 20)),
+        _ellipsize(_font(8), re.sub(r"^https?://", "", site), _s(WIDTH - PAD * 2 - 45)),
+        font=_font(8), fill=TEXT_MUTED
+    )
+
+    # 输出不带透明通道的 RGB：编码数据量少四分之一，PNG 编码是单次渲染里最大的开销
+    out = Image.composite(img, _page_background(), _corner_mask())
+    buf = io.BytesIO()
+    out.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
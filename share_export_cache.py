@@ -0,0 +1,185 @@
+"""
+分享图导出缓存（内容寻址 PNG）
+同一份分享数据 + 同一版模板渲染出的图片完全一致，因此按二者的哈希缓存 PNG：
+- 键 = sha256(模板版本 + 渲染参数 + 卡片上实际渲染的字段)，同时作为强 ETag；
+  view_count / expires_at / share_id 等元数据不参与（浏览量批量写回后键不变，不会重复渲染）
+- 模板 share_card.html 内容变化时版本号随之变化，旧图片自然不再命中，由 LRU 淘汰
+- 存储在本地磁盘（默认 /tmp，Vercel 仅 /tmp 可写），总大小超限时按最近使用时间淘汰
+- 同一键的并发导出只渲染一次（single-flight），其余请求等待结果
+"""
+import os
+import json
+import hashlib
+import threading
+import tempfile
+
+SHARE_EXPORT_CACHE_DIR = os.getenv(
+    "SHARE_EXPORT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "ruoshui_share_export")
+)
+SHARE_EXPORT_CACHE_MAX_MB = int(os.getenv("SHARE_EXPORT_CACHE_MAX_MB", "200"))
+
+_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "share_card.html")
+
+_LOCK = threading.Lock()
+_INFLIGHT = {}        # key -> threading.Event
+_TOTAL_BYTES = None   # 首次写入时扫描目录得到
+_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _compute_template_version():
+    try:
+        with open(_TEMPLATE_PATH, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return "unknown"
+
+
+TEMPLATE_VERSION = _compute_template_version()
+
+
+# share_card.html / share_card_image 实际渲染的字段
+RENDERED_FIELDS = ("user_name", "reading", "fortune", "created_at")
+
+
+def cache_key(payload, variant=""):
+    """
+    payload：分享数据（user_name / reading / fortune / created_at ...），只取 RENDERED_FIELDS
+    variant：影响画面但不在数据中的参数（如卡片上显示的链接、渲染器）
+    """
+    data = {k: (payload or {}).get(k) for k in RENDERED_FIELDS}
+    raw = json.dumps(
+        {"v": TEMPLATE_VERSION, "variant": variant, "data": data},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _path(key):
+    return os.path.join(SHARE_EXPORT_CACHE_DIR, key[:2], f"{key}.png")
+
+
+def get(key):
+    """命中则返回 PNG bytes，并刷新 mtime 作为 LRU 时间"""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data
+
+
+def put(key, data):
+    """原子写入（临时文件 + rename），写入后按总大小淘汰"""
+    global _TOTAL_BYTES
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        existed = os.path.exists(path)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"分享图缓存写入失败: {e}")
+        return
+
+    with _LOCK:
+        if _TOTAL_BYTES is None:
+            _TOTAL_BYTES = _scan_total()
+        elif not existed:
+            _TOTAL_BYTES += len(data)
+        over = _TOTAL_BYTES > SHARE_EXPORT_CACHE_MAX_MB * 1024 * 1024
+    if over:
+        _evict()
+
+
+def _iter_files():
+    for root, _, files in os.walk(SHARE_EXPORT_CACHE_DIR):
+        for name in files:
+            if name.endswith(".png"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+
+def _scan_total():
+    return sum(size for _, size, _ in _iter_files())
+
+
+def _evict():
+    """按 mtime 从旧到新删除，直到总大小降到上限的 90%"""
+    global _TOTAL_BYTES
+    limit = SHARE_EXPORT_CACHE_MAX_MB * 1024 * 1024
+    files = sorted(_iter_files(), key=lambda x: x[2])
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for path, size, _ in files:
+        if total <= limit * 0.9:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    with _LOCK:
+        _TOTAL_BYTES = total
+        _STATS["evictions"] += removed
+
+
+def get_or_render(key, render):
+    """
+    命中缓存直接返回；否则调用 render() 生成并写入缓存
+    返回 (png_bytes, hit)
+    """
+    data = get(key)
+    if data is not None:
+        with _LOCK:
+            _STATS["hits"] += 1
+        return data, True
+
+    with _LOCK:
+        event = _INFLIGHT.get(key)
+        leader = event is None
+        if leader:
+            event = _INFLIGHT[key] = threading.Event()
+
+    if not leader:
+        # 其他请求正在渲染同一张图，等它写入缓存
+        event.wait()
+        data = get(key)
+        if data is not None:
+            with _LOCK:
+                _STATS["hits"] += 1
+            return data, True
+        # 领头请求失败：自己再渲染一次（不再排队等待）
+        return render(), False
+
+    try:
+        with _LOCK:
+            _STATS["misses"] += 1
+        data = render()
+        put(key, data)
+        return data, False
+    finally:
+        with _LOCK:
+            _INFLIGHT.pop(key, None)
+        event.set()
+
+
+def stats():
+    with _LOCK:
+        data = dict(_STATS)
+        data["total_bytes"] = _TOTAL_BYTES
+    data["template_version"] = TEMPLATE_VERSION
+    data["max_bytes"] = SHARE_EXPORT_CACHE_MAX_MB * 1024 * 1024
+    return data
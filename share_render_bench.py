@@ -0,0 +1,168 @@
+"""
+分享图导出 - 渲染器对比压测
+
+用固定的分享数据，分别通过两条路径导出同一张分享卡片，输出冷启动耗时与稳态 p50 / p95 / p99：
+  - pillow：share_card_image.render_share_card（无浏览器）
+  - playwright：share_renderer 渲染服务（本地起一个只渲染 share_card.html 的最小 Flask 服务）
+
+用法（不需要数据库；Playwright 未安装时只跑 pillow）：
+    python share_render_bench.py --iterations 50
+    python share_render_bench.py --iterations 50 --concurrency 4 --json
+    python share_render_bench.py --out /tmp/cards   # 保存两种渲染结果，便于肉眼对比版式
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Flask, render_template
+from werkzeug.serving import make_server
+
+import share_renderer
+from share_card_image import render_share_card
+
+FIXTURE = {
+    "user_name": "若水旅人",
+    "created_at": datetime(2025, 10, 1, 9, 30),
+    "reading": {
+        "card_name": "愚者",
+        "direction": "正位",
+        "image": "/static/images/tarot/00_fool.jpg",
+    },
+    "fortune": {
+        "overall_score": 82,
+        "dimensions_map": {"事业运": 4, "财富运": 3, "爱情运": 5, "健康运": 3, "贵人运": 4},
+        "dimensions": "事业运：4星（顺遂）\n财富运：3星（平稳）\n爱情运：5星（甜蜜）\n健康运：3星（平稳）\n贵人运：4星（得助）",
+        "summary": "今天适合迈出新的一步，保持好奇与轻盈，机会常在不经意间出现。",
+        "do": ["整理房间", "与老朋友联系", "记录灵感"],
+        "dont": ["冲动消费", "熬夜"],
+        "lucky_color": "蓝色",
+        "lucky_number": 7,
+        "lucky_hour": "巳时",
+        "lucky_direction": "东南",
+    },
+}
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _summary(cold, samples, wall):
+    return {
+        "cold_ms": round(cold * 1000, 1),
+        "p50_ms": round(_percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(_percentile(samples, 95) * 1000, 1),
+        "p99_ms": round(_percentile(samples, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(samples) * 1000, 1) if samples else 0.0,
+        "throughput_per_s": round(len(samples) / wall, 1) if wall else 0.0,
+    }
+
+
+def _run(render, iterations, concurrency):
+    """第一次调用计为冷启动，其余按并发度执行"""
+    started = time.perf_counter()
+    first = render()
+    cold = time.perf_counter() - started
+
+    def one(_):
+        t = time.perf_counter()
+        render()
+        return time.perf_counter() - t
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        samples = list(ex.map(one, range(iterations)))
+    wall = time.perf_counter() - started
+    return first, _summary(cold, samples, wall)
+
+
+def _start_card_server():
+    """只渲染 share_card.html 的最小 Flask 服务（与 /s/<id>?card=1&export=1 相同的模板参数）"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    app = Flask(__name__, template_folder=os.path.join(root, "templates"),
+                static_folder=os.path.join(root, "static"))
+
+    @app.route("/bench/card")
+    def bench_card():
+        return render_template("share_card.html", share_data=FIXTURE, is_viewer=True,
+                               embed=False, export_mode=True)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/bench/card"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分享图渲染器对比压测")
+    parser.add_argument("--iterations", type=int, default=30, help="每个渲染器的稳态渲染次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发导出数")
+    parser.add_argument("--skip-playwright", action="store_true", help="只测 Pillow 渲染")
+    parser.add_argument("--out", help="保存两种渲染结果的目录")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    share_url = "https://www.ruoshui.fun/s/bench0001"
+    report = {"iterations": args.iterations, "concurrency": args.concurrency}
+    outputs = {}
+
+    outputs["pillow"], report["pillow"] = _run(
+        lambda: render_share_card(FIXTURE, FIXTURE["fortune"], share_url),
+        args.iterations, args.concurrency
+    )
+
+    if args.skip_playwright:
+        report["playwright"] = None
+    elif not share_renderer.playwright_available():
+        report["playwright"] = {"error": "Playwright 未安装"}
+    else:
+        server, url = _start_card_server()
+        renderer = share_renderer.ShareCardRenderer(
+            queue_size=max(args.concurrency * 2, share_renderer.SHARE_RENDER_QUEUE_SIZE)
+        )
+        try:
+            outputs["playwright"], report["playwright"] = _run(
+                lambda: renderer.render(url), args.iterations, args.concurrency
+            )
+            report["playwright"]["renderer_stats"] = renderer.stats()
+        except Exception as e:
+            report["playwright"] = {"error": str(e)}
+        finally:
+            server.shutdown()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for name, png in outputs.items():
+            with open(os.path.join(args.out, f"share_card_{name}.png"), "wb") as f:
+                f.write(png)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"渲染次数 {args.iterations}，并发 {args.concurrency}")
+    print(f"{'渲染器':<12}{'冷启动':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'张/秒':>10}")
+    for name in ("pillow", "playwright"):
+        r = report.get(name)
+        if not r:
+            continue
+        if "error" in r:
+            print(f"{name:<12}{r['error']}")
+            continue
+        print(f"{name:<12}{r['cold_ms']:>8}ms{r['p50_ms']:>8}ms{r['p95_ms']:>8}ms"
+              f"{r['p99_ms']:>8}ms{r['throughput_per_s']:>10}")
+    if report.get("playwright") and "p50_ms" in report["playwright"]:
+        speedup = report["playwright"]["p50_ms"] / max(report["pillow"]["p50_ms"], 0.1)
+        print(f"Pillow p50 比 Playwright 快 {speedup:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
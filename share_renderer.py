@@ -0,0 +1,277 @@
+"""
+分享卡片渲染服务（Playwright）
+Playwright 同步 API 与创建它的线程绑定，不能在多个请求线程间共享同一个 browser / context：
+- 每个渲染线程独占自己的 playwright + browser + 预热页面，请求通过同一个有界队列分发
+- 队列满时立即拒绝（RendererBusy），由路由返回 503，避免请求无限堆积
+- 页面就绪以 window.__shareCardReady 为准（share_card.html 在渲染、字体、图片完成后置位），
+  不再等待 networkidle + 固定延时
+- 记录排队耗时 / 渲染耗时 / 失败与超时次数，供 /internal/share/render-metrics 查看
+"""
+import os
+import time
+import importlib.util
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+# Playwright 只在渲染线程里导入：应用启动时只检查是否安装，不付导入开销
+_PLAYWRIGHT_AVAILABLE = None
+
+
+def playwright_available():
+    global _PLAYWRIGHT_AVAILABLE
+    if _PLAYWRIGHT_AVAILABLE is None:
+        try:
+            _PLAYWRIGHT_AVAILABLE = importlib.util.find_spec("playwright") is not None
+        except (ImportError, ValueError):
+            _PLAYWRIGHT_AVAILABLE = False
+    return _PLAYWRIGHT_AVAILABLE
+
+# 渲染线程数（每个线程一个浏览器 + 一个预热页面）
+SHARE_RENDER_WORKERS = int(os.getenv("SHARE_RENDER_WORKERS", "2"))
+# 排队上限：超过后直接拒绝
+SHARE_RENDER_QUEUE_SIZE = int(os.getenv("SHARE_RENDER_QUEUE_SIZE", "8"))
+# 单次渲染总超时（秒），含排队
+SHARE_RENDER_TIMEOUT = float(os.getenv("SHARE_RENDER_TIMEOUT", "20"))
+# 等待页面就绪信号的超时（毫秒）
+SHARE_RENDER_READY_TIMEOUT_MS = int(os.getenv("SHARE_RENDER_READY_TIMEOUT_MS", "8000"))
+# 同一页面渲染多少次后重建，防止长期运行的页面内存增长
+SHARE_RENDER_PAGE_REUSE = int(os.getenv("SHARE_RENDER_PAGE_REUSE", "50"))
+
+_VIEWPORT = {"width": 420, "height": 760}  # 初始视口，稍后以元素裁剪为准
+
+# 与 share_card.html 中的就绪约定保持一致
+_READY_SCRIPT = "() => window.__shareCardReady === true"
+
+_NO_ANIMATION_CSS = "* { animation: none !important; transition: none !important; }"
+
+
+class RendererBusy(Exception):
+    """渲染队列已满"""
+
+
+class RendererUnavailable(Exception):
+    """Playwright 未安装或浏览器无法启动"""
+
+
+class _Metrics:
+    """渲染指标（最近 N 次的耗时分布 + 累计计数）"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.render_ms = deque(maxlen=window)
+        self.queue_ms = deque(maxlen=window)
+        self.counters = {
+            "rendered": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "ready_timeouts": 0,
+            "page_restarts": 0,
+        }
+
+    def incr(self, key, n=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, queue_ms, render_ms):
+        with self._lock:
+            self.queue_ms.append(queue_ms)
+            self.render_ms.append(render_ms)
+            self.counters["rendered"] += 1
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {"p50": None, "p95": None, "max": None}
+        data = sorted(values)
+
+        def pick(p):
+            return round(data[min(len(data) - 1, int(p * len(data)))], 1)
+
+        return {"p50": pick(0.50), "p95": pick(0.95), "max": round(data[-1], 1)}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "render_ms": self._percentiles(self.render_ms),
+                "queue_ms": self._percentiles(self.queue_ms),
+            }
+
+
+class _Job:
+    __slots__ = ("url", "selector", "future", "enqueued_at")
+
+    def __init__(self, url, selector):
+        self.url = url
+        self.selector = selector
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class ShareCardRenderer:
+    """
+    有界队列 + 专用渲染线程
+    线程在首次提交时懒启动；浏览器启动失败时该线程退出，后续请求会重新拉起
+    """
+
+    def __init__(self, workers=SHARE_RENDER_WORKERS, queue_size=SHARE_RENDER_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._lock = threading.Lock()
+        self.metrics = _Metrics()
+
+    # ---------- 对外接口 ----------
+
+    def render(self, url, selector="#shareCard", timeout=SHARE_RENDER_TIMEOUT):
+        """提交渲染并等待结果，返回 PNG bytes"""
+        if not playwright_available():
+            raise RendererUnavailable("Playwright 未安装，请 pip install playwright 并 playwright install chromium")
+
+        self._ensure_workers()
+        job = _Job(url, selector)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.metrics.incr("rejected")
+            raise RendererBusy("分享图生成繁忙，请稍后重试")
+
+        try:
+            return job.future.result(timeout=timeout)
+        except FutureTimeout:
+            # 渲染线程取到任务时会跳过已取消的任务
+            job.future.cancel()
+            self.metrics.incr("timeouts")
+            raise
+
+    def stats(self):
+        data = self.metrics.snapshot()
+        data.update({
+            "workers": sum(1 for t in self._threads if t.is_alive()),
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+        })
+        return data
+
+    # ---------- 渲染线程 ----------
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(
+                    target=self._worker,
+                    name=f"share-render-{len(self._threads)}",
+                    daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        try:
+            from playwright.sync_api import sync_playwright
+            pw = sync_playwright().start()
+        except Exception as e:
+            print(f"分享卡片渲染线程启动失败: {e}")
+            self._fail_pending(RendererUnavailable(str(e)))
+            return
+
+        browser = context = page = None
+        uses = 0
+        try:
+            browser = pw.chromium.launch(headless=True, args=["--no-sandbox", "--disable-gpu"])
+            context = browser.new_context(
+                device_scale_factor=2,  # 高清出图
+                viewport=_VIEWPORT,
+                java_script_enabled=True,
+            )
+            while True:
+                job = self._queue.get()
+                if not job.future.set_running_or_notify_cancel():
+                    continue  # 调用方已超时放弃
+
+                queue_ms = (time.perf_counter() - job.enqueued_at) * 1000
+                started = time.perf_counter()
+                try:
+                    if page is None or page.is_closed() or uses >= SHARE_RENDER_PAGE_REUSE:
+                        if page is not None and not page.is_closed():
+                            page.close()
+                            self.metrics.incr("page_restarts")
+                        page = context.new_page()
+                        uses = 0
+                    png = self._render_on_page(page, job.url, job.selector)
+                    uses += 1
+                except Exception as e:
+                    self.metrics.incr("failed")
+                    job.future.set_exception(e)
+                    # 页面状态未知，下次重建
+                    try:
+                        if page is not None:
+                            page.close()
+                    except Exception:
+                        pass
+                    page = None
+                    if not browser.is_connected():
+                        raise
+                    continue
+
+                self.metrics.observe(queue_ms, (time.perf_counter() - started) * 1000)
+                job.future.set_result(png)
+        except Exception as e:
+            print(f"分享卡片渲染线程异常退出: {e}")
+            if context is None:
+                self._fail_pending(RendererUnavailable(str(e)))
+        finally:
+            for closer in (context, browser):
+                try:
+                    if closer is not None:
+                        closer.close()
+                except Exception:
+                    pass
+            try:
+                pw.stop()
+            except Exception:
+                pass
+
+    def _render_on_page(self, page, url, selector):
+        # DOM 就绪即可返回，外部字体 / 图片由就绪信号统一等待
+        page.goto(url, wait_until="domcontentloaded", timeout=int(SHARE_RENDER_TIMEOUT * 1000))
+        page.add_style_tag(content=_NO_ANIMATION_CSS)
+        try:
+            page.wait_for_function(_READY_SCRIPT, timeout=SHARE_RENDER_READY_TIMEOUT_MS)
+        except Exception:
+            # 非分享卡片页面（如被重定向到登录页）不会发出信号，按当前状态截图
+            self.metrics.incr("ready_timeouts")
+            print(f"分享卡片未发出就绪信号，按当前状态截图: {url}")
+
+        el = page.query_selector(selector)
+        if not el:
+            # 兜底整页截图
+            return page.screenshot(type="png", full_page=True)
+        return el.screenshot(type="png")
+
+    def _fail_pending(self, exc):
+        """浏览器起不来时，让已排队的请求立即失败而不是等到超时"""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(exc)
+
+
+_RENDERER = None
+_RENDERER_LOCK = threading.Lock()
+
+
+def get_renderer():
+    global _RENDERER
+    if _RENDERER is None:
+        with _RENDERER_LOCK:
+            if _RENDERER is None:
+                _RENDERER = ShareCardRenderer()
+    return _RENDERER
@@ -0,0 +1,308 @@
+"""
+牌阵推荐索引（进程内）
+SpreadService.suggest_spreads / resolve_spreads_from_llm 原来每次请求要查 3 次库
+（初筛候选、30 天人气 COUNT、近期用过），再在 Python 循环里逐个打分。这里把牌阵目录常驻内存：
+- 目录：每 SPREAD_INDEX_TTL 秒从 spreads 表重载一次，预先算好归一化主题、深度档位、难度序
+- 人气：每 SPREAD_POPULARITY_TTL 秒刷新一次；先把最近两天的 spread_readings 汇总进
+  spread_popularity_daily（按天的汇总表），再对汇总表求 30 天合计，不再对明细表做 COUNT
+- 打分：对候选一次性按列计算，结果与逐个计算相同。线上目录只有几十个牌阵，逐个计算反而更快，
+  所以只有目录达到 SPREAD_INDEX_NUMPY_MIN 个时才按需导入 NumPy 向量化（实测约 80 个时两者持平）；
+  默认情况下生产走的就是逐个计算路径，也不为导入 NumPy 增加冷启动耗时
+- 相似度：目录加载时对「名称 + 描述」建字符 n-gram TF-IDF 索引（text_similarity），问题与牌阵的
+  余弦相似度作为 sim 分量，不需要 pg_trgm 往返或 LLM
+推荐请求只剩一个按用户的小查询（近期用过的牌阵）。
+"""
+import time
+import threading
+
+from config import Config
+from text_similarity import NgramIndex
+
+np = None  # 按需导入，见 _load_numpy()
+
+# 问题关键词 → 牌阵名称 / 描述关键词 → 加权（与原 _special_rule_boost 相同，按顺序累加，最多 RULE_CAP）
+RULE_GROUPS = (
+    # 是/否
+    (('是否', '能不能', '要不要', '可不可以', 'yes or no', 'yes/no'), ('是否', 'yes', 'no'), 1.0),
+    # 时间/时机
+    (('什么时候', '多久', '何时', '时机', '时间', '未来几', '近三月', '时间线'), ('时间', '时机', '流向', '时间线'), 0.8),
+    # 选择题
+    (('还是', '两者', '二选一', '抉择', '选择题'), ('选择', '抉择', '二选一'), 0.8),
+    # 关系/全景
+    (('他对我', '关系', '现状', '阻碍', '全貌', '全景', '综合'), ('凯尔特', '十字', '马掌', '关系', '全景'), 0.6),
+)
+RULE_CAP = 1.2
+
+DIFFICULTY_ORDER = {'简单': 1, '普通': 2, '进阶': 3}
+
+
+def norm(s):
+    return (s or '').strip().lower()
+
+
+def depth_bucket(card_count):
+    return 1 if card_count <= 3 else 2 if card_count <= 6 else 3
+
+
+def difficulty_rank(s, default=2):
+    return DIFFICULTY_ORDER.get(s, default)
+
+
+def rule_weights(question):
+    """问题命中的规则组 → 每组的加权（未命中为 0）"""
+    q = (question or '').lower()
+    return [w if any(k in q for k in q_keys) else 0.0 for q_keys, _, w in RULE_GROUPS]
+
+
+def rule_mask(name, desc):
+    """牌阵名称 + 描述命中的规则组"""
+    text = f"{name} {desc}".lower()
+    return [any(k in text for k in t_keys) for _, t_keys, _ in RULE_GROUPS]
+
+
+def _load_numpy():
+    """导入 NumPy；未安装时返回 False（退回逐个计算）"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except Exception:
+            return False
+        np = numpy
+    return True
+
+
+def rule_boost(mask, weights):
+    boost = 0.0
+    for hit, w in zip(mask, weights):
+        if hit and w:
+            boost += w
+    return min(boost, RULE_CAP)
+
+
+class SpreadIndex:
+    """一份牌阵目录的只读快照：按 (card_count, name) 排序，与 suggest_candidates 的 ORDER BY 一致"""
+
+    def __init__(self, spreads):
+        rows = sorted(spreads, key=lambda s: (int(s.get('card_count') or 0), s.get('name') or ''))
+        self.rows = rows
+        self.ids = [r['id'] for r in rows]
+        self.pos = {str(sid): i for i, sid in enumerate(self.ids)}
+        self.category = [r.get('category') or '' for r in rows]
+        self.category_norm = [norm(c) for c in self.category]
+        self.card_count = [int(r.get('card_count') or 0) for r in rows]
+        self.depth = [depth_bucket(c) for c in self.card_count]
+        # suggest_candidates 的 CASE：未知难度按 2；打分时 _difficulty_rank 同样按 2
+        self.diff_rank = [difficulty_rank(r.get('difficulty')) for r in rows]
+        self.rule_mask = [rule_mask(r.get('name') or '', r.get('description') or '') for r in rows]
+        self.text = NgramIndex([f"{r.get('name') or ''} {r.get('description') or ''}" for r in rows])
+        self.popularity = [0] * len(rows)
+        self.loaded_at = time.monotonic()
+        self.popularity_at = 0.0
+        # 目录够大才向量化，见模块说明
+        self.vectorized = len(rows) >= Config.SPREAD_INDEX_NUMPY_MIN and _load_numpy()
+        if self.vectorized:
+            self._np = {
+                "category": np.array(self.category, dtype=object),
+                "category_norm": np.array(self.category_norm, dtype=object),
+                "card_count": np.array(self.card_count, dtype=np.int64),
+                "depth": np.array(self.depth, dtype=np.int64),
+                "diff_rank": np.array(self.diff_rank, dtype=np.int64),
+                "rule_mask": np.array(self.rule_mask, dtype=bool).reshape(len(rows), len(RULE_GROUPS)),
+                "popularity": np.zeros(len(rows), dtype=np.float64),
+            }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def set_popularity(self, counts):
+        """counts：{spread_id: 30 天使用次数}"""
+        self.popularity = [int(counts.get(str(sid), 0)) for sid in self.ids]
+        if self.vectorized:
+            self._np["popularity"] = np.array(self.popularity, dtype=np.float64)
+        self.popularity_at = time.monotonic()
+
+    # ---------- 初筛（等价于 SpreadDAO.suggest_candidates） ----------
+
+    def candidates(self, topic=None, min_cards=None, max_cards=None, max_difficulty=None):
+        """返回候选在目录中的下标（保持目录顺序）"""
+        max_rank = difficulty_rank(max_difficulty, default=3) if max_difficulty else None
+        if self.vectorized:
+            a = self._np
+            keep = np.ones(len(self.rows), dtype=bool)
+            if topic:
+                keep &= (a["category"] == topic) | (a["category"] == '通用')
+            if min_cards is not None:
+                keep &= a["card_count"] >= int(min_cards)
+            if max_cards is not None:
+                keep &= a["card_count"] <= int(max_cards)
+            if max_rank is not None:
+                keep &= a["diff_rank"] <= max_rank
+            return np.flatnonzero(keep)
+        return [
+            i for i in range(len(self.rows))
+            if (not topic or self.category[i] in (topic, '通用'))
+            and (min_cards is None or self.card_count[i] >= int(min_cards))
+            and (max_cards is None or self.card_count[i] <= int(max_cards))
+            and (max_rank is None or self.diff_rank[i] <= max_rank)
+        ]
+
+    def ids_at(self, idx):
+        return [self.ids[i] for i in idx]
+
+    def similarity(self, question, idx):
+        """问题与候选牌阵（名称 + 描述）的字符 n-gram 余弦相似度，与 idx 对齐"""
+        return self.text.scores_for(question, idx)
+
+    # ---------- 打分 ----------
+
+    def score_suggest(self, idx, topic, depth_target, difficulty, question, recent_ids=(), weights=None, sim=None):
+        """
+        suggest_spreads 的打分：
+        score = topic*主题 + depth*深度 + diff*难度 + rule*规则 + sim*相似度 + pop*人气 - repeat*近期用过
+        sim：与 idx 对齐的相似度（可选）
+        """
+        w = weights
+        user_rank = difficulty_rank(difficulty or '简单')
+        topic_n = norm(topic)
+        qw = rule_weights(question)
+        recent = {str(r) for r in (recent_ids or ())}
+
+        if self.vectorized:
+            a = self._np
+            idx = np.asarray(idx, dtype=np.int64)
+            cat = a["category_norm"][idx]
+            topic_fit = np.where(cat == topic_n, 1.0, np.where(cat == '通用', 0.6, 0.2))
+            depth_fit = _fit_bucket_np(a["depth"][idx], depth_target)
+            diff_fit = _fit_bucket_np(a["diff_rank"][idx], user_rank)
+            rule = _rule_boost_np(a["rule_mask"][idx], qw)
+            pop = a["popularity"][idx]
+            max_pop = pop.max() if len(pop) else 0.0
+            pop = pop / max_pop if max_pop else np.zeros(len(idx))
+            rep = np.array([1.0 if str(self.ids[i]) in recent else 0.0 for i in idx])
+            s = np.zeros(len(idx)) if sim is None else np.asarray(sim, dtype=np.float64)
+            return (w['topic'] * topic_fit + w['depth'] * depth_fit + w['diff'] * diff_fit +
+                    w['rule'] * rule + w['sim'] * s + w['pop'] * pop - w['repeat'] * rep).tolist()
+
+        max_pop = max((self.popularity[i] for i in idx), default=0)
+        scores = []
+        for k, i in enumerate(idx):
+            cat = self.category_norm[i]
+            topic_fit = 1.0 if cat == topic_n else (0.6 if cat == '通用' else 0.2)
+            depth_fit = _fit_bucket(self.depth[i], depth_target)
+            diff_fit = _fit_bucket(self.diff_rank[i], user_rank)
+            rule = rule_boost(self.rule_mask[i], qw)
+            p = (self.popularity[i] / max_pop) if max_pop else 0.0
+            rep = 1.0 if str(self.ids[i]) in recent else 0.0
+            s = 0.0 if sim is None else sim[k]
+            scores.append(w['topic'] * topic_fit + w['depth'] * depth_fit + w['diff'] * diff_fit +
+                          w['rule'] * rule + w['sim'] * s + w['pop'] * p - w['repeat'] * rep)
+        return scores
+
+    def base_llm(self, idx, topic, depth_target, difficulty, question):
+        """
+        resolve_spreads_from_llm 中与 LLM 推荐无关的部分：返回 (topic_fit, depth_fit, diff_fit, rule)，各为列表
+        """
+        user_rank = difficulty_rank(difficulty or '简单')
+        qw = rule_weights(question)
+        if self.vectorized:
+            a = self._np
+            idx = np.asarray(idx, dtype=np.int64)
+            cat = a["category"][idx]
+            if topic:
+                topic_fit = np.where(cat == topic, 1.0, np.where(cat == '通用', 0.6, 0.2))
+            else:
+                topic_fit = np.where(cat == '通用', 0.6, 0.8)
+            depth_fit = _fit_bucket_np(a["depth"][idx], depth_target)
+            gap = a["diff_rank"][idx] - user_rank
+            diff_fit = np.where(gap >= 2, 0.0, np.where(gap == 1, 0.5, 1.0))
+            rule = _rule_boost_np(a["rule_mask"][idx], qw)
+            return topic_fit.tolist(), depth_fit.tolist(), diff_fit.tolist(), rule.tolist()
+
+        topic_fit, depth_fit, diff_fit, rule = [], [], [], []
+        for i in idx:
+            cat = self.category[i]
+            topic_fit.append(1.0 if (topic and cat == topic) else (0.6 if cat == '通用' else (0.2 if topic else 0.8)))
+            depth_fit.append(_fit_bucket(self.depth[i], depth_target))
+            gap = self.diff_rank[i] - user_rank
+            diff_fit.append(0.0 if gap >= 2 else 0.5 if gap == 1 else 1.0)
+            rule.append(rule_boost(self.rule_mask[i], qw))
+        return topic_fit, depth_fit, diff_fit, rule
+
+
+def _fit_bucket(val, target):
+    # 完全命中1，邻近0.6，其他0.2
+    return 1.0 if val == target else 0.6 if abs(val - target) == 1 else 0.2
+
+
+def _fit_bucket_np(vals, target):
+    d = np.abs(vals - target)
+    return np.where(d == 0, 1.0, np.where(d == 1, 0.6, 0.2))
+
+
+def _rule_boost_np(mask, weights):
+    boost = np.zeros(mask.shape[0])
+    for g, w in enumerate(weights):
+        if w:
+            boost = boost + np.where(mask[:, g], w, 0.0)
+    return np.minimum(boost, RULE_CAP)
+
+
+# ---------- 进程内单例 ----------
+
+_LOCK = threading.Lock()
+_INDEX = None
+
+
+def get_index():
+    """返回当前索引；目录 / 人气过期时在锁内刷新（刷新失败沿用旧数据）"""
+    global _INDEX
+    now = time.monotonic()
+    index = _INDEX
+    if index is not None and now - index.loaded_at < Config.SPREAD_INDEX_TTL \
+            and now - index.popularity_at < Config.SPREAD_POPULARITY_TTL:
+        return index
+
+    with _LOCK:
+        index = _INDEX
+        now = time.monotonic()
+        if index is None or now - index.loaded_at >= Config.SPREAD_INDEX_TTL:
+            try:
+                index = _build()
+            except Exception as e:
+                if index is None:
+                    raise
+                print(f"[spread_index] reload failed, keeping previous catalog: {e}")
+                index.loaded_at = now
+        if now - index.popularity_at >= Config.SPREAD_POPULARITY_TTL:
+            _refresh_popularity(index)
+        _INDEX = index
+        return index
+
+
+def _build():
+    from database import SpreadDAO
+    return SpreadIndex(SpreadDAO.get_all_spreads())
+
+
+def _refresh_popularity(index):
+    """汇总表不可用（未迁移）时退回对明细表 COUNT，失败则沿用旧值"""
+    from database import SpreadDAO
+    try:
+        try:
+            SpreadDAO.rollup_popularity(days=2)
+            counts = SpreadDAO.get_popularity_rollup(days=30)
+        except Exception as e:
+            print(f"[spread_index] popularity rollup unavailable, counting spread_readings: {e}")
+            counts = SpreadDAO.get_popularity(index.ids, days=30)
+        index.set_popularity({str(k): v for k, v in counts.items()})
+    except Exception as e:
+        print(f"[spread_index] popularity refresh failed: {e}")
+        index.popularity_at = time.monotonic()
+
+
+def invalidate():
+    """牌阵目录有变更时调用：下次请求重载"""
+    global _INDEX
+    with _LOCK:
+        _INDEX = None
@@ -0,0 +1,109 @@
+"""
+牌阵相似度索引压测（text_similarity.NgramIndex）
+
+用合成的牌阵目录（名称 + 描述由常见塔罗词汇随机拼成）测：
+  - 建索引耗时（目录加载时发生一次）
+  - 单次问题查询耗时分布（p50 / p99，微秒）
+  - 对全部候选取相似度（SpreadIndex.similarity 的路径）耗时
+不需要数据库。--check 时 p99 超过预算退出码为 1：
+    python spread_similarity_bench.py
+    python spread_similarity_bench.py --spreads 5000 --queries 2000 --json
+    python spread_similarity_bench.py --check --budget-us 1000
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from text_similarity import NgramIndex
+
+VOCAB = [
+    "凯尔特十字", "时间之流", "二选一", "是否", "关系", "现状", "阻碍", "全景", "马掌", "每日指引",
+    "爱情", "复合", "事业", "工作", "财运", "健康", "学业", "自我成长", "过去现在未来", "潜意识",
+    "建议", "结果", "对方的想法", "内心", "外部环境", "希望与恐惧", "灵魂", "抉择", "时机", "流向",
+]
+QUESTIONS = [
+    "我们还有可能复合吗", "下个月适合换工作吗", "选A公司还是B公司", "他对我是什么想法",
+    "今年财运怎么样", "最近总是焦虑，该怎么调整", "这段关系的阻碍是什么", "什么时候能遇到对的人",
+    "考研能不能上岸", "要不要接受这个offer", "想看看整体运势的全景", "我该如何做出抉择",
+]
+
+
+def synth_catalog(n, seed=7):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        name = "".join(rng.sample(VOCAB, 2)) + f"牌阵{i}"
+        desc = "，".join(rng.sample(VOCAB, rng.randint(3, 6))) + "。"
+        docs.append(f"{name} {desc}")
+    return docs
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(spreads, queries, candidates):
+    docs = synth_catalog(spreads)
+    t0 = time.perf_counter()
+    index = NgramIndex(docs)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    rng = random.Random(11)
+    qs = [rng.choice(QUESTIONS) for _ in range(queries)]
+    query_us, scores_us = [], []
+    cand = sorted(rng.sample(range(spreads), min(candidates, spreads)))
+    for q in qs:
+        t = time.perf_counter()
+        index.query(q)
+        query_us.append((time.perf_counter() - t) * 1e6)
+        t = time.perf_counter()
+        index.scores_for(q, cand)
+        scores_us.append((time.perf_counter() - t) * 1e6)
+
+    return {
+        "spreads": spreads,
+        "queries": queries,
+        "candidates": len(cand),
+        "grams": len(index.idf),
+        "build_ms": round(build_ms, 1),
+        "query_us": {"p50": round(statistics.median(query_us), 1), "p99": round(_pct(query_us, 0.99), 1),
+                     "mean": round(statistics.mean(query_us), 1)},
+        "scores_for_us": {"p50": round(statistics.median(scores_us), 1), "p99": round(_pct(scores_us, 0.99), 1)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="牌阵字符 n-gram 相似度索引压测")
+    parser.add_argument("--spreads", type=int, default=3000, help="合成牌阵数")
+    parser.add_argument("--queries", type=int, default=1000, help="查询次数")
+    parser.add_argument("--candidates", type=int, default=40, help="每次取相似度的候选数")
+    parser.add_argument("--budget-us", type=float, default=1000.0, help="scores_for p99 预算（微秒）")
+    parser.add_argument("--check", action="store_true", help="p99 超出预算时退出码为 1")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    report = run(args.spreads, args.queries, args.candidates)
+    report["budget_us"] = args.budget_us
+    report["ok"] = report["scores_for_us"]["p99"] <= args.budget_us
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"{report['spreads']} 个牌阵，{report['grams']} 个 n-gram，建索引 {report['build_ms']} ms")
+        q = report["query_us"]
+        print(f"查询：p50 {q['p50']} µs  p99 {q['p99']} µs  mean {q['mean']} µs（{report['queries']} 次）")
+        s = report["scores_for_us"]
+        print(f"取 {report['candidates']} 个候选的相似度：p50 {s['p50']} µs  p99 {s['p99']} µs")
+        if not report["ok"]:
+            print(f"[FAIL] p99 {s['p99']} µs 超出预算 {args.budget_us} µs")
+
+    if args.check and not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+静态资源指纹与预压缩（运行时部分）
+build_static.py 生成 static/asset-manifest.json 后：
+- url_for('static', filename='CSS/all.min.css') 输出带内容哈希的地址 /static/CSS/all.min.<hash>.css
+- 带哈希的地址按 immutable 长缓存；有 .br / .gz 预压缩文件且客户端支持时直接发送压缩版本
+- /sw.js 的 CACHE_NAME 与预缓存列表按清单生成，资源变化即换缓存名
+清单不存在（未执行构建）时保持 Flask 默认行为
+"""
+import os
+import re
+import json
+import mimetypes
+import threading
+
+from flask import request, send_from_directory, make_response, abort
+
+MANIFEST_NAME = "asset-manifest.json"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Service Worker 安装时预缓存的资源（其余静态资源仍按需缓存；TTF 只给不支持 WOFF2 的浏览器，不预缓存）
+SW_PRECACHE_PREFIXES = ("CSS/", "webfonts/", "icons/", "manifest.webmanifest")
+SW_PRECACHE_SKIP = (".ttf",)
+
+_HASHED_RE = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[^./]+)$")
+
+_LOCK = threading.Lock()
+_STATE = {"static_folder": None, "manifest": None}
+
+
+def hashed_name(path, digest):
+    """CSS/all.min.css + 哈希 → CSS/all.min.<hash>.css"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _load_manifest(static_folder):
+    """读取清单；大小与磁盘不一致的条目（构建后被改动过）直接丢弃，回退为不带哈希的地址"""
+    path = os.path.join(static_folder, MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"version": None, "files": {}, "reverse": {}}
+
+    files = {}
+    for name, entry in (data.get("files") or {}).items():
+        try:
+            if os.path.getsize(os.path.join(static_folder, name)) != entry.get("size"):
+                continue
+        except OSError:
+            continue
+        files[name] = entry
+    if len(files) != len(data.get("files") or {}):
+        print(f"[static_assets] {len(data.get('files') or {}) - len(files)} 个文件与清单不一致，请重新执行 build_static.py")
+    return {
+        "version": data.get("version"),
+        "files": files,
+        "reverse": {entry["hashed"]: name for name, entry in files.items()},
+    }
+
+
+def get_manifest():
+    manifest = _STATE["manifest"]
+    if manifest is None:
+        with _LOCK:
+            if _STATE["manifest"] is None:
+                _STATE["manifest"] = _load_manifest(_STATE["static_folder"])
+            manifest = _STATE["manifest"]
+    return manifest
+
+
+def _accepts(encoding):
+    return encoding in (request.headers.get("Accept-Encoding") or "").lower()
+
+
+def serve_static(filename):
+    """替换 Flask 默认的 static 视图"""
+    manifest = get_manifest()
+    folder = _STATE["static_folder"]
+
+    original = manifest["reverse"].get(filename)
+    immutable = original is not None
+    if original is None:
+        # 旧版本页面引用的过期哈希：按原文件名提供，但不给长缓存
+        m = _HASHED_RE.match(filename)
+        if m and f"{m.group('stem')}{m.group('ext')}" in manifest["files"]:
+            original = f"{m.group('stem')}{m.group('ext')}"
+        else:
+            original = filename
+
+    entry = manifest["files"].get(original) if immutable else None
+    mimetype = mimetypes.guess_type(original)[0] or "application/octet-stream"
+
+    encoding = None
+    if entry:
+        if entry.get("br") and _accepts("br"):
+            encoding = "br"
+        elif entry.get("gzip") and _accepts("gzip"):
+            encoding = "gzip"
+
+    max_age = IMMUTABLE_MAX_AGE if immutable else None  # None：沿用 SEND_FILE_MAX_AGE_DEFAULT
+    if encoding:
+        suffix = ".br" if encoding == "br" else ".gz"
+        resp = send_from_directory(folder, original + suffix, mimetype=mimetype, max_age=max_age)
+        resp.headers["Content-Encoding"] = encoding
+    else:
+        resp = send_from_directory(folder, original, mimetype=mimetype, max_age=max_age)
+
+    if entry and (entry.get("gzip") or entry.get("br")):
+        resp.vary.add("Accept-Encoding")
+    if immutable:
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+    return resp
+
+
+def _url_defaults(endpoint, values):
+    """url_for('static', filename=...) → 带哈希的文件名"""
+    if endpoint != "static" or "filename" not in values:
+        return
+    entry = get_manifest()["files"].get(values["filename"])
+    if entry:
+        values["filename"] = entry["hashed"]
+
+
+def render_service_worker(sw_path, static_url_path="/static"):
+    """按清单改写 sw.js 的 CACHE_NAME 与 PRECACHE_URLS"""
+    try:
+        with open(sw_path, "r", encoding="utf-8") as f:
+            source = f.read()
+    except OSError:
+        abort(404)
+
+    manifest = get_manifest()
+    if manifest["version"]:
+        urls = sorted(
+            f"{static_url_path}/{entry['hashed']}"
+            for name, entry in manifest["files"].items()
+            if name.startswith(SW_PRECACHE_PREFIXES) and not name.endswith(SW_PRECACHE_SKIP)
+        )
+        source = re.sub(
+            r"const CACHE_NAME = '[^']*';",
+            f"const CACHE_NAME = 'ruoshui-static-{manifest['version']}';",
+            source, count=1
+        )
+        source = re.sub(
+            r"const PRECACHE_URLS = \[[^\]]*\];",
+            "const PRECACHE_URLS = " + json.dumps(urls, indent=2) + ";",
+            source, count=1
+        )
+
+    resp = make_response(source)
+    resp.mimetype = "application/javascript"
+    # Service Worker 脚本本身必须每次校验，才能及时拿到新的缓存名
+    resp.cache_control.no_cache = True
+    resp.headers["Service-Worker-Allowed"] = "/"
+    return resp
+
+
+def init_app(app):
+    """接管 static 视图与 url_for，并注册 /sw.js"""
+    _STATE["static_folder"] = app.static_folder
+    _STATE["manifest"] = None
+    app.view_functions["static"] = serve_static
+    app.url_defaults(_url_defaults)
+
+    sw_path = os.path.join(app.root_path, "sw.js")
+    app.add_url_rule(
+        "/sw.js", "service_worker",
+        lambda: render_service_worker(sw_path, app.static_url_path)
+    )
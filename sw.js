@@ -1,5 +1,7 @@
 // sw.js — 轻量缓存静态资源，离线兜底页面可按需扩展
+// 由 /sw.js 路由按 static/asset-manifest.json 改写下面两行（见 static_assets.py），资源变化即换缓存名
 const CACHE_NAME = 'ruoshui-static-v1';
+const PRECACHE_URLS = [];
 const STATIC_PATTERNS = [
   '/static/CSS/bootstrap.min.css',
   '/static/CSS/all.min.css',
@@ -10,7 +12,10 @@ const STATIC_PATTERNS = [
 
 self.addEventListener('install', (event) => {
   self.skipWaiting();
-  event.waitUntil(caches.open(CACHE_NAME));
+  // 预缓存带哈希的地址：内容不变，可以一直用缓存
+  event.waitUntil(
+    caches.open(CACHE_NAME).then(cache => cache.addAll(PRECACHE_URLS).catch(() => null))
+  );
 });
 
 self.addEventListener('activate', (event) => {
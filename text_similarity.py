@@ -0,0 +1,82 @@
+"""
+字符 n-gram TF-IDF 相似度索引（进程内，适合中文短文本）
+中文没有空格分词，按字符二元 / 三元组切片即可覆盖「凯尔特十字」「二选一」这类词，无需分词器：
+- 文本先小写，按非文字字符（空白、标点）切段，n-gram 不跨段
+- 文档向量：次线性 TF（1 + ln tf）× 平滑 IDF（ln((N + 1) / (df + 1)) + 1），L2 归一化
+- 倒排表：gram -> [(文档下标, 权重)]；全目录查询只遍历查询里出现的 gram
+- 只对少量候选取相似度时（推荐打分的场景）直接与候选的文档向量做点积，耗时只与候选数有关
+- 查询向量使用同一份 IDF，目录里没出现过的 gram 直接忽略；返回余弦相似度（0~1）
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+NGRAM_SIZES = (2, 3)
+
+_SPLIT_RE = re.compile(r"[^\w]+|_+")
+
+
+def ngrams(text, sizes=NGRAM_SIZES):
+    grams = []
+    for seg in _SPLIT_RE.split((text or "").lower()):
+        if not seg:
+            continue
+        for n in sizes:
+            if len(seg) < n:
+                continue
+            grams.extend(seg[i:i + n] for i in range(len(seg) - n + 1))
+        if len(seg) < min(sizes):
+            # 单字段（如「爱」）也保留，避免短文本完全没有特征
+            grams.append(seg)
+    return grams
+
+
+def _weights(counts, idf):
+    vec = {}
+    for g, tf in counts.items():
+        w = idf.get(g)
+        if w:
+            vec[g] = (1.0 + math.log(tf)) * w
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if not norm:
+        return {}
+    return {g: v / norm for g, v in vec.items()}
+
+
+class NgramIndex:
+    def __init__(self, docs, sizes=NGRAM_SIZES):
+        self.sizes = sizes
+        counts = [Counter(ngrams(d, sizes)) for d in docs]
+        n = len(docs)
+        df = Counter()
+        for c in counts:
+            df.update(c.keys())
+        self.idf = {g: math.log((n + 1) / (d + 1)) + 1.0 for g, d in df.items()}
+        self.vectors = [_weights(c, self.idf) for c in counts]
+        postings = defaultdict(list)
+        for i, vec in enumerate(self.vectors):
+            for g, w in vec.items():
+                postings[g].append((i, w))
+        self.postings = dict(postings)
+        self.size = n
+
+    def query(self, text):
+        """返回 {文档下标: 余弦相似度}，只包含有公共 gram 的文档"""
+        qvec = _weights(Counter(ngrams(text, self.sizes)), self.idf)
+        scores = defaultdict(float)
+        for g, qw in qvec.items():
+            for i, w in self.postings[g]:
+                scores[i] += qw * w
+        return scores
+
+    def scores_for(self, text, idx):
+        """与 idx 对齐的相似度列表（逐个候选点积，不走倒排表）"""
+        qvec = _weights(Counter(ngrams(text, self.sizes)), self.idf) if text else {}
+        if not qvec:
+            return [0.0] * len(idx)
+        items = list(qvec.items())
+        out = []
+        for i in idx:
+            vec = self.vectors[int(i)]
+            out.append(min(1.0, sum(qw * vec.get(g, 0.0) for g, qw in items)))
+        return out